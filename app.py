@@ -19,6 +19,7 @@ if __name__ == '__main__':
     # Create the Flask application instance
     app = create_app()
     
-    # Run the application
-    print("Starting Flask application...")
-    app.run(debug=True)
\ No newline at end of file
+    # Run the development server (debug/reloader only when FLASK_DEBUG is set).
+    # For production use gunicorn: gunicorn -c gunicorn.conf.py wsgi:app
+    print("Starting Flask development server...")
+    app.run(debug=os.environ.get('FLASK_DEBUG', '').lower() in ('1', 'true', 'yes'))
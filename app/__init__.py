@@ -1,14 +1,13 @@
 import os
-import google.generativeai as genai
-from flask import (Flask, render_template, request, redirect, flash, jsonify, Response, current_app)
-from supabase import create_client, Client, PostgrestAPIError
-from flask_limiter import Limiter
-from flask_limiter.util import get_remote_address
+import tempfile
+import click
+from flask import (Flask, render_template, request, redirect, flash, jsonify, Response, current_app, url_for)
+from supabase import Client, PostgrestAPIError
 from dotenv import load_dotenv
+from .ratelimits import limiter
 
-# Initialize supabase and limiter at the top level
+# Initialize supabase at the top level (the limiter lives in app/ratelimits.py)
 supabase: Client = None
-limiter: Limiter = None
 
 # --- STATIC DATA & CONFIGURATION ---
 PROGRAM_OUTCOMES = [
@@ -36,7 +35,7 @@ ALLOWED_EXTENSIONS = {'docx', 'pdf'}
 
 def create_app():
     
-    global supabase, limiter
+    global supabase
     
     app = Flask(__name__)
 
@@ -52,27 +51,64 @@ def create_app():
     app.config['SUPABASE_KEY'] = os.environ.get('SUPABASE_KEY')
     # Inside create_app():
     app.config['ONLYOFFICE_JWT_SECRET'] = os.environ.get('ONLYOFFICE_JWT_SECRET', "")
+
+    # Uploads (app/uploads.py). Requests over MAX_CONTENT_LENGTH get a 413 before the body
+    # is read; files are spooled to UPLOAD_SPOOL_DIR and streamed to storage from disk.
+    # Resumable uploads keep their part files there too, so all workers must share it.
+    app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_UPLOAD_MB', 50)) * 1024 * 1024
+    app.config['UPLOAD_SPOOL_DIR'] = os.environ.get('UPLOAD_SPOOL_DIR', os.path.join(tempfile.gettempdir(), 'aipclpms-uploads'))
+    # Chunk size the browser uploader sends per PATCH, and how long an abandoned upload is kept
+    app.config['RESUMABLE_CHUNK_SIZE'] = int(os.environ.get('RESUMABLE_CHUNK_MB', 4)) * 1024 * 1024
+    app.config['RESUMABLE_UPLOAD_TTL'] = int(os.environ.get('RESUMABLE_UPLOAD_TTL_HOURS', 24))
     
     # Check for missing environment variables at startup.
     if not all([app.config['SECRET_KEY'], app.config['GEMINI_API_KEY'], app.config['SUPABASE_URL'], app.config['SUPABASE_KEY']]):
         raise ValueError("FATAL ERROR: One or more required environment variables are not set. "
                          "Please set FLASK_SECRET_KEY, GEMINI_API_KEY, SUPABASE_URL, and SUPABASE_KEY.")
     
-    # Configure Gemini AI
-    genai.configure(api_key=app.config['GEMINI_API_KEY'])
+    # Gemini is imported and configured on first use (utils.get_generative_model)
     
-    # Supabase Client Initialization
-    supabase = create_client(app.config['SUPABASE_URL'], app.config['SUPABASE_KEY'])  # anon key
-    supabase_service = create_client(app.config['SUPABASE_URL'], os.environ['SUPABASE_SERVICE_KEY'])  # service key
-    app.config['SUPABASE_SERVICE'] = supabase_service
+    # Supabase Client Initialization. `supabase` is a per-request handle onto a pool of
+    # anon-key clients (each wrapped so every query/storage call is timed per request);
+    # a client is never shared by two threads at once.
+    from .instrumentation import init_instrumentation
+    from .clients import BoundClient, init_client_pools
+    app.config['SUPABASE_SERVICE_KEY'] = os.environ.get('SUPABASE_SERVICE_KEY')
+    app.config['SUPABASE_POOL_SIZE'] = int(os.environ.get('SUPABASE_POOL_SIZE', 8))
+    init_client_pools(app)
+    supabase = BoundClient('anon')
+
+    # Offline verification of the Supabase access token kept in the session (app/session_tokens.py).
+    # Asymmetric tokens are checked against the project's JWKS; legacy HS256 ones against
+    # SUPABASE_JWT_SECRET, or once per token with the auth server if it isn't set.
+    app.config['SUPABASE_JWT_VERIFY'] = os.environ.get('SUPABASE_JWT_VERIFY', '1') == '1'
+    app.config['SUPABASE_JWT_SECRET'] = os.environ.get('SUPABASE_JWT_SECRET', '')
+    app.config['SUPABASE_JWKS_URL'] = os.environ.get(
+        'SUPABASE_JWKS_URL', app.config['SUPABASE_URL'].rstrip('/') + '/auth/v1/.well-known/jwks.json')
+    app.config['SUPABASE_JWKS_CACHE_TTL'] = int(os.environ.get('SUPABASE_JWKS_CACHE_TTL', 3600))
+    app.config['SUPABASE_JWT_AUDIENCE'] = 'authenticated'
+    app.config['SUPABASE_JWT_LEEWAY'] = 30
+    # Refresh once the token has less than this many seconds left
+    app.config['SUPABASE_REFRESH_MARGIN'] = int(os.environ.get('SUPABASE_REFRESH_MARGIN', 300))
+    app.config['SUPABASE_REFRESH_TIMEOUT'] = 10
     
-    # Rate Limiter Configuration
-    limiter = Limiter(
-        get_remote_address,
-        app=app,
-        default_limits=["200 per day", "50 per hour"],
-        storage_uri="memory://",
-    )
+    # Rate Limiter Configuration. Use a shared store (e.g. redis://localhost:6379/0, or any
+    # Redis-compatible server) when running more than one worker, so limits hold across them.
+    app.config['RATELIMIT_STORAGE_URI'] = os.environ.get('RATELIMIT_STORAGE_URI', 'memory://')
+    app.config['RATELIMIT_KEY_PREFIX'] = 'aipclpms'
+    # Where a spent refresh token's successor is kept so no two requests or workers spend it twice
+    # (app/session_tokens.py); Redis when shared, like the rate limits
+    app.config['SUPABASE_REFRESH_STORE_URI'] = os.environ.get('SUPABASE_REFRESH_STORE_URI', app.config['RATELIMIT_STORAGE_URI'])
+    # If the shared store is unreachable, fall back to per-process limits rather than erroring
+    app.config['RATELIMIT_IN_MEMORY_FALLBACK_ENABLED'] = True
+    app.config['RATELIMIT_SWALLOW_ERRORS'] = True
+    app.config['RATELIMIT_HEADERS_ENABLED'] = True
+    # Limit classes, see app/ratelimits.py
+    app.config['RATELIMIT_DEFAULT'] = os.environ.get('RATELIMIT_DEFAULT', '2000 per hour;120 per minute')
+    app.config['RATELIMIT_AUTH'] = os.environ.get('RATELIMIT_AUTH', '10 per minute;50 per hour')
+    app.config['RATELIMIT_AI'] = os.environ.get('RATELIMIT_AI', '10 per hour')
+    app.config['RATELIMIT_EXPENSIVE'] = os.environ.get('RATELIMIT_EXPENSIVE', '300 per hour')
+    limiter.init_app(app)
     
     # Pass static data to the Jinja templates
     app.config['PROGRAM_OUTCOMES'] = PROGRAM_OUTCOMES
@@ -82,6 +118,46 @@ def create_app():
     app.config['STORAGE_BUCKET_NAME'] = STORAGE_BUCKET_NAME
     app.config['ALLOWED_EXTENSIONS'] = ALLOWED_EXTENSIONS
 
+    # Notification fan-out batching (seconds to collect rows before one bulk insert)
+    app.config['NOTIFICATION_BATCH_WINDOW'] = float(os.environ.get('NOTIFICATION_BATCH_WINDOW', 0.25))
+    from .notifier import dispatcher
+    dispatcher.batch_window = app.config['NOTIFICATION_BATCH_WINDOW']
+    app.config['NOTIFICATIONS_PAGE_SIZE'] = int(os.environ.get('NOTIFICATIONS_PAGE_SIZE', 25))
+    app.config['CLP_PAGE_SIZE'] = int(os.environ.get('CLP_PAGE_SIZE', 25))
+    # Store plan content in course_learning_plan_contents (migrations/002) instead of the wide row
+    app.config['CLP_CONTENT_SIDE_TABLE'] = os.environ.get('CLP_CONTENT_SIDE_TABLE', '').lower() in ('1', 'true', 'yes')
+    app.config['PROFILE_CACHE_TTL'] = int(os.environ.get('PROFILE_CACHE_TTL', 60))
+    app.config['TEMPLATE_CACHE_TTL'] = int(os.environ.get('TEMPLATE_CACHE_TTL', 600))
+    # Departments and the template-per-department mapping (app/refdata.py)
+    app.config['REFDATA_CACHE_TTL'] = int(os.environ.get('REFDATA_CACHE_TTL', 300))
+    # Accreditation ZIP exports (app/exports.py): parallel storage downloads per export, and a size cap
+    app.config['EXPORT_CONCURRENCY'] = int(os.environ.get('EXPORT_CONCURRENCY', 8))
+    app.config['EXPORT_MAX_PLANS'] = int(os.environ.get('EXPORT_MAX_PLANS', 2000))
+    # Outcome coverage analytics (app/analytics.py); dropped on every approval
+    app.config['ANALYTICS_CACHE_TTL'] = int(os.environ.get('ANALYTICS_CACHE_TTL', 600))
+    # Response format of the PO-IO and CO-PO generation steps (app/matrix_encoding.py):
+    # 'verbose' = one JSON property per cell, 'compact' = one string per outcome row.
+    # Compare with scripts/bench_matrix_encoding.py.
+    app.config['AI_MATRIX_ENCODING'] = os.environ.get('AI_MATRIX_ENCODING', 'verbose').lower()
+    if app.config['AI_MATRIX_ENCODING'] not in ('verbose', 'compact'):
+        raise ValueError("AI_MATRIX_ENCODING must be 'verbose' or 'compact'.")
+    # Parallel renders/uploads when re-rendering AI drafts into a changed template (app/rerender.py)
+    app.config['RERENDER_CONCURRENCY'] = int(os.environ.get('RERENDER_CONCURRENCY', 4))
+    # Near-duplicate detection (app/similarity.py): minimum estimated similarity shown to deans, and how many
+    app.config['SIMILARITY_THRESHOLD'] = float(os.environ.get('SIMILARITY_THRESHOLD', 0.5))
+    app.config['SIMILAR_PLANS_LIMIT'] = int(os.environ.get('SIMILAR_PLANS_LIMIT', 5))
+    # Dean landing page aggregate (migrations/004); dropped on every plan status change
+    app.config['DEAN_SUMMARY_TTL'] = float(os.environ.get('DEAN_SUMMARY_TTL', 5))
+    app.config['DEAN_SUMMARY_PENDING_LIMIT'] = int(os.environ.get('DEAN_SUMMARY_PENDING_LIMIT', 10))
+    from .refdata import department_names_for_display
+    app.jinja_env.globals['department_names'] = department_names_for_display
+    # Warn when one request runs the same query shape more than this many times
+    app.config['QUERY_REPEAT_WARN_THRESHOLD'] = int(os.environ.get('QUERY_REPEAT_WARN_THRESHOLD', 5))
+    init_instrumentation(app)
+    # Opt-in async views (dashboards and CLP lists) on the async Supabase client, and
+    # concurrent Gemini calls during generation. Needs asgiref (Flask's async extra).
+    app.config['ASYNC_MODE'] = os.environ.get('ASYNC_MODE', '').lower() in ('1', 'true', 'yes')
+
     # --- Register Blueprints ---
     from .blueprints.auth import auth_bp
     from .blueprints.main import main_bp
@@ -94,6 +170,89 @@ def create_app():
     app.register_blueprint(admin_bp, url_prefix='/admin')
     app.register_blueprint(dean_bp, url_prefix='/dean')
     app.register_blueprint(teacher_bp, url_prefix='/teacher')
+    if app.config['ASYNC_MODE']:
+        from .aio import install_async_views
+        install_async_views(app)
+
+    # --- CLI Commands ---
+    @app.cli.command('notifications-retention')
+    @click.option('--days', default=30, show_default=True, help='Collapse read notifications older than this.')
+    @click.option('--archive', is_flag=True, help='Copy originals to notifications_archive before deleting.')
+    @click.option('--dry-run', is_flag=True, help='Only report what would be collapsed.')
+    def notifications_retention(days, archive, dry_run):
+        """Collapse old read notifications into daily digests."""
+        from .notifier import collapse_read_notifications
+        collapsed, digests = collapse_read_notifications(days, archive=archive, dry_run=dry_run)
+        click.echo(f"{'Would collapse' if dry_run else 'Collapsed'} {collapsed} notifications into {digests} digests.")
+
+    @app.cli.command('warmup')
+    @click.option('--no-connections', is_flag=True, help='Skip opening pooled Supabase connections.')
+    def warmup(no_connections):
+        """Precompile templates, open pooled connections and cache DOCX templates."""
+        from .warmup import warm_up
+        for step, seconds in warm_up(app, connections=not no_connections).items():
+            click.echo(f"{step}: {seconds * 1000:.0f} ms")
+
+    @app.cli.command('storage-gc')
+    @click.option('--grace-hours', default=24, show_default=True, help='Keep unreferenced objects modified more recently than this.')
+    @click.option('--dry-run', is_flag=True, help='Only list what would be removed.')
+    def storage_gc(grace_hours, dry_run):
+        """Remove storage objects no plan or template points at."""
+        from .storage_cleanup import collect_orphaned_files
+        orphaned, failed = collect_orphaned_files(grace_hours, dry_run=dry_run)
+        for path in orphaned:
+            click.echo(path)
+        click.echo(f"{'Would remove' if dry_run else 'Removed'} {len(orphaned) - len(failed)} orphaned objects"
+                   + (f" ({len(failed)} failed)." if failed else "."))
+
+    @app.cli.command('rebuild-aggregates')
+    @click.option('--skip-backfill', is_flag=True, help='Do not compute missing outcome summaries first.')
+    def rebuild_aggregates(skip_backfill):
+        """Recompute the per-department curriculum aggregates from the plans table."""
+        from .curriculum_aggregates import rebuild_curriculum_aggregates
+        backfilled, departments = rebuild_curriculum_aggregates(backfill=not skip_backfill)
+        click.echo(f"Stored {backfilled} outcome summaries; rebuilt {departments} department rows.")
+
+    @app.cli.command('rerender-plans')
+    @click.argument('template_key')
+    @click.option('--dry-run', is_flag=True, help='Only list the plans that would be re-rendered.')
+    @click.option('--workers', type=int, default=None, help='Parallel renders (default RERENDER_CONCURRENCY).')
+    def rerender_plans_command(template_key, dry_run, workers):
+        """Re-render editable AI plans on TEMPLATE_KEY from their stored content (no AI calls)."""
+        from .rerender import rerender_plans
+
+        def progress(stats):
+            click.echo(f"{stats['done'] + stats['skipped'] + stats['failed']}/{stats['total']} processed")
+
+        stats = rerender_plans(template_key, dry_run=dry_run, progress=progress, workers=workers)
+        for plan in stats['plans']:
+            click.echo(f"{plan['id']}\t{plan['department']}\t{plan['subject']}")
+        for error in stats['errors']:
+            click.echo(f"CLP {error['id']}: {error['error']}", err=True)
+        for plan in stats['incomplete']:
+            click.echo(f"CLP {plan['id']}: content lacks {plan['missing']} template fields "
+                       f"({', '.join(plan['keys'])}); they are left blank", err=True)
+        click.echo(f"{'Would re-render' if dry_run else 'Re-rendered'} {stats['done']} plans; "
+                   f"{stats['skipped']} skipped, {stats['failed']} failed.")
+
+    @app.cli.command('scan-templates')
+    def scan_templates():
+        """Rebuild the placeholder manifest of every DOCX template."""
+        from .placeholders import rescan_all_templates
+        scanned, failed = rescan_all_templates()
+        click.echo(f"Scanned {scanned} templates; {failed} could not be read.")
+
+    @app.cli.command('reindex-similarity')
+    def reindex_similarity():
+        """Recompute the MinHash signatures and LSH buckets for every CLP."""
+        from .similarity import reindex_all_similarity
+        click.echo(f"Indexed {reindex_all_similarity()} plans.")
+
+    @app.cli.command('reindex-search')
+    def reindex_search():
+        """Rebuild the full-text search text for every CLP."""
+        from .search import reindex_all_plans
+        click.echo(f"Indexed {reindex_all_plans()} plans.")
 
     # --- CONSOLIDATED SECURITY HEADERS & CSP ---
     @app.after_request
@@ -174,8 +333,19 @@ def create_app():
         app.logger.error(f"Internal Server Error: {e}")
         return render_template('500.html'), 500
 
+    @app.errorhandler(413)
+    def request_too_large(e):
+        limit_mb = app.config['MAX_CONTENT_LENGTH'] // (1024 * 1024)
+        if request.accept_mimetypes.best == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'error': 'too_large', 'message': f"Uploads are limited to {limit_mb} MB."}), 413
+        flash(f"That file is too large. Uploads are limited to {limit_mb} MB.", "danger")
+        return redirect(request.referrer or url_for('main.dashboard'))
+
     @app.errorhandler(429)
     def ratelimit_handler(e):
+        # fetch()/XHR callers (e.g. the generation poll) get JSON instead of a redirect loop
+        if request.accept_mimetypes.best == 'application/json' or request.headers.get('X-Requested-With') == 'XMLHttpRequest':
+            return jsonify({'error': 'rate_limited', 'message': f"Rate limit exceeded ({e.description})."}), 429
         flash("You have exceeded the rate limit. Please try again later.", "warning")
         return redirect(request.referrer or url_for('main.dashboard'))
 
@@ -0,0 +1,46 @@
+# app/aio.py
+
+from contextlib import asynccontextmanager
+
+from flask import current_app
+
+from app.instrumentation import InstrumentedClient
+
+# endpoint -> async view, installed over the sync view when ASYNC_MODE is on
+_async_views = {}
+
+
+def async_view(endpoint):
+    """
+    Registers an async variant of an existing endpoint. Apply it outermost, above
+    login_required/roles_required, so the registered view is the decorated one.
+    """
+    def register(f):
+        _async_views[endpoint] = f
+        return f
+    return register
+
+
+def install_async_views(app):
+    for endpoint, view in _async_views.items():
+        app.view_functions[endpoint] = view
+
+
+@asynccontextmanager
+async def async_supabase():
+    """
+    An anon-key AsyncClient for one async view. Its HTTP connections belong to this
+    request's event loop, so it is closed on exit instead of being pooled.
+    """
+    from supabase import acreate_client
+    client = await acreate_client(current_app.config['SUPABASE_URL'], current_app.config['SUPABASE_KEY'])
+    try:
+        yield InstrumentedClient(client)
+    finally:
+        if client._postgrest is not None:
+            await client._postgrest.aclose()
+
+
+async def unread_notifications_count(client, user_id):
+    res = await client.table('notifications').select('id', count='exact').eq('user_id', user_id).eq('is_read', False).execute()
+    return res.count
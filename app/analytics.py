@@ -0,0 +1,195 @@
+# app/analytics.py
+
+import json
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+# Outcome coverage across approved plans. Each AI-generated plan's content JSON carries
+# the PO x IO matrix (`IT01_T` ... "✔"/" ") and the CO x PO matrix (`L012_IT01` ...
+# "E"/"I"/" "). They are loaded for a whole department into stacked arrays, and every
+# statistic below is a reduction over the plan axis, not a loop over plans.
+
+# CO x PO cell levels
+LEVEL_NONE, LEVEL_INTRODUCED, LEVEL_ENABLED = 0, 1, 2
+CHECK = '✔'
+
+DEFAULT_TTL = 600
+
+# department -> (expires_at, generation, version, coverage). Approvals bump the local
+# generation. Other workers see the change through the version: the newest updated_at
+# in curriculum_aggregates, which the table trigger (migrations/005) moves on every
+# status change, insert and delete. ANALYTICS_CACHE_TTL is only the upper bound.
+_cache = {}
+_generation = 0
+_lock = threading.Lock()
+
+
+def _ttl():
+    return current_app.config.get('ANALYTICS_CACHE_TTL', DEFAULT_TTL) if has_app_context() else DEFAULT_TTL
+
+
+def _outcome_codes():
+    from app import COURSE_OUTCOMES, INSTITUTIONAL_OUTCOMES_HEADERS, PROGRAM_OUTCOMES_HEADERS
+    return [co['code'] for co in COURSE_OUTCOMES], PROGRAM_OUTCOMES_HEADERS, INSTITUTIONAL_OUTCOMES_HEADERS
+
+
+def _parse_content(content):
+    if isinstance(content, dict):
+        return content
+    try:
+        data = json.loads(content or '')
+    except (TypeError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def build_matrices(contents):
+    """
+    Stacks the matrices of every plan that has any of their cells.
+    Returns (po_io, co_po) with shapes (plans, PO, IO) bool and (plans, CO, PO) uint8,
+    the indexes (into `contents`) of the plans that were used, and two masks of the same
+    shapes marking the cells each plan has at all. Plans generated for a template that
+    uses part of a matrix (app/placeholders.py) lack the rest; those cells were never
+    asked for, so they are neither ticks nor gaps.
+    """
+    import numpy as np
+    co_codes, po_codes, io_codes = _outcome_codes()
+    po_io_keys = [f"{po}_{io}" for po in po_codes for io in io_codes]
+    co_po_keys = [f"{co}_{po}" for co in co_codes for po in po_codes]
+
+    used, po_io_cells, co_po_cells, po_io_asked, co_po_asked = [], [], [], [], []
+    for index, content in enumerate(contents):
+        data = _parse_content(content)
+        # Manually written and uploaded plans carry no matrices
+        if not data or not any(key in data for key in po_io_keys + co_po_keys):
+            continue
+        used.append(index)
+        po_io_cells.append([data.get(key, '') for key in po_io_keys])
+        co_po_cells.append([data.get(key, '') for key in co_po_keys])
+        po_io_asked.append([key in data for key in po_io_keys])
+        co_po_asked.append([key in data for key in co_po_keys])
+
+    po_io_shape, co_po_shape = (len(used), len(po_codes), len(io_codes)), (len(used), len(co_codes), len(po_codes))
+    if not used:
+        return (np.zeros(po_io_shape, dtype=bool), np.zeros(co_po_shape, dtype=np.uint8), used,
+                np.zeros(po_io_shape, dtype=bool), np.zeros(co_po_shape, dtype=bool))
+
+    # One vectorized comparison per matrix instead of per-cell Python work
+    po_io = (np.char.strip(np.array(po_io_cells, dtype=str)) == CHECK)
+    co_po_raw = np.char.strip(np.array(co_po_cells, dtype=str))
+    co_po = np.where(co_po_raw == 'E', LEVEL_ENABLED,
+                     np.where(co_po_raw == 'I', LEVEL_INTRODUCED, LEVEL_NONE)).astype(np.uint8)
+    return (po_io.reshape(po_io_shape), co_po.reshape(co_po_shape), used,
+            np.array(po_io_asked, dtype=bool).reshape(po_io_shape),
+            np.array(co_po_asked, dtype=bool).reshape(co_po_shape))
+
+
+def compute_coverage(plans, contents):
+    """
+    Coverage statistics for `plans` (list rows) given their content blobs (same order).
+    Plain lists/dicts in the result, so it caches and renders without NumPy types.
+    """
+    import numpy as np
+    co_codes, po_codes, io_codes = _outcome_codes()
+    po_io, co_po, used, po_io_asked, co_po_asked = build_matrices(contents)
+    courses = [plans[i] for i in used]
+
+    # Per course, the strongest level each PO reaches over all its COs: (plans, PO)
+    course_po_level = co_po.max(axis=1) if len(used) else np.zeros((0, len(po_codes)), dtype=np.uint8)
+    enabled_counts = (course_po_level == LEVEL_ENABLED).sum(axis=0)
+    introduced_counts = (course_po_level == LEVEL_INTRODUCED).sum(axis=0)
+    po_io_counts = po_io.sum(axis=0)
+    io_counts = po_io.any(axis=1).sum(axis=0)
+    # Outcomes at least one course's template asked about; the others can't be gaps
+    po_asked = co_po_asked.any(axis=(0, 1))
+    io_asked = po_io_asked.any(axis=(0, 1))
+
+    return {
+        'plans_total': len(plans),
+        'plans_analysed': len(used),
+        'program_outcomes': list(po_codes),
+        'institutional_outcomes': list(io_codes),
+        'course_outcomes': list(co_codes),
+        # PO x IO: how many courses tick each cell
+        'po_io_counts': po_io_counts.tolist(),
+        # Per PO, how many courses enable / only introduce it (CO x PO matrices)
+        'po_enabled_counts': enabled_counts.tolist(),
+        'po_introduced_counts': introduced_counts.tolist(),
+        # Outcomes no approved course enables or ticks
+        'po_gaps': [po for po, n, asked in zip(po_codes, enabled_counts, po_asked) if n == 0 and asked],
+        'io_gaps': [io for io, n, asked in zip(io_codes, io_counts, io_asked) if n == 0 and asked],
+        # Heatmap rows: one per course, PO levels 0/1/2
+        'heatmap': [{'id': course['id'], 'subject': course.get('subject'), 'levels': levels}
+                    for course, levels in zip(courses, course_po_level.tolist())],
+    }
+
+
+def outcome_summary(content):
+    """
+    One plan's contribution to the curriculum aggregates (migrations/005), stored on the
+    plan at approval: {"po_enabled": {"IT01": 1}, "po_introduced": {...}, "io": {"T": 1}}.
+    None for plans without outcome matrices.
+    """
+    _, po_codes, io_codes = _outcome_codes()
+    po_io, co_po, used, _, _ = build_matrices([content])
+    if not used:
+        return None
+    po_level = co_po[0].max(axis=0)
+    return {
+        'po_enabled': {po: 1 for po, level in zip(po_codes, po_level) if level == LEVEL_ENABLED},
+        'po_introduced': {po: 1 for po, level in zip(po_codes, po_level) if level == LEVEL_INTRODUCED},
+        'io': {io: 1 for io, ticked in zip(io_codes, po_io[0].any(axis=0)) if ticked},
+    }
+
+
+def _load_coverage(department):
+    from app import supabase
+    from app.plan_content import load_plan_contents
+    query = supabase.table('course_learning_plans').select('id, subject, department').eq('status', 'approved')
+    if department:
+        query = query.eq('department', department)
+    plans = query.order('subject').execute().data
+    contents = load_plan_contents([plan['id'] for plan in plans])
+    return compute_coverage(plans, [contents.get(plan['id']) for plan in plans])
+
+
+def _plans_version(department):
+    """Newest curriculum_aggregates.updated_at for the department (None: all); one indexed row."""
+    from app import supabase
+    query = supabase.table('curriculum_aggregates').select('updated_at')
+    if department:
+        query = query.eq('department', department)
+    try:
+        res = query.order('updated_at', desc=True).limit(1).execute()
+    except Exception as e:
+        # Without the version only the TTL expires the entry
+        current_app.logger.warning(f"Could not read the curriculum aggregates version: {e}")
+        return None
+    return res.data[0]['updated_at'] if res.data else ''
+
+
+def get_coverage(department=None):
+    """Coverage for the approved plans of one department (None: all), cached until the next approval."""
+    key = department or ''
+    version = _plans_version(department)
+    with _lock:
+        entry = _cache.get(key)
+        generation = _generation
+    if (entry and entry[0] > time.monotonic() and entry[1] == generation
+            and (version is None or entry[2] == version)):
+        return entry[3]
+    coverage = _load_coverage(department)
+    with _lock:
+        if generation == _generation:
+            _cache[key] = (time.monotonic() + _ttl(), generation, version, coverage)
+    return coverage
+
+
+def invalidate_coverage():
+    """Call when the set of approved plans changes (approval, deletion of an approved plan)."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _cache.clear()
@@ -1,23 +1,32 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, jsonify, Response
+from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, current_app, jsonify, Response, session
 from supabase import PostgrestAPIError
 from app import supabase
 from app.decorators import login_required, roles_required, admin_required
 from werkzeug.utils import secure_filename
 import re
-from docx import Document
+import asyncio
 import io, os, uuid
 from io import BytesIO
-from docx.shared import Pt, RGBColor, Inches
-from docx.enum.text import WD_ALIGN_PARAGRAPH
 import html
-from supabase import Client, create_client
 import platform
-import requests
 from datetime import datetime
-import jwt
 import time
 from app.forms import ApproveUserForm, TemplateEditForm, EditUserForm, DepartmentForm, TemplateUploadForm, SystemSettingsForm
 from app.utils import parse_supabase_timestamp # Add this to imports
+from app.pagination import paginate_plans, paginate_plans_async, plan_filters_from_request
+from app.aio import async_supabase, async_view
+from app.plan_content import CLP_LIST_COLUMNS
+from app.profiles import invalidate_user_profile
+from app.doc_templates import invalidate_template_bytes
+from app.refdata import invalidate_departments, invalidate_templates
+from app.dean_summary import invalidate_dean_summary
+from app.storage_cleanup import bulk_delete_plans
+from app.analytics import invalidate_coverage
+from app.uploads import spooled, upload_to_storage
+from app.ratelimits import COST_DOWNLOAD, COST_EXPORT, COST_UPLOAD, exempt, expensive
+from app.exports import ExportTooLarge, export_filename, export_response, export_rows
+from app.rerender import get_rerender_job, start_rerender_job
+from app.placeholders import manifest_or_none, store_template_manifest
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -34,6 +43,7 @@ def generate_jwt_token(payload):
     if not ONLYOFFICE_JWT_SECRET:
         return None
     
+    import jwt
     try:
         token = jwt.encode(payload, ONLYOFFICE_JWT_SECRET, algorithm='HS256')
         return token
@@ -42,6 +52,7 @@ def generate_jwt_token(payload):
         return None
 
 @admin_bp.route('/serve_document/<doc_key>')
+@exempt
 def serve_document(doc_key):
     """Serve the document to ONLYOFFICE (acts as a proxy)
     
@@ -239,6 +250,7 @@ def edit_template(template_id):
 
 
 @admin_bp.route('/onlyoffice_callback/<int:template_id>', methods=['POST'])
+@exempt
 def onlyoffice_callback(template_id):
     """Handle ONLYOFFICE save callback for a SPECIFIC template."""
     try:
@@ -260,6 +272,7 @@ def onlyoffice_callback(template_id):
             storage_path = res.data['filename']
 
             # 2. Download new file from ONLYOFFICE
+            import requests  # deferred: only the ONLYOFFICE callbacks need it
             file_resp = requests.get(download_url, timeout=30)
             file_resp.raise_for_status()
             file_data = file_resp.content
@@ -270,6 +283,12 @@ def onlyoffice_callback(template_id):
                 file=file_data,
                 file_options={"content-type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "upsert": "true"}
             )
+            invalidate_template_bytes(storage_path)
+            # The edit may have added or removed placeholders; the saved file matters more
+            try:
+                store_template_manifest(template_id, file_data, storage_path)
+            except Exception as e:
+                current_app.logger.warning(f"Could not store the placeholder manifest of template {template_id}: {e}")
             
             current_app.logger.info(f"✅ Template {template_id} updated successfully.")
             return jsonify({"error": 0})
@@ -281,6 +300,7 @@ def onlyoffice_callback(template_id):
         current_app.logger.error(f"Callback error: {e}")
         return jsonify({"error": 1})
 @admin_bp.route('/download_template')
+@expensive(COST_DOWNLOAD)
 @login_required
 @admin_required
 def download_template():
@@ -303,6 +323,7 @@ def download_template():
 
 
 @admin_bp.route('/upload_template', methods=['POST'])
+@expensive(COST_UPLOAD)
 @login_required
 @admin_required
 def upload_template():
@@ -329,6 +350,7 @@ def upload_template():
             file=file_content,
             file_options={"content-type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
         )
+        invalidate_template_bytes(TEMPLATE_KEY)
         
         flash("New template uploaded successfully!", "success")
     except Exception as e:
@@ -344,18 +366,34 @@ def upload_template():
 def admin_dashboard():
     pending_users_res = supabase.table('users').select('*').eq('approved', False).execute()
     approved_users_res = supabase.table('users').select('*').eq('approved', True).neq('role', 'admin').execute()
-    
+
+    return render_template('admin_dashboard.html',
+                           pending_user_forms=_pending_user_forms(pending_users_res.data),
+                           approved_users=approved_users_res.data)
+
+@async_view('admin.admin_dashboard')
+@login_required
+@roles_required('admin')
+async def admin_dashboard_async():
+    async with async_supabase() as client:
+        pending_users_res, approved_users_res = await asyncio.gather(
+            client.table('users').select('*').eq('approved', False).execute(),
+            client.table('users').select('*').eq('approved', True).neq('role', 'admin').execute(),
+        )
+
+    return render_template('admin_dashboard.html',
+                           pending_user_forms=_pending_user_forms(pending_users_res.data),
+                           approved_users=approved_users_res.data)
+
+def _pending_user_forms(pending_users):
     pending_user_forms = []
-    for user in pending_users_res.data:
+    for user in pending_users:
         form = ApproveUserForm(user_id=user['id'])
         form.assigned_department.data = user.get('assigned_department')
         form.role.data = user.get('role', 'teacher')
         form.title_display = user.get('title')
         pending_user_forms.append({'user': user, 'form': form})
-        
-    return render_template('admin_dashboard.html',
-                           pending_user_forms=pending_user_forms,
-                           approved_users=approved_users_res.data)
+    return pending_user_forms
 
 
 @admin_bp.route('/approve_user', methods=['POST'])
@@ -372,6 +410,7 @@ def approve_user_action():
         }
         try:
             user_res = supabase.table('users').update(update_data).eq('id', user_id).execute()
+            invalidate_user_profile(user_id)
             if user_res.data:
                 flash(f"User {user_res.data[0]['username']} has been approved and assigned.", 'success')
         except PostgrestAPIError as e:
@@ -407,6 +446,7 @@ def edit_user(user_id):
         }
         try:
             supabase.table('users').update(update_data).eq('id', user_id).execute()
+            invalidate_user_profile(user_id)
             flash(f"User profile for {user['username']} updated successfully.", "success")
             return redirect(url_for('admin.admin_dashboard'))
         except Exception as e:
@@ -430,6 +470,7 @@ def suspend_user(user_id):
     try:
         # We simply toggle 'approved' to False. They will move to the 'Pending' list.
         supabase.table('users').update({'approved': False}).eq('id', user_id).execute()
+        invalidate_user_profile(user_id)
         flash("User suspended. They have been moved to the Pending Approvals list.", "warning")
     except Exception as e:
         flash(f"Error suspending user: {str(e)}", "danger")
@@ -441,6 +482,7 @@ def suspend_user(user_id):
 def disapprove_user(user_id):
     try:
         user_res = supabase.table('users').delete().eq('id', user_id).execute()
+        invalidate_user_profile(user_id)
         if user_res.data:
             flash(f"User profile for {user_res.data[0]['username']} has been disapproved and removed.", 'warning')
         else:
@@ -465,6 +507,7 @@ def manage_departments():
                 flash(f"Department '{dept_name}' already exists.", "warning")
             else:
                 supabase.table('departments').insert({'name': dept_name}).execute()
+                invalidate_departments()
                 flash(f"Department '{dept_name}' added successfully!", "success")
                 return redirect(url_for('admin.manage_departments'))
         except PostgrestAPIError as e:
@@ -486,6 +529,7 @@ def manage_departments():
 def delete_department(dept_id):
     try:
         supabase.table('departments').delete().eq('id', dept_id).execute()
+        invalidate_departments()
         flash("Department deleted successfully.", "success")
     except PostgrestAPIError as e:
         flash(f"Error deleting department: {e.message}", "danger")
@@ -494,16 +538,31 @@ def delete_department(dept_id):
 @login_required
 @roles_required('admin')
 def manage_clps():
-    # Fetch ALL plans with author details, ordered by newest first
+    # Fetch plans with author details, newest first, one page at a time
+    page = None
     try:
-        plans_res = supabase.table('course_learning_plans').select('*, author:users(username, first_name, last_name)').order('date_posted', desc=True).execute()
-        # Format dates
-        plans = parse_supabase_timestamp(plans_res.data, 'date_posted')
+        page = paginate_plans(f'{CLP_LIST_COLUMNS}, author:users(username, first_name, last_name)', plan_filters_from_request())
+        plans = page.items
     except PostgrestAPIError as e:
         flash(f"Database error: {e.message}", "danger")
         plans = []
         
-    return render_template('admin_clps.html', plans=plans)
+    return render_template('admin_clps.html', plans=plans, page=page)
+
+@async_view('admin.manage_clps')
+@login_required
+@roles_required('admin')
+async def manage_clps_async():
+    page = None
+    try:
+        async with async_supabase() as client:
+            page = await paginate_plans_async(client, f'{CLP_LIST_COLUMNS}, author:users(username, first_name, last_name)', plan_filters_from_request())
+        plans = page.items
+    except PostgrestAPIError as e:
+        flash(f"Database error: {e.message}", "danger")
+        plans = []
+
+    return render_template('admin_clps.html', plans=plans, page=page)
 
 @admin_bp.route('/clp/<int:plan_id>/delete', methods=['POST'])
 @login_required
@@ -528,12 +587,52 @@ def delete_clp(plan_id):
         
         # 3. Delete record from Database
         supabase.table('course_learning_plans').delete().eq('id', plan_id).execute()
+        invalidate_dean_summary()
+        invalidate_coverage()
         flash(f"CLP '{plan['subject']}' has been permanently deleted.", "success")
         
     except Exception as e:
         flash(f"Error deleting plan: {str(e)}", "danger")
 
     return redirect(url_for('admin.manage_clps'))
+
+@admin_bp.route('/clps/export')
+@expensive(COST_EXPORT)
+@login_required
+@roles_required('admin')
+def export_clps():
+    # Same filters as the list; approved plans unless another status is asked for
+    filters = plan_filters_from_request()
+    filters.setdefault('status', 'approved')
+    try:
+        rows = export_rows(filters)
+    except ExportTooLarge as e:
+        flash(str(e), "warning")
+        return redirect(url_for('admin.manage_clps', **request.args))
+    except PostgrestAPIError as e:
+        flash(f"Export failed: {e.message}", "danger")
+        return redirect(url_for('admin.manage_clps', **request.args))
+    return export_response(rows, export_filename(filters))
+
+@admin_bp.route('/clps/bulk_delete', methods=['POST'])
+@login_required
+@roles_required('admin')
+def bulk_delete_clps():
+    plan_ids = request.form.getlist('plan_ids', type=int)
+    if not plan_ids:
+        flash("Select at least one plan to delete.", "warning")
+        return redirect(url_for('admin.manage_clps'))
+    try:
+        deleted, failed_paths = bulk_delete_plans(plan_ids)
+        if deleted:
+            invalidate_coverage()
+        flash(f"{deleted} CLP(s) have been permanently deleted.", "success")
+        if failed_paths:
+            flash(f"{len(failed_paths)} file(s) could not be removed from storage; the storage cleanup job will retry them.", "warning")
+    except PostgrestAPIError as e:
+        flash(f"Error deleting plans: {e.message}", "danger")
+    return redirect(url_for('admin.manage_clps'))
+
 @admin_bp.route('/templates', methods=['GET', 'POST'])
 @login_required
 @roles_required('admin')
@@ -548,13 +647,12 @@ def manage_templates():
         storage_path = f"templates/{int(time.time())}_{filename}"
         
         try:
-            # Upload to Supabase Storage
-            file_content = file.read()
-            supabase.storage.from_(STORAGE_BUCKET_NAME).upload(
-                path=storage_path,
-                file=file_content,
-                file_options={"content-type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
-            )
+            # Upload to Supabase Storage, streamed from a spooled copy
+            with spooled(file) as local_path:
+                upload_to_storage(supabase, storage_path, local_path,
+                                  "application/vnd.openxmlformats-officedocument.wordprocessingml.document")
+                with open(local_path, 'rb') as fh:
+                    manifest = manifest_or_none(fh.read(), storage_path)
 
             # Save Metadata to DB
             dept_id = form.department.data if form.department.data else None
@@ -568,10 +666,16 @@ def manage_templates():
                 'name': form.name.data,
                 'filename': storage_path,
                 'department_id': dept_id,
-                'is_default': is_def
+                'is_default': is_def,
+                'placeholder_manifest': manifest
             }).execute()
+            invalidate_templates()
             
-            flash("Template uploaded successfully!", "success")
+            flash("Template uploaded successfully! Existing AI drafts keep their old layout until you re-render them.", "success")
+            if manifest is None:
+                flash("The template could not be scanned for placeholders, so AI generation will request every field.", "warning")
+            elif manifest['unfillable']:
+                flash(f"These placeholders are not filled by AI generation: {', '.join(manifest['unfillable'])}", "warning")
             return redirect(url_for('admin.manage_templates'))
             
         except Exception as e:
@@ -588,6 +692,38 @@ def manage_templates():
 
     return render_template('admin_templates.html', form=form, templates=templates)
 
+@admin_bp.route('/templates/<int:template_id>/rerender', methods=['POST'])
+@login_required
+@roles_required('admin')
+def rerender_template_plans(template_id):
+    res = supabase.table('templates').select('filename').eq('id', template_id).single().execute()
+    if not res.data: abort(404)
+    dry_run = request.form.get('dry_run') == '1'
+    try:
+        # Fills the stored content JSON into the template again; no AI generation
+        job_id = start_rerender_job(res.data['filename'], dry_run, session['user_id'])
+    except Exception as e:
+        flash(f"Could not start the re-render job: {e}", "danger")
+        return redirect(url_for('admin.manage_templates'))
+    return redirect(url_for('admin.rerender_job', job_id=job_id))
+
+@admin_bp.route('/templates/rerender/<int:job_id>')
+@login_required
+@roles_required('admin')
+def rerender_job(job_id):
+    job = get_rerender_job(job_id)
+    if not job: abort(404)
+    return render_template('admin_rerender_job.html', job=job)
+
+@admin_bp.route('/templates/rerender/<int:job_id>/progress')
+@exempt
+@login_required
+@roles_required('admin')
+def rerender_job_progress(job_id):
+    job = get_rerender_job(job_id)
+    if not job: abort(404)
+    return jsonify({key: job[key] for key in ('status', 'total', 'done', 'skipped', 'failed', 'errors', 'plans', 'incomplete')})
+
 @admin_bp.route('/templates/delete/<int:template_id>', methods=['POST'])
 @login_required
 @roles_required('admin')
@@ -597,8 +733,10 @@ def delete_template(template_id):
         res = supabase.table('templates').select('filename').eq('id', template_id).single().execute()
         if res.data:
             supabase.storage.from_(STORAGE_BUCKET_NAME).remove([res.data['filename']])
+            invalidate_template_bytes(res.data['filename'])
             
         supabase.table('templates').delete().eq('id', template_id).execute()
+        invalidate_templates()
         flash("Template deleted.", "success")
     except Exception as e:
         flash(f"Error deleting template: {e}", "danger")
@@ -4,32 +4,42 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from app import supabase
 from app.forms import LoginForm, SignupForm
 from app.decorators import login_required
+from app.profiles import cache_user_profile
+from app.ratelimits import auth_limit
+from app.clients import new_auth_client, session_auth_client
 
 # Create a Blueprint instance for authentication
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/login', methods=['GET', 'POST'])
+@auth_limit
 def login():
     if 'user_id' in session:
         return redirect(url_for('main.dashboard'))
     form = LoginForm()
     if form.validate_on_submit():
         try:
-            # Step 1: Authenticate with Supabase Auth
-            auth_response = supabase.auth.sign_in_with_password({
+            # Step 1: Authenticate with Supabase Auth on a throwaway client, so the
+            # user's session never ends up on a pooled client shared with other requests
+            auth_client = new_auth_client()
+            auth_response = auth_client.auth.sign_in_with_password({
                 "email": form.email.data,
                 "password": form.password.data
             })
             user_id = auth_response.user.id
             
             # Step 2: Fetch the user's profile from our public 'users' table
-            profile_res = supabase.table('users').select('*').eq('id', user_id).single().execute()
+            profile_res = auth_client.table('users').select('*').eq('id', user_id).single().execute()
             profile = profile_res.data
+            cache_user_profile(profile)
             
             if profile and profile.get('approved'):
                 session['user_id'] = profile['id']
                 session['role'] = profile['role']
                 session['username'] = profile['username']
+                # Kept for calls that must act as the user (password change, sign-out)
+                session['sb_access_token'] = auth_response.session.access_token
+                session['sb_refresh_token'] = auth_response.session.refresh_token
                 flash('Login successful!', 'success')
                 return redirect(url_for('main.dashboard'))
             elif profile and not profile.get('approved'):
@@ -41,6 +51,7 @@ def login():
     return render_template('login.html', form=form)
 
 @auth_bp.route('/signup', methods=['GET', 'POST'])
+@auth_limit
 def signup():
     form = SignupForm()
     if form.validate_on_submit():
@@ -51,8 +62,9 @@ def signup():
                 flash('Username or email already exists. Please choose a different one or login.', 'danger')
                 return redirect(url_for('auth.signup'))
             
-            # Step 1: Create the user in Supabase Auth
-            auth_user = supabase.auth.sign_up({
+            # Step 1: Create the user in Supabase Auth (throwaway client, see login)
+            auth_client = new_auth_client()
+            auth_user = auth_client.auth.sign_up({
                 'email': form.email.data,
                 'password': form.password.data
             })
@@ -70,7 +82,7 @@ def signup():
                     'approved': False, # Default not approved
                     'assigned_department': form.department.data if form.department.data else None
                 }
-                supabase.table('users').insert(profile_data).execute()
+                auth_client.table('users').insert(profile_data).execute()
                 flash('Registration successful! Your account is pending administrator approval.', 'info')
                 return redirect(url_for('auth.login'))
             else:
@@ -85,7 +97,9 @@ def signup():
 @login_required
 def logout():
     try:
-        supabase.auth.sign_out()
+        auth_client = session_auth_client()
+        if auth_client:
+            auth_client.auth.sign_out()
     except Exception as e:
         current_app.logger.error(f"Logout error: {e}")
     session.clear()
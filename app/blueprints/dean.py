@@ -1,5 +1,6 @@
 # app/blueprints/dean.py
 
+import asyncio
 import json
 from flask import Blueprint, render_template, request, redirect, url_for, flash, abort, session
 from supabase import PostgrestAPIError
@@ -11,13 +12,26 @@ from app.utils import create_notification
 from app.utils import get_current_user_profile, create_notification, parse_supabase_timestamp ,current_app
 import os
 import hashlib
-import requests
 import platform
 import time
 import traceback
 from flask import jsonify, Response, current_app
 from app import STORAGE_BUCKET_NAME
 from app.utils import generate_jwt_token
+from app.notifier import notify_many
+from app.pagination import paginate_plans, paginate_plans_async, plan_filters_from_request
+from app.plan_content import CLP_LIST_COLUMNS, CONTENT_UPLOAD_TYPES, load_plan_content
+from app.search import extract_document_text, index_plan_text
+from app.similarity import refresh_plan_similarity, similar_plans
+from app.profiles import get_user_profile
+from app.dean_summary import invalidate_dean_summary
+from app.storage_cleanup import bulk_delete_plans
+from app.analytics import get_coverage, invalidate_coverage
+from app.curriculum_aggregates import approval_fields, get_curriculum_aggregates
+from app.ratelimits import COST_EXPORT, exempt, expensive
+from app.exports import ExportTooLarge, export_filename, export_response, export_rows
+from app.aio import async_supabase, async_view, unread_notifications_count
+from app.clients import session_auth_client
 # Create a Blueprint for dean routes
 dean_bp = Blueprint('dean', __name__)
 
@@ -32,28 +46,99 @@ def dean_faculty():
 @login_required
 @roles_required('dean')
 def dean_courses():
-    # Fetching plans with author's username using a join
-    pending_plans_res = supabase.table('course_learning_plans').select('*, author:users(username)').eq('status', 'pending').order('date_posted', desc=True).execute()
-    approved_plans_res = supabase.table('course_learning_plans').select('*, author:users(username)').eq('status', 'approved').order('date_posted', desc=True).execute()
+    # Fetching plans with author's username using a join; each list pages independently
+    pending_page = paginate_plans(f'{CLP_LIST_COLUMNS}, author:users(username)', plan_filters_from_request(status='pending'), cursor_param='pending_cursor')
+    approved_page = paginate_plans(f'{CLP_LIST_COLUMNS}, author:users(username)', plan_filters_from_request(status='approved'), cursor_param='approved_cursor')
     count_res = supabase.table('notifications').select('id', count='exact').eq('user_id', session['user_id']).eq('is_read', False).execute()
 
-    # --- FIX: Convert timestamp strings to datetime objects for the template ---
-    pending_plans_data = parse_supabase_timestamp(pending_plans_res.data, 'date_posted')
-    approved_plans_data = parse_supabase_timestamp(approved_plans_res.data, 'date_posted')
-
     return render_template('dean_courses.html',
-                           pending_plans=pending_plans_data,
-                           approved_plans=approved_plans_data,
+                           pending_plans=pending_page.items,
+                           approved_plans=approved_page.items,
+                           pending_page=pending_page,
+                           approved_page=approved_page,
                            unread_notifications=count_res.count)
 
+@async_view('dean.dean_courses')
+@login_required
+@roles_required('dean')
+async def dean_courses_async():
+    # Same page as dean_courses, with the three independent queries in flight together
+    columns = f'{CLP_LIST_COLUMNS}, author:users(username)'
+    async with async_supabase() as client:
+        pending_page, approved_page, unread = await asyncio.gather(
+            paginate_plans_async(client, columns, plan_filters_from_request(status='pending'), cursor_param='pending_cursor'),
+            paginate_plans_async(client, columns, plan_filters_from_request(status='approved'), cursor_param='approved_cursor'),
+            unread_notifications_count(client, session['user_id']),
+        )
+
+    return render_template('dean_courses.html',
+                           pending_plans=pending_page.items,
+                           approved_plans=approved_page.items,
+                           pending_page=pending_page,
+                           approved_page=approved_page,
+                           unread_notifications=unread)
+
+@dean_bp.route('/analytics')
+@login_required
+@roles_required('dean')
+def dean_analytics():
+    department = request.args.get('department', '').strip() or None
+    try:
+        coverage = get_coverage(department)
+        aggregates = get_curriculum_aggregates(department)
+    except PostgrestAPIError as e:
+        flash(f"Could not load coverage data: {e.message}", 'danger')
+        coverage, aggregates = None, []
+    return render_template('dean_analytics.html', coverage=coverage, aggregates=aggregates, department=department,
+                           program_outcomes={po['code']: po['description'] for po in PROGRAM_OUTCOMES})
+
+@dean_bp.route('/courses/export')
+@expensive(COST_EXPORT)
+@login_required
+@roles_required('dean')
+def export_clps():
+    # Same filters as the list; approved plans unless another status is asked for
+    filters = plan_filters_from_request()
+    filters.setdefault('status', 'approved')
+    try:
+        rows = export_rows(filters)
+    except ExportTooLarge as e:
+        flash(str(e), 'warning')
+        return redirect(url_for('dean.dean_courses', **request.args))
+    except PostgrestAPIError as e:
+        flash(f"Export failed: {e.message}", 'danger')
+        return redirect(url_for('dean.dean_courses', **request.args))
+    return export_response(rows, export_filename(filters))
+
+@dean_bp.route('/courses/bulk_delete', methods=['POST'])
+@login_required
+@roles_required('dean')
+def bulk_delete_approved():
+    plan_ids = request.form.getlist('plan_ids', type=int)
+    if not plan_ids:
+        flash('Select at least one plan to delete.', 'warning')
+        return redirect(url_for('dean.dean_courses'))
+    try:
+        # Deans may only delete approved plans, same as delete_approved_clp
+        deleted, failed_paths = bulk_delete_plans(plan_ids, status='approved')
+        if deleted:
+            invalidate_coverage()
+        flash(f'{deleted} approved Course Learning Plan(s) have been deleted.', 'success')
+        if failed_paths:
+            flash(f'{len(failed_paths)} file(s) could not be removed from storage; the storage cleanup job will retry them.', 'warning')
+    except PostgrestAPIError as e:
+        flash(f"Database error during deletion: {e.message}", 'danger')
+    return redirect(url_for('dean.dean_courses'))
+
 @dean_bp.route('/review_clp/<int:plan_id>', methods=['GET', 'POST'])
 @login_required
 @roles_required('dean')
 def dean_review_clp(plan_id):
-    plan_res = supabase.table('course_learning_plans').select('*, author:users(*)').eq('id', plan_id).single().execute()
+    plan_res = supabase.table('course_learning_plans').select(CLP_LIST_COLUMNS).eq('id', plan_id).single().execute()
     plan = plan_res.data
 
     if not plan: abort(404)
+    plan['author'] = get_user_profile(plan['user_id']) or {}
 
     parsed_plan_list = parse_supabase_timestamp([plan], 'date_posted')
     plan = parsed_plan_list[0]
@@ -69,26 +154,30 @@ def dean_review_clp(plan_id):
         if form.submit_approve.data:
             new_status = 'approved'
             flash(f'CLP for {plan["subject"]} has been approved.', 'success')
-            create_notification(plan['user_id'], f'Your CLP for "{plan["subject"]}" has been APPROVED by the Dean.')
+            notify_many([plan['user_id']], f'Your CLP for "{plan["subject"]}" has been APPROVED by the Dean.')
         elif form.submit_return.data:
             new_status = 'returned_for_revision'
             flash(f'CLP for {plan["subject"]} has been returned for revision.', 'warning')
-            create_notification(plan['user_id'], f'Your CLP for "{plan["subject"]}" has been RETURNED. Comments: {comments or "None"}')
+            notify_many([plan['user_id']], f'Your CLP for "{plan["subject"]}" has been RETURNED. Comments: {comments or "None"}')
 
         try:
             print(f"DEBUG: Updating plan {plan_id} with status='{new_status}' and comments='{comments}'")
-            update_res = supabase.table('course_learning_plans').update({
-            'status': new_status,
-            'dean_comments': comments
-                }).eq('id', plan_id).execute()
-            supabase.table('course_learning_plans').update({
-                'status': new_status,
-                'dean_comments': comments
-            }).eq('id', plan_id).execute()
+            update_data = {'status': new_status, 'dean_comments': comments}
+            if new_status == 'approved':
+                # Counted into curriculum_aggregates by the table trigger (migrations/005)
+                update_data.update(approval_fields(plan))
+            supabase.table('course_learning_plans').update(update_data).eq('id', plan_id).execute()
+            invalidate_dean_summary()
+            if new_status == 'approved':
+                invalidate_coverage()
         except PostgrestAPIError as e:
             flash(f"Error updating plan: {e.message}", 'danger')
         return redirect(url_for('dean.dean_courses'))
 
+    # Content is only fetched once we know the review page will render it
+    if plan['upload_type'] in CONTENT_UPLOAD_TYPES:
+        plan['content'] = load_plan_content(plan_id)
+
     content_data = {}
     if plan['upload_type'] == 'ai_generated' and plan.get('content'):
         try:
@@ -98,6 +187,7 @@ def dean_review_clp(plan_id):
             content_data = {'descriptive_title': plan.get('subject', 'Error')}
 
     return render_template('dean_review_clp.html', plan=plan, form=form, content_data=content_data,
+                           similar=similar_plans(plan_id),
                            program_outcomes=current_app.config['PROGRAM_OUTCOMES'], course_outcomes=current_app.config['COURSE_OUTCOMES'],
                            institutional_headers=current_app.config['INSTITUTIONAL_OUTCOMES_HEADERS'], program_headers=current_app.config['PROGRAM_OUTCOMES_HEADERS'])
 
@@ -109,7 +199,11 @@ def dean_profile():
     if form.validate_on_submit():
         try:
             # The user must be logged in to update their password this way.
-            supabase.auth.update_user({"password": form.new_password.data})
+            auth_client = session_auth_client()
+            if auth_client is None:
+                flash('Your session has expired. Please log in again to change your password.', 'warning')
+                return redirect(url_for('auth.logout'))
+            auth_client.auth.update_user({"password": form.new_password.data})
             flash('Your password has been changed successfully.', 'success')
             return redirect(url_for('dean.dean_profile'))
         except Exception as e:
@@ -125,7 +219,7 @@ def review_clp_document(plan_id):
     """Open the CLP in ONLYOFFICE editor for review/editing."""
     try:
         # 1. Fetch plan details
-        res = supabase.table('course_learning_plans').select('*, author:users(username)').eq('id', plan_id).single().execute()
+        res = supabase.table('course_learning_plans').select('id, subject, filename').eq('id', plan_id).single().execute()
         plan = res.data
         
         if not plan: abort(404)
@@ -214,6 +308,7 @@ def review_clp_document(plan_id):
         return redirect(url_for('dean.dean_review_clp', plan_id=plan_id))
 
 @dean_bp.route('/serve_clp_doc/<int:plan_id>/<doc_key>')
+@exempt
 def serve_clp_doc(plan_id, doc_key):
     """Serve the CLP file content to ONLYOFFICE."""
     try:
@@ -246,6 +341,7 @@ def serve_clp_doc(plan_id, doc_key):
 
 
 @dean_bp.route('/onlyoffice_callback/<int:plan_id>/<doc_key>', methods=['POST'])
+@exempt
 def onlyoffice_callback(plan_id, doc_key):
     """Handle saving changes made by the Dean."""
     try:
@@ -266,6 +362,7 @@ def onlyoffice_callback(plan_id, doc_key):
             storage_path = res.data['filename']
 
             # 2. Download new file
+            import requests  # deferred: only the ONLYOFFICE callbacks need it
             resp = requests.get(download_url, timeout=30)
             resp.raise_for_status()
             new_file_data = resp.content
@@ -277,6 +374,9 @@ def onlyoffice_callback(plan_id, doc_key):
                 file_options={"content-type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document", "upsert": "true"}
             )
             
+            document_text = extract_document_text(new_file_data, storage_path)
+            index_plan_text(plan_id, document_text)
+            refresh_plan_similarity(plan_id, document_text)
             current_app.logger.info(f"Dean updated CLP {plan_id}")
             return jsonify({"error": 0})
 
@@ -1,10 +1,17 @@
 # app/blueprints/main.py
 
-from flask import Blueprint, render_template, redirect, url_for, session, jsonify, request, flash
+from flask import Blueprint, render_template, redirect, url_for, session, jsonify, request, flash, current_app
 from supabase import PostgrestAPIError
 from app import supabase
 from app.decorators import login_required
-from app.utils import parse_supabase_timestamp
+from app.utils import allowed_file, parse_supabase_timestamp
+from app.pagination import apply_keyset, clamp_page_size, decode_cursor, split_page
+from app.search import search_plans
+from app.dean_summary import get_dean_summary, get_dean_summary_async
+from app.ratelimits import COST_SEARCH, COST_UPLOAD, exempt, expensive
+from app.uploads import (TUS_VERSION, UploadError, append_chunk, create_upload, delete_upload,
+                         upload_offset)
+from app.aio import async_supabase, async_view, unread_notifications_count
 
 # Create a Blueprint instance
 main_bp = Blueprint('main', __name__)
@@ -22,37 +29,170 @@ def index():
 def dashboard():
     role = session.get('role')
     user_id = session.get('user_id')
-    unread_notifications_count = 0
-    if user_id:
+
+    if role == 'admin':
+        return redirect(url_for('admin.admin_dashboard'))
+    elif role == 'teacher':
+        unread_notifications_count = 0
         try:
             count_res = supabase.table('notifications').select('id', count='exact').eq('user_id', user_id).eq('is_read', False).execute()
             unread_notifications_count = count_res.count
         except PostgrestAPIError:
             pass  # Fail silently if notifications table is inaccessible
-    
-    if role == 'admin':
-        return redirect(url_for('admin.admin_dashboard'))
-    elif role == 'teacher':
         return render_template('teacher_dashboard.html', unread_notifications=unread_notifications_count)
     elif role == 'dean':
-        return render_template('dean_dashboard.html', unread_notifications=unread_notifications_count)
+        # Counts, newest pending plans and the unread count in one cached RPC call
+        try:
+            summary = get_dean_summary(user_id)
+        except PostgrestAPIError as e:
+            current_app.logger.error(f"Dean dashboard summary failed: {e.message}")
+            summary = None
+        return render_template('dean_dashboard.html', summary=summary,
+                               unread_notifications=summary['unread_notifications'] if summary else 0)
     else:
         # A new user who is not yet approved might not have a role.
         flash("Your role is not defined. Please contact an administrator.", "warning")
         return redirect(url_for('auth.login'))
-        
+
+
+@async_view('main.dashboard')
+@login_required
+async def dashboard_async():
+    role = session.get('role')
+    if role == 'admin':
+        return redirect(url_for('admin.admin_dashboard'))
+    if role not in ('teacher', 'dean'):
+        flash("Your role is not defined. Please contact an administrator.", "warning")
+        return redirect(url_for('auth.login'))
+    unread, summary = 0, None
+    try:
+        async with async_supabase() as client:
+            if role == 'dean':
+                summary = await get_dean_summary_async(client, session['user_id'])
+                unread = summary['unread_notifications']
+            else:
+                unread = await unread_notifications_count(client, session['user_id'])
+    except PostgrestAPIError:
+        pass  # Fail silently if notifications table is inaccessible
+    return render_template(f'{role}_dashboard.html', summary=summary, unread_notifications=unread)
+
+# --- HEALTH CHECKS ---
+
+@main_bp.route('/healthz')
+@exempt
+def healthz():
+    """Liveness: the worker is up and serving requests."""
+    return jsonify({'status': 'ok'})
+
+@main_bp.route('/readyz')
+@exempt
+def readyz():
+    """Readiness: the worker can reach Supabase."""
+    try:
+        supabase.table('departments').select('id').limit(1).execute()
+    except Exception as e:
+        current_app.logger.warning(f"Readiness check failed: {e}")
+        return jsonify({'status': 'unavailable'}), 503
+    return jsonify({'status': 'ok'})
+
+# --- SEARCH ---
+
+@main_bp.route('/search')
+@expensive(COST_SEARCH)
+@login_required
+def search():
+    query = request.args.get('q', '').strip()
+    results = []
+    if query:
+        try:
+            # Teachers see approved plans plus their own; deans and admins see everything
+            results = search_plans(query, session['user_id'],
+                                   include_all=session.get('role') in ('dean', 'admin'))
+            results = parse_supabase_timestamp(results, 'date_posted')
+        except PostgrestAPIError as e:
+            flash(f"Search failed: {e.message}", 'danger')
+    return render_template('search_results.html', query=query, results=results)
+
+# --- RESUMABLE UPLOADS ---
+# A subset of the TUS 1.0 protocol (creation, HEAD, PATCH, termination) used by the
+# uploader in _resumable_upload.html. The finished file is handed to the upload form
+# as `upload_id`; see app/uploads.py.
+
+def _tus_response(status, body=None, **headers):
+    response = jsonify(body) if body is not None else current_app.response_class()
+    response.status_code = status
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    for name, value in headers.items():
+        response.headers[name.replace('_', '-')] = str(value)
+    return response
+
+def _tus_metadata():
+    """Decodes the Upload-Metadata header: comma-separated `key base64value` pairs."""
+    import base64
+    metadata = {}
+    for pair in request.headers.get('Upload-Metadata', '').split(','):
+        key, _, value = pair.strip().partition(' ')
+        if key:
+            metadata[key] = base64.b64decode(value).decode('utf-8', 'replace') if value else ''
+    return metadata
+
+@main_bp.route('/uploads', methods=['POST'])
+@expensive(COST_UPLOAD)
+@login_required
+def create_resumable_upload():
+    metadata = _tus_metadata()
+    filename = metadata.get('filename', '')
+    if not allowed_file(filename):
+        return _tus_response(400, {'error': 'Only .docx and .pdf files are allowed!'})
+    try:
+        upload_id = create_upload(session['user_id'], request.headers.get('Upload-Length', 0, type=int),
+                                  filename, metadata.get('filetype') or 'application/octet-stream')
+    except UploadError as e:
+        return _tus_response(e.status, {'error': str(e)})
+    return _tus_response(201, Location=url_for('main.resumable_upload', upload_id=upload_id), Upload_Offset=0)
+
+@main_bp.route('/uploads/<upload_id>', methods=['HEAD', 'PATCH', 'DELETE'])
+@login_required
+def resumable_upload(upload_id):
+    try:
+        if request.method == 'HEAD':
+            offset, length = upload_offset(upload_id, session['user_id'])
+            return _tus_response(200, Upload_Offset=offset, Upload_Length=length, Cache_Control='no-store')
+        if request.method == 'DELETE':
+            delete_upload(upload_id, session['user_id'])
+            return _tus_response(204)
+        if request.mimetype != 'application/offset+octet-stream':
+            return _tus_response(415, {'error': 'Expected application/offset+octet-stream.'})
+        offset = request.headers.get('Upload-Offset', type=int)
+        if offset is None:
+            return _tus_response(400, {'error': 'Missing Upload-Offset.'})
+        new_offset = append_chunk(upload_id, session['user_id'], offset, request.stream)
+        return _tus_response(204, Upload_Offset=new_offset)
+    except UploadError as e:
+        return _tus_response(e.status, {'error': str(e)})
+
 # --- NOTIFICATION ROUTES ---
 
 @main_bp.route('/notifications')
 @login_required
 def list_notifications():
-    notif_res = supabase.table('notifications').select('*').eq('user_id', session['user_id']).order('timestamp', desc=True).execute()
+    # Keyset pagination on (timestamp, id): each page is an index range scan,
+    # no matter how deep into the history the user scrolls.
+    page_size = clamp_page_size(request.args.get('per_page'), current_app.config['NOTIFICATIONS_PAGE_SIZE'])
+    cursor = decode_cursor(request.args.get('cursor'))
+
+    query = supabase.table('notifications').select('id, message, is_read, timestamp').eq('user_id', session['user_id'])
+    query = apply_keyset(query, cursor, 'timestamp')
+    notif_res = query.order('timestamp', desc=True).order('id', desc=True).limit(page_size + 1).execute()
+    notifications, next_cursor = split_page(notif_res.data, page_size, 'timestamp')
 
     # --- FIX: Convert timestamp strings to datetime objects for the template ---
-    notifications_with_dates = parse_supabase_timestamp(notif_res.data, 'timestamp')
+    notifications_with_dates = parse_supabase_timestamp(notifications, 'timestamp')
 
-    return render_template('notifications.html', notifications=notifications_with_dates)
+    return render_template('notifications.html', notifications=notifications_with_dates,
+                           next_cursor=next_cursor, is_first_page=cursor is None)
 @main_bp.route('/check_notifications')
+@exempt
 @login_required
 def check_notifications():
     count_res = supabase.table('notifications').select('id', count='exact').eq('user_id', session['user_id']).eq('is_read', False).execute()
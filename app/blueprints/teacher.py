@@ -1,5 +1,6 @@
 # app/blueprints/teacher.py
 
+import asyncio
 import os
 import json
 from flask import (Blueprint, render_template, request, redirect, url_for, flash,
@@ -7,7 +8,7 @@ from flask import (Blueprint, render_template, request, redirect, url_for, flash
 from supabase import PostgrestAPIError
 from app import supabase, STORAGE_BUCKET_NAME
 from app.forms import (CLPUploadForm, CLPGenerateForm, CLPUpdateForm,
-                       ChangePasswordForm)
+                       ChangePasswordForm, CLPCloneForm)
 from app.decorators import login_required, roles_required
 from app.utils import (allowed_file, get_current_user_profile,
                        parse_supabase_timestamp, start_clp_generation)
@@ -21,20 +22,33 @@ from app.forms import CLPUploadForm, GenerateAIForm
 from app.forms import (CLPUploadForm, CLPGenerateForm, CLPUpdateForm,
                        ChangePasswordForm, GenerateAIForm) 
 # Add these imports at the top of teacher.py
-import jwt
 import time
-import requests
 import hashlib
 import platform # Added for host detection
 import traceback # Added for detailed error logging in callback
 from app.utils import generate_jwt_token # Import the function from utils
+from app.notifier import notify_many
+from app.pagination import paginate_plans, paginate_plans_async, plan_filters_from_request
+from app.plan_content import (CLP_LIST_COLUMNS, CONTENT_UPLOAD_TYPES, load_plan_content,
+                              save_plan_content, split_content)
+from app.search import build_search_text, extract_document_text, index_plan_text
+from app.similarity import index_plan_similarity, refresh_plan_similarity, similarity_text
+from app.profiles import get_user_profile
+from app.refdata import get_departments
+from app.dean_summary import invalidate_dean_summary
+from app.analytics import invalidate_coverage
+from app.uploads import UploadError, incoming_file, upload_to_storage
+from app.cloning import CLONE_COLUMNS, can_clone, clone_plan
+from app.ratelimits import COST_AI_GENERATION, COST_DOWNLOAD, COST_UPLOAD, ai_limit, exempt, expensive
+from app.aio import async_supabase, async_view, unread_notifications_count
+from app.clients import session_auth_client
 teacher_bp = Blueprint('teacher', __name__)
 
 @teacher_bp.route('/clp/<int:plan_id>/edit_document')
 @login_required
 @roles_required('teacher')
 def edit_clp_document(plan_id):
-    plan_res = supabase.table('course_learning_plans').select('*').eq('id', plan_id).single().execute()
+    plan_res = supabase.table('course_learning_plans').select('id, user_id, upload_type, filename').eq('id', plan_id).single().execute()
     plan = plan_res.data
 
     if not plan: abort(404)
@@ -186,6 +200,7 @@ def edit_clp_document(plan_id):
         return redirect(url_for('teacher.view_clp', plan_id=plan_id))
     
 @teacher_bp.route('/serve_clp/<int:plan_id>/<doc_key>')
+@exempt
 # No login required - ONLYOFFICE fetches this directly
 def serve_clp_document(plan_id, doc_key):
     """Serve a specific CLP document to ONLYOFFICE."""
@@ -239,9 +254,11 @@ def serve_clp_document(plan_id, doc_key):
         abort(500, description=f"Error serving document: {str(e)}")
     
 @teacher_bp.route('/onlyoffice_clp_callback/<int:plan_id>/<doc_key>', methods=['POST'])
+@exempt
 # No login required - ONLYOFFICE calls this directly
 def onlyoffice_clp_callback(plan_id, doc_key):
     """Handle ONLYOFFICE save callback for teacher CLPs."""
+    import requests  # deferred: only the ONLYOFFICE callbacks need it
     try:
         data = request.get_json()
         if not data:
@@ -296,6 +313,11 @@ def onlyoffice_clp_callback(plan_id, doc_key):
 
             current_app.logger.info(f"✅ Successfully updated CLP {plan_id} in Supabase Storage. Result: {result}")
 
+            # Keep the search and similarity indexes in step with the edited document
+            document_text = extract_document_text(file_data, storage_path)
+            index_plan_text(plan_id, document_text)
+            refresh_plan_similarity(plan_id, document_text)
+
             # Optional: Update a 'last_edited' timestamp in the database table
             # supabase.table('course_learning_plans').update({'last_edited': datetime.utcnow().isoformat()}).eq('id', plan_id).execute()
 
@@ -330,8 +352,7 @@ def create_clp():
     # Fetch departments for the form if needed (assuming departments exist in Supabase)
     departments = []
     try:
-        response = supabase.table('departments').select('id, name').execute()
-        departments = response.data
+        departments = get_departments()
     except Exception as e:
         flash(f"Error fetching departments: {e}", "error")
 
@@ -354,6 +375,7 @@ def create_clp():
                     "generated_by_ai": False,
                     "department_id": upload_form.department.data # Associate with department
                 }).execute()
+                invalidate_dean_summary()
 
                 flash("CLP uploaded successfully and pending dean review.", "success")
                 return redirect(url_for('teacher.index'))
@@ -368,6 +390,8 @@ def create_clp():
 
 
 @teacher_bp.route('/create_clp_ai', methods=['GET', 'POST'])
+@ai_limit
+@expensive(COST_AI_GENERATION, methods=['POST'])
 @login_required
 @roles_required('teacher')
 def create_clp_ai():
@@ -401,6 +425,7 @@ def create_clp_ai():
                     "status": "generating",
                     "upload_type": "ai_generated"
                 }).execute()
+                invalidate_dean_summary()
                 
                 if not new_plan.data:
                     raise Exception("Failed to initialize CLP record.")
@@ -429,38 +454,63 @@ def teacher_my_clps():
     upload_form = CLPUploadForm()
     generate_form = CLPGenerateForm()
     
-    # Corrected Supabase query: Select the plan data AND the related author's username
-    plans_res = supabase.table('course_learning_plans').select('*, author:users(id, username)').eq('user_id', session['user_id']).order('date_posted', desc=True).execute()
+    # Select the plan data AND the related author's username, one page at a time
+    page = paginate_plans(f'{CLP_LIST_COLUMNS}, author:users(id, username)', plan_filters_from_request(user_id=session['user_id']))
     count_res = supabase.table('notifications').select('id', count='exact').eq('user_id', session['user_id']).eq('is_read', False).execute()
     
-    # Call the helper function to format the plan dates before rendering
-    plans_data = parse_supabase_timestamp(plans_res.data, 'date_posted')
-    
     return render_template('teacher_courses.html', 
                            title='My Courses', 
                            upload_form=upload_form, 
                            generate_form=generate_form, 
-                           plans=plans_data, 
+                           plans=page.items, 
+                           page=page,
                            unread_notifications=count_res.count)
 
+@async_view('teacher.teacher_my_clps')
+@login_required
+@roles_required('teacher')
+async def teacher_my_clps_async():
+    async with async_supabase() as client:
+        page, unread = await asyncio.gather(
+            paginate_plans_async(client, f'{CLP_LIST_COLUMNS}, author:users(id, username)', plan_filters_from_request(user_id=session['user_id'])),
+            unread_notifications_count(client, session['user_id']),
+        )
+
+    return render_template('teacher_courses.html',
+                           title='My Courses',
+                           upload_form=CLPUploadForm(),
+                           generate_form=CLPGenerateForm(),
+                           plans=page.items,
+                           page=page,
+                           unread_notifications=unread)
+
 @teacher_bp.route('/all_clps')
 @login_required
 @roles_required('teacher', 'dean')
 def teacher_all_clps():
     # Shows all *approved* plans from all users
-    plans_res = supabase.table('course_learning_plans').select('*, author:users(username)').eq('status', 'approved').order('date_posted', desc=True).execute()
+    page = paginate_plans(f'{CLP_LIST_COLUMNS}, author:users(username)', plan_filters_from_request(status='approved'))
     count_res = supabase.table('notifications').select('id', count='exact').eq('user_id', session['user_id']).eq('is_read', False).execute()
 
-    # --- FIX: Convert timestamp strings to datetime objects for the template ---
-    plans_data = parse_supabase_timestamp(plans_res.data, 'date_posted')
+    return render_template('all_courses.html', title='All Approved Course Learning Plans', plans=page.items, page=page, unread_notifications=count_res.count)
+
+@async_view('teacher.teacher_all_clps')
+@login_required
+@roles_required('teacher', 'dean')
+async def teacher_all_clps_async():
+    async with async_supabase() as client:
+        page, unread = await asyncio.gather(
+            paginate_plans_async(client, f'{CLP_LIST_COLUMNS}, author:users(username)', plan_filters_from_request(status='approved')),
+            unread_notifications_count(client, session['user_id']),
+        )
 
-    return render_template('all_courses.html', title='All Approved Course Learning Plans', plans=plans_data, unread_notifications=count_res.count)
+    return render_template('all_courses.html', title='All Approved Course Learning Plans', plans=page.items, page=page, unread_notifications=unread)
 
 @teacher_bp.route('/submit_to_dean/<int:plan_id>', methods=['POST'])
 @login_required
 @roles_required('teacher')
 def submit_to_dean(plan_id):
-    plan_res = supabase.table('course_learning_plans').select('*, author:users(id, username)').eq('id', plan_id).single().execute()
+    plan_res = supabase.table('course_learning_plans').select('id, subject, status, author:users(id, username)').eq('id', plan_id).single().execute()
     plan = plan_res.data
 
     if not plan: abort(404)
@@ -474,10 +524,12 @@ def submit_to_dean(plan_id):
                 'status': 'pending',
                 'dean_comments': None
             }).eq('id', plan_id).execute()
-            
+            invalidate_dean_summary()
+
             deans_res = supabase.table('users').select('id').eq('role', 'dean').eq('approved', True).execute()
-            for dean in deans_res.data:
-                create_notification(dean['id'], f'New CLP for "{plan["subject"]}" from {plan["author"]["username"]} needs review.')
+            # One bulk insert for all deans, written off the request thread
+            notify_many([dean['id'] for dean in deans_res.data],
+                        f'New CLP for "{plan["subject"]}" from {plan["author"]["username"]} needs review.')
             flash(f'CLP for "{plan["subject"]}" submitted to Dean for review.', 'success')
         except PostgrestAPIError as e:
             flash(f"Error submitting plan: {e.message}", 'danger')
@@ -486,6 +538,7 @@ def submit_to_dean(plan_id):
 
 
 @teacher_bp.route('/courses/upload', methods=['POST'])
+@expensive(COST_UPLOAD)
 @login_required
 @roles_required('teacher')
 def upload_clp():
@@ -493,33 +546,43 @@ def upload_clp():
     if form.validate_on_submit():
         user_id = session['user_id']
         file = form.file.data
+        # Set by the resumable uploader (_resumable_upload.html) in place of the file field
+        upload_id = request.form.get('upload_id')
         
-        if file and allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            # Create a unique path for the file in the bucket to avoid collisions
-            file_path_in_bucket = f"{user_id}/{datetime.utcnow().timestamp()}_{filename}"
-            
+        if (file and allowed_file(file.filename)) or upload_id:
             try:
-                supabase.storage.from_(STORAGE_BUCKET_NAME).upload(
-                    file=file.read(), 
-                    path=file_path_in_bucket, 
-                    file_options={"content-type": file.mimetype}
-                )
-                supabase.table('course_learning_plans').insert({
+                # Streamed from a file on disk; the upload is never held in memory whole
+                with incoming_file(file, upload_id, user_id) as (local_path, original_name, content_type):
+                    if not allowed_file(original_name):
+                        raise UploadError("Only .docx and .pdf files are allowed!")
+                    filename = secure_filename(original_name)
+                    # Create a unique path for the file in the bucket to avoid collisions
+                    file_path_in_bucket = f"{user_id}/{datetime.utcnow().timestamp()}_{filename}"
+                    upload_to_storage(supabase, file_path_in_bucket, local_path, content_type)
+                    document_text = extract_document_text(local_path, filename)
+                insert_res = supabase.table('course_learning_plans').insert({
                     'department': form.department.data, 'subject': form.subject.data,
                     'filename': file_path_in_bucket, 'upload_type': 'file_upload',
-                    'status': 'draft', 'user_id': user_id
+                    'status': 'draft', 'user_id': user_id,
+                    'search_text': build_search_text(document_text)
                 }).execute()
+                index_plan_similarity(insert_res.data[0]['id'], similarity_text(document_text=document_text))
+                invalidate_dean_summary()
                 flash('Your CLP file has been uploaded as a draft!', 'success')
             except Exception as e:
                 flash(f"An error occurred during file upload: {e}", 'danger')
         
         elif form.content.data:
-            supabase.table('course_learning_plans').insert({
+            fields, content = split_content({
                 'department': form.department.data, 'subject': form.subject.data,
                 'content': form.content.data, 'upload_type': 'manual_text',
-                'status': 'draft', 'user_id': user_id
-            }).execute()
+                'status': 'draft', 'user_id': user_id,
+                'search_text': build_search_text(form.content.data)
+            })
+            insert_res = supabase.table('course_learning_plans').insert(fields).execute()
+            save_plan_content(insert_res.data[0]['id'], content)
+            index_plan_similarity(insert_res.data[0]['id'], similarity_text(form.content.data))
+            invalidate_dean_summary()
             flash('Your CLP content has been saved as a draft!', 'success')
         else:
             flash('Please provide either content or upload a file.', 'danger')
@@ -555,6 +618,8 @@ def delete_approved_clp(plan_id):
     # Delete the plan from the database
     try:
         supabase.table('course_learning_plans').delete().eq('id', plan_id).execute()
+        invalidate_dean_summary()
+        invalidate_coverage()
         flash(f"Approved Course Learning Plan for '{plan['subject']}' has been deleted.", 'success')
     except PostgrestAPIError as e:
         flash(f"Database error during deletion: {e.message}", 'danger')
@@ -566,6 +631,8 @@ def delete_approved_clp(plan_id):
 
 
 @teacher_bp.route('/courses/generate', methods=['POST'])
+@ai_limit
+@expensive(COST_AI_GENERATION)
 @login_required
 @roles_required('teacher')
 def generate_clp():
@@ -591,10 +658,11 @@ def generate_clp():
 @login_required
 @roles_required('teacher', 'dean', 'admin')
 def view_clp(plan_id):
-    plan_res = supabase.table('course_learning_plans').select('*, author:users(*)').eq('id', plan_id).single().execute()
+    plan_res = supabase.table('course_learning_plans').select(CLP_LIST_COLUMNS).eq('id', plan_id).single().execute()
     plan = plan_res.data
 
     if not plan: abort(404)
+    plan['author'] = get_user_profile(plan['user_id']) or {}
 
     # --- FIX: Convert the single plan's timestamp string to a datetime object ---
     parsed_plan_list = parse_supabase_timestamp([plan], 'date_posted')
@@ -607,6 +675,8 @@ def view_clp(plan_id):
     if plan['upload_type'] == 'file_upload':
         return render_template('view_uploaded_clp.html', plan=plan)
 
+    # Only the detail page pays for the content blob
+    plan['content'] = load_plan_content(plan_id)
     try:
         content_data = json.loads(plan.get('content', '{}'))
         return render_template('view_ai_clp.html',
@@ -616,6 +686,7 @@ def view_clp(plan_id):
         return render_template('view_clp.html', plan=plan)
 
 @teacher_bp.route('/clp/<int:plan_id>/download')
+@expensive(COST_DOWNLOAD)
 @login_required
 @roles_required('teacher', 'dean', 'admin')
 def download_clp(plan_id):
@@ -640,11 +711,38 @@ def download_clp(plan_id):
         flash(f'Error downloading file: {e}. It may have been deleted from storage.', 'danger')
         return redirect(url_for('teacher.view_clp', plan_id=plan_id))
 
+@teacher_bp.route('/clp/<int:plan_id>/clone', methods=['GET', 'POST'])
+@expensive(COST_UPLOAD, methods=['POST'])
+@login_required
+@roles_required('teacher')
+def clone_clp(plan_id):
+    plan_res = supabase.table('course_learning_plans').select(CLONE_COLUMNS).eq('id', plan_id).single().execute()
+    plan = plan_res.data
+
+    if not plan: abort(404)
+    if not can_clone(plan, session['user_id']): abort(403)
+
+    form = CLPCloneForm()
+    if form.validate_on_submit():
+        try:
+            # Storage copy (or a template re-render), never a new AI generation
+            new_plan_id = clone_plan(plan, session['user_id'], form.subject.data, form.department.data,
+                                     rerender=form.rerender.data)
+            invalidate_dean_summary()
+            flash(f'"{plan["subject"]}" was cloned as a new draft.', 'success')
+            return redirect(url_for('teacher.view_clp', plan_id=new_plan_id))
+        except Exception as e:
+            flash(f"Could not clone the plan: {e}", 'danger')
+    elif request.method == 'GET':
+        form.department.data = plan['department']
+        form.subject.data = plan['subject']
+    return render_template('clone_clp.html', form=form, plan=plan)
+
 @teacher_bp.route('/clp/<int:plan_id>/edit', methods=['GET', 'POST'])
 @login_required
 @roles_required('teacher')
 def edit_clp(plan_id):
-    plan_res = supabase.table('course_learning_plans').select('*').eq('id', plan_id).single().execute()
+    plan_res = supabase.table('course_learning_plans').select(CLP_LIST_COLUMNS).eq('id', plan_id).single().execute()
     plan = plan_res.data
 
     if not plan: abort(404)
@@ -657,28 +755,50 @@ def edit_clp(plan_id):
     form = CLPUpdateForm()
     if form.validate_on_submit():
         update_data = {'department': form.department.data, 'subject': form.subject.data}
-        if form.file.data:
-            # Delete old file from storage if it exists
+        upload_id = request.form.get('upload_id')
+        if form.file.data or upload_id:
+            try:
+                with incoming_file(form.file.data, upload_id, session['user_id']) as (local_path, original_name, content_type):
+                    if not allowed_file(original_name):
+                        raise UploadError("Only .docx and .pdf files are allowed!")
+                    new_filename = secure_filename(original_name)
+                    file_path = f"{session['user_id']}/{datetime.utcnow().timestamp()}_{new_filename}"
+                    upload_to_storage(supabase, file_path, local_path, content_type)
+                    document_text = extract_document_text(local_path, new_filename)
+            except UploadError as e:
+                flash(str(e), 'danger')
+                return redirect(url_for('teacher.edit_clp', plan_id=plan_id))
+
+            # Delete old file from storage once the new one is in place
             if plan.get('filename'):
                 try: supabase.storage.from_(STORAGE_BUCKET_NAME).remove([plan['filename']])
-                except Exception: pass
-            
-            new_filename = secure_filename(form.file.data.filename)
-            file_path = f"{session['user_id']}/{datetime.utcnow().timestamp()}_{new_filename}"
-            supabase.storage.from_(STORAGE_BUCKET_NAME).upload(file=form.file.data.read(), path=file_path, file_options={"content-type": form.file.data.mimetype})
-            update_data.update({'filename': file_path, 'content': None, 'upload_type': 'file_upload'})
+                except Exception as e:
+                    # `flask storage-gc` removes it later
+                    current_app.logger.warning(f"Could not remove replaced file {plan['filename']}: {e}")
+            update_data.update({'filename': file_path, 'content': None, 'upload_type': 'file_upload',
+                                'search_text': build_search_text(document_text)})
+            compare_text = similarity_text(document_text=document_text)
         elif form.content.data:
-            update_data.update({'content': form.content.data, 'filename': None, 'upload_type': 'manual_text'})
+            update_data.update({'content': form.content.data, 'filename': None, 'upload_type': 'manual_text',
+                                'search_text': build_search_text(form.content.data)})
+            compare_text = similarity_text(form.content.data)
+        else:
+            compare_text = None
         
+        update_data, content = split_content(update_data)
         supabase.table('course_learning_plans').update(update_data).eq('id', plan_id).execute()
+        save_plan_content(plan_id, content)
+        if compare_text is not None:
+            index_plan_similarity(plan_id, compare_text)
+        invalidate_dean_summary()
         flash('Plan updated successfully!', 'success')
         return redirect(url_for('teacher.teacher_my_clps'))
         
     elif request.method == 'GET':
         form.department.data = plan['department']
         form.subject.data = plan['subject']
-        if plan['upload_type'] in ['manual_text', 'ai_generated']:
-            form.content.data = plan.get('content') or ''
+        if plan['upload_type'] in CONTENT_UPLOAD_TYPES:
+            form.content.data = load_plan_content(plan_id) or ''
             
     return render_template('edit_clp.html', title='Edit Plan', form=form, plan=plan)
 
@@ -686,7 +806,7 @@ def edit_clp(plan_id):
 @login_required
 @roles_required('teacher')
 def delete_clp(plan_id):
-    plan_res = supabase.table('course_learning_plans').select('*').eq('id', plan_id).eq('user_id', session['user_id']).single().execute()
+    plan_res = supabase.table('course_learning_plans').select('id, status, filename').eq('id', plan_id).eq('user_id', session['user_id']).single().execute()
     plan = plan_res.data
 
     if not plan: abort(404)
@@ -701,6 +821,7 @@ def delete_clp(plan_id):
             supabase.storage.from_(STORAGE_BUCKET_NAME).remove([plan['filename']])
         
         supabase.table('course_learning_plans').delete().eq('id', plan_id).execute()
+        invalidate_dean_summary()
         flash('Your Course Learning Plan has been deleted.', 'success')
     except Exception as e:
         flash(f"An error occurred while deleting: {e}", 'danger')
@@ -714,7 +835,11 @@ def teacher_profile():
     form = ChangePasswordForm()
     if form.validate_on_submit():
         try:
-            supabase.auth.update_user({"password": form.new_password.data})
+            auth_client = session_auth_client()
+            if auth_client is None:
+                flash('Your session has expired. Please log in again to change your password.', 'warning')
+                return redirect(url_for('auth.logout'))
+            auth_client.auth.update_user({"password": form.new_password.data})
             flash('Your password has been changed successfully.', 'success')
             return redirect(url_for('teacher.teacher_profile'))
         except Exception as e:
@@ -723,6 +848,7 @@ def teacher_profile():
     return render_template('teacher_profile.html', form=form, user=get_current_user_profile())
 
 @teacher_bp.route('/check_generation_status')
+@exempt
 @login_required
 def check_generation_status():
     """Returns the list of CLPs currently being generated by the user."""
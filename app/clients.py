@@ -0,0 +1,122 @@
+# app/clients.py
+
+import queue
+import threading
+from contextlib import contextmanager
+
+from flask import current_app, g, has_app_context, session
+
+from app.instrumentation import InstrumentedClient
+
+
+class ClientPool:
+    """
+    Keeps idle Supabase clients (and their keep-alive HTTP connections) for reuse.
+    A client is only ever used by one request or thread at a time. The pool never
+    blocks: when every client is busy a new one is created, and it is dropped on
+    release if more than `size` are already idle.
+    """
+
+    def __init__(self, url, key, size):
+        self.url = url
+        self.key = key
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.created = 0
+
+    def _create(self):
+        from supabase import create_client
+        with self._lock:
+            self.created += 1
+        return InstrumentedClient(create_client(self.url, self.key))
+
+    def acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._create()
+
+    def release(self, client):
+        if self._idle.qsize() < self.size:
+            self._idle.put(client)
+
+    def prefill(self, count=None, probe=None):
+        """
+        Creates clients up front (used by the warm-up step). `probe(client)` runs a
+        cheap request on each so its keep-alive connection is already open.
+        """
+        for _ in range(min(count or self.size, self.size) - self._idle.qsize()):
+            client = self._create()
+            if probe is not None:
+                probe(client)
+            self._idle.put(client)
+
+    @contextmanager
+    def lease(self):
+        client = self.acquire()
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+
+pools = {}
+
+
+class BoundClient:
+    """
+    Module-level stand-in for a Supabase client. Each app context (a request or a
+    background task) gets its own client from the named pool on first use and hands
+    it back at teardown; code outside any app context gets one client per thread.
+    """
+
+    def __init__(self, pool_name):
+        self._pool_name = pool_name
+        self._local = threading.local()
+
+    def _current(self):
+        if has_app_context():
+            bound = g.setdefault('_supabase_clients', {})
+            if self._pool_name not in bound:
+                bound[self._pool_name] = pools[self._pool_name].acquire()
+            return bound[self._pool_name]
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = pools[self._pool_name].acquire()
+        return client
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+
+def init_client_pools(app):
+    size = app.config['SUPABASE_POOL_SIZE']
+    pools['anon'] = ClientPool(app.config['SUPABASE_URL'], app.config['SUPABASE_KEY'], size)
+    pools['service'] = ClientPool(app.config['SUPABASE_URL'], app.config['SUPABASE_SERVICE_KEY'], size)
+
+    @app.teardown_appcontext
+    def release_bound_clients(exc):
+        for pool_name, client in g.pop('_supabase_clients', {}).items():
+            pools[pool_name].release(client)
+
+
+# --- AUTH CLIENTS ---
+# Supabase auth calls store a user session on the client and switch its Authorization
+# header to that user's token, so they must never run on a pooled client.
+
+def new_auth_client():
+    """A throwaway anon client for sign-in/sign-up; never pooled, never shared."""
+    from supabase import create_client
+    return create_client(current_app.config['SUPABASE_URL'], current_app.config['SUPABASE_KEY'])
+
+
+def session_auth_client():
+    """A throwaway client signed in with the tokens saved in the Flask session, or None."""
+    access_token = session.get('sb_access_token')
+    refresh_token = session.get('sb_refresh_token')
+    if not access_token or not refresh_token:
+        return None
+    client = new_auth_client()
+    client.auth.set_session(access_token, refresh_token)
+    return client
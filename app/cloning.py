@@ -0,0 +1,79 @@
+# app/cloning.py
+
+import json
+from datetime import datetime
+
+from werkzeug.utils import secure_filename
+
+# "Clone plan": a new draft for the current teacher built from an existing plan, with no
+# AI generation. The document is copied inside storage (the bytes never pass through
+# the worker) or, for AI plans, optionally re-rendered from the stored content JSON into
+# the target department's current template.
+
+CLONE_COLUMNS = 'id, user_id, subject, department, status, upload_type, filename, search_text'
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+
+def can_clone(plan, user_id):
+    """Teachers reuse their own plans and any approved plan."""
+    return plan['user_id'] == user_id or plan['status'] == 'approved'
+
+
+def _new_path(user_id, subject, extension):
+    return f"{user_id}/{datetime.utcnow().timestamp()}_{secure_filename(subject) or 'clp'}.{extension}"
+
+
+def clone_plan(plan, user_id, subject, department, rerender=False):
+    """
+    Copies `plan` (a CLONE_COLUMNS row) to a new draft owned by `user_id`. With `rerender`,
+    a plan that has content JSON gets a freshly filled DOCX from the department template
+    instead of a copy of its current file. Returns the new plan id.
+    """
+    from app import STORAGE_BUCKET_NAME, supabase
+    from app.plan_content import load_plan_content, parse_content_json, save_plan_content, split_content
+    from app.profiles import get_user_profile
+    from app.similarity import copy_plan_similarity, index_plan_similarity, similarity_text
+    from app.utils import render_clp_docx
+
+    bucket = supabase.storage.from_(STORAGE_BUCKET_NAME)
+    content = load_plan_content(plan['id'])
+    clp_data = parse_content_json(content)
+    filename, upload_type = None, plan['upload_type']
+
+    if clp_data:
+        # Same fields generation fills in, now for the teacher who owns the copy; the dean
+        # review page and later re-renders read them from the content
+        profile = get_user_profile(user_id) or {}
+        clp_data['NAME'] = f"{profile.get('first_name', '')} {profile.get('last_name', '')}".strip()
+        clp_data['TITLE'] = profile.get('title', '')
+        content = json.dumps(clp_data)
+
+    if clp_data and rerender:
+        filename, upload_type = _new_path(user_id, subject, 'docx'), 'file_upload'
+        bucket.upload(path=filename, file=render_clp_docx(clp_data, department),
+                      file_options={"content-type": DOCX_MIMETYPE})
+    elif plan.get('filename'):
+        filename = _new_path(user_id, subject, plan['filename'].rsplit('.', 1)[-1].lower())
+        bucket.copy(plan['filename'], filename)
+
+    fields, new_content = split_content({
+        'department': department, 'subject': subject,
+        'filename': filename, 'upload_type': upload_type,
+        'content': content, 'status': 'draft', 'user_id': user_id,
+        'search_text': plan.get('search_text'),
+    })
+    try:
+        insert_res = supabase.table('course_learning_plans').insert(fields).execute()
+    except Exception:
+        if filename:
+            try: bucket.remove([filename])
+            except Exception: pass  # `flask storage-gc` removes it later
+        raise
+    new_id = insert_res.data[0]['id']
+    save_plan_content(new_id, new_content)
+
+    if clp_data and rerender:
+        index_plan_similarity(new_id, similarity_text(clp_data))
+    else:
+        copy_plan_similarity(plan['id'], new_id)
+    return new_id
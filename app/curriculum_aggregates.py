@@ -0,0 +1,66 @@
+# app/curriculum_aggregates.py
+
+# Program-level statistics come from curriculum_aggregates (migrations/005), one row per
+# department. A trigger on course_learning_plans keeps it current on every insert, status
+# change and delete, including submit, review and bulk deletes; the app's only part is
+# storing each plan's outcome_summary when the dean approves it.
+
+AGGREGATE_COLUMNS = ('department, status_counts, approved_analysed, po_enabled, po_introduced, '
+                     'io_ticked, reviews, review_seconds, updated_at')
+
+
+def _prepare(row):
+    row['total'] = int(sum(row['status_counts'].values()))
+    row['avg_review_hours'] = round(row['review_seconds'] / row['reviews'] / 3600, 1) if row['reviews'] else None
+    return row
+
+
+def get_curriculum_aggregates(department=None):
+    """Aggregate rows ordered by department (one row when `department` is given)."""
+    from app import supabase
+    query = supabase.table('curriculum_aggregates').select(AGGREGATE_COLUMNS)
+    if department:
+        query = query.eq('department', department)
+    return [_prepare(row) for row in query.order('department').execute().data]
+
+
+def approval_fields(plan):
+    """Extra columns for the update that approves `plan`: its outcome_summary, if it has matrices."""
+    from app.analytics import outcome_summary
+    from app.plan_content import load_plan_content
+    # Decided by the content: finished AI plans are stored as 'file_upload' with their JSON kept
+    summary = outcome_summary(load_plan_content(plan['id']))
+    return {'outcome_summary': summary} if summary else {}
+
+
+def backfill_outcome_summaries(batch_size=100):
+    """Stores outcome_summary on approved plans that predate migrations/005. Returns the count."""
+    from app import supabase
+    from app.analytics import outcome_summary
+    from app.plan_content import load_plan_contents
+    stored = 0
+    last_id = 0
+    while True:
+        res = (supabase.table('course_learning_plans').select('id')
+               .eq('status', 'approved').is_('outcome_summary', 'null')
+               .gt('id', last_id).order('id').limit(batch_size).execute())
+        if not res.data:
+            return stored
+        last_id = res.data[-1]['id']
+        contents = load_plan_contents([plan['id'] for plan in res.data], batch_size=batch_size)
+        for plan_id, content in contents.items():
+            summary = outcome_summary(content)
+            if summary:
+                supabase.table('course_learning_plans').update({'outcome_summary': summary}).eq('id', plan_id).execute()
+                stored += 1
+
+
+def rebuild_curriculum_aggregates(backfill=True):
+    """
+    Recomputes the table from the plans (reconciliation after manual edits or a restore).
+    Returns (summaries_backfilled, departments).
+    """
+    from app import supabase
+    backfilled = backfill_outcome_summaries() if backfill else 0
+    departments = supabase.rpc('rebuild_curriculum_aggregates', {}).execute().data
+    return backfilled, departments
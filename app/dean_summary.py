@@ -0,0 +1,77 @@
+# app/dean_summary.py
+
+import threading
+import time
+
+from flask import current_app
+
+# viewer_id -> (expires_at, generation, summary). Status transitions bump the generation,
+# which drops every entry at once; other workers catch up within DEAN_SUMMARY_TTL.
+_summaries = {}
+_generation = 0
+_lock = threading.Lock()
+
+
+def _empty_summary():
+    return {'status_counts': {}, 'department_counts': [], 'pending': [], 'unread_notifications': 0}
+
+
+def _cached(viewer_id):
+    with _lock:
+        entry = _summaries.get(viewer_id)
+        generation = _generation
+    if entry and entry[0] > time.monotonic() and entry[1] == generation:
+        return entry[2], generation
+    return None, generation
+
+
+def _store(viewer_id, generation, summary):
+    with _lock:
+        # Skip if a status change landed while the RPC was running
+        if generation == _generation:
+            _summaries[viewer_id] = (time.monotonic() + current_app.config['DEAN_SUMMARY_TTL'], generation, summary)
+
+
+def _prepare(data):
+    from app.utils import parse_supabase_timestamp
+    summary = {**_empty_summary(), **(data or {})}
+    summary['pending'] = parse_supabase_timestamp(summary['pending'], 'date_posted')
+    summary['total'] = sum(summary['status_counts'].values())
+    return summary
+
+
+def _rpc_params(viewer_id):
+    return {'viewer_id': viewer_id, 'pending_limit': current_app.config['DEAN_SUMMARY_PENDING_LIMIT']}
+
+
+def get_dean_summary(viewer_id):
+    """
+    Counts by status and department, the newest pending plans and the viewer's unread
+    count, from one dean_dashboard_summary RPC call (migrations/004), cached briefly.
+    """
+    summary, generation = _cached(viewer_id)
+    if summary is not None:
+        return summary
+    from app import supabase
+    summary = _prepare(supabase.rpc('dean_dashboard_summary', _rpc_params(viewer_id)).execute().data)
+    _store(viewer_id, generation, summary)
+    return summary
+
+
+async def get_dean_summary_async(client, viewer_id):
+    """get_dean_summary() on an async client (ASYNC_MODE); shares the same cache."""
+    summary, generation = _cached(viewer_id)
+    if summary is not None:
+        return summary
+    res = await client.rpc('dean_dashboard_summary', _rpc_params(viewer_id)).execute()
+    summary = _prepare(res.data)
+    _store(viewer_id, generation, summary)
+    return summary
+
+
+def invalidate_dean_summary():
+    """Call after any write that changes a plan's status, department or existence."""
+    global _generation
+    with _lock:
+        _generation += 1
+        _summaries.clear()
@@ -1,37 +1,85 @@
 # app/decorators.py
 
+import inspect
+import logging
 from functools import wraps
-from flask import session, redirect, url_for, flash, abort
+from flask import session, redirect, url_for, flash, abort, current_app
 
+logger = logging.getLogger(__name__)
+
+
+def _wrap(f, check):
+    """
+    Runs `check` before the view and returns its response if it has one. Keeps the
+    view async when it is async (ASYNC_MODE views), so Flask still awaits it.
+    """
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_async(*args, **kwargs):
+            denied = check()
+            if denied is not None:
+                return denied
+            return await f(*args, **kwargs)
+        return decorated_async
 
-def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        denied = check()
+        if denied is not None:
+            return denied
+        return f(*args, **kwargs)
+    return decorated_function
+
+
+def _session_rejected():
+    """
+    Checks the Supabase access token behind the Flask session (locally, once per
+    request) and logs the user out if it doesn't hold up.
+    """
+    if not current_app.config['SUPABASE_JWT_VERIFY']:
+        return None
+    from app.session_tokens import SessionTokenError, verified_session_claims
+    try:
+        verified_session_claims()
+    except SessionTokenError as e:
+        logger.info(f"Rejected session for user {session.get('user_id')}: {e}")
+        session.clear()
+        flash('Your session has expired. Please log in again.', 'warning')
+        return redirect(url_for('auth.login'))
+    return None
+
+
+def login_required(f):
+    def check():
         # Check for user_id in session, which we set upon successful login.
         if 'user_id' not in session:
             flash('You must be logged in to view this page.', 'warning')
             return redirect(url_for('auth.login'))
-        return f(*args, **kwargs)
-    return decorated_function
+        return _session_rejected()
+    return _wrap(f, check)
 
 def roles_required(*roles):
     def wrapper(f):
-        @wraps(f)
-        def decorated_function(*args, **kwargs):
+        def check():
+            if 'user_id' in session:
+                denied = _session_rejected()
+                if denied is not None:
+                    return denied
             if session.get('role') not in roles:
                 abort(403)  # Forbidden
-            return f(*args, **kwargs)
-        return decorated_function
+        return _wrap(f, check)
     return wrapper
 
 
 
 def admin_required(f):
-    @wraps(f)
-    def decorated_function(*args, **kwargs):
+    def check():
+        if 'user_id' in session:
+            denied = _session_rejected()
+            if denied is not None:
+                return denied
         # Assuming you store role in session['role']
         if 'role' not in session or session['role'] != 'admin':
             flash("You do not have permission to access this page.", "danger")
             return redirect(url_for('main.dashboard'))
-        return f(*args, **kwargs)
-    return decorated_function
+    return _wrap(f, check)
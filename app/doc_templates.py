@@ -0,0 +1,50 @@
+# app/doc_templates.py
+
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+# Used when no department or default template is configured
+FALLBACK_TEMPLATE_KEY = "PBSIT/PBSIT-001-LP-20242.docx"
+
+DEFAULT_TTL = 600
+
+# storage key -> (expires_at, bytes). Template files are a few hundred KB and
+# every AI generation downloads one, so keep them in memory for a while.
+_template_bytes = {}
+_lock = threading.Lock()
+
+
+def _ttl():
+    return current_app.config.get('TEMPLATE_CACHE_TTL', DEFAULT_TTL) if has_app_context() else DEFAULT_TTL
+
+
+def get_template_bytes(template_key):
+    """Downloads a DOCX template from storage, or returns the cached copy."""
+    with _lock:
+        entry = _template_bytes.get(template_key)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+
+    from app import supabase, STORAGE_BUCKET_NAME
+    data = supabase.storage.from_(STORAGE_BUCKET_NAME).download(template_key)
+    with _lock:
+        _template_bytes[template_key] = (time.monotonic() + _ttl(), data)
+    return data
+
+
+def invalidate_template_bytes(template_key=None):
+    """Call when a template file is overwritten or deleted (None clears everything)."""
+    with _lock:
+        if template_key is None:
+            _template_bytes.clear()
+        else:
+            _template_bytes.pop(template_key, None)
+
+
+def default_template_keys():
+    """Storage keys of the templates most generations end up using."""
+    from app.refdata import default_template_key
+    default = default_template_key()
+    return [default, FALLBACK_TEMPLATE_KEY] if default else [FALLBACK_TEMPLATE_KEY]
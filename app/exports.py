@@ -0,0 +1,150 @@
+# app/exports.py
+
+import csv
+import io
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import Response, current_app, stream_with_context
+from werkzeug.utils import secure_filename
+
+from app.pagination import apply_keyset, apply_plan_filters, author_lookup_query, with_author_id
+from app.plan_content import CLP_LIST_COLUMNS, load_plan_content
+
+# Accreditation exports: every plan matching the list filters, as one ZIP that is written
+# while it downloads. Files are fetched from storage a few at a time, ahead of the
+# writer, so memory stays at roughly EXPORT_CONCURRENCY files however big the export is.
+
+EXPORT_COLUMNS = f'{CLP_LIST_COLUMNS}, author:users(username, first_name, last_name)'
+ROW_PAGE_SIZE = 500
+MANIFEST_FIELDS = ['id', 'subject', 'department', 'status', 'upload_type', 'author',
+                   'date_posted', 'archive_path', 'error']
+# Already-compressed formats go in as-is; deflating them again only burns CPU
+STORED_EXTENSIONS = {'docx', 'pdf'}
+
+
+class ExportTooLarge(Exception):
+    """More plans match than EXPORT_MAX_PLANS allows in one archive."""
+
+
+def export_rows(filters):
+    """All plans matching `filters` (metadata only), newest first, read in keyset pages."""
+    from app import supabase
+    limit = current_app.config['EXPORT_MAX_PLANS']
+    lookup = author_lookup_query(supabase, filters)
+    if lookup is not None:
+        # Resolve the author once, not on every page
+        filters = with_author_id(filters, lookup.execute().data)
+    rows, cursor = [], None
+    while True:
+        query = apply_plan_filters(supabase.table('course_learning_plans').select(EXPORT_COLUMNS), filters)
+        query = apply_keyset(query, cursor, 'date_posted')
+        page = query.order('date_posted', desc=True).order('id', desc=True).limit(ROW_PAGE_SIZE).execute().data
+        rows.extend(page)
+        if len(rows) > limit:
+            raise ExportTooLarge(f"{len(rows)}+ plans match; narrow the filters to at most {limit}.")
+        if len(page) < ROW_PAGE_SIZE:
+            return rows
+        cursor = (page[-1]['date_posted'], page[-1]['id'])
+
+
+def _archive_path(plan):
+    folder = secure_filename(plan.get('department') or '') or 'No_Department'
+    stem = secure_filename(plan.get('subject') or '') or 'Untitled'
+    if plan.get('filename'):
+        extension = plan['filename'].rsplit('.', 1)[-1].lower()
+    else:
+        extension = 'txt'
+    return f"{folder}/{stem}_{plan['id']}.{extension}"
+
+
+def _fetch(app, plan):
+    """Runs on the export pool: returns (plan, bytes_or_None, error_or_None)."""
+    from app import STORAGE_BUCKET_NAME, supabase
+    # Own app context, so the thread gets its own pooled client and returns it afterwards
+    with app.app_context():
+        try:
+            if plan.get('filename'):
+                return plan, supabase.storage.from_(STORAGE_BUCKET_NAME).download(plan['filename']), None
+            content = load_plan_content(plan['id'])
+            if content:
+                return plan, content.encode('utf-8'), None
+            return plan, None, 'no file or content'
+        except Exception as e:
+            return plan, None, str(e)
+
+
+def _fetched_in_order(app, rows):
+    """Yields _fetch() results in row order, keeping at most EXPORT_CONCURRENCY downloads in flight."""
+    workers = current_app.config['EXPORT_CONCURRENCY']
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='clp-export') as pool:
+        pending = []
+        for plan in rows:
+            pending.append(pool.submit(_fetch, app, plan))
+            if len(pending) >= workers:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+
+class _ZipSink:
+    """Write-only target for ZipFile; the response drains it after every entry."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _manifest_row(plan, archive_path, error):
+    author = plan.get('author') or {}
+    return {
+        'id': plan['id'], 'subject': plan.get('subject'), 'department': plan.get('department'),
+        'status': plan.get('status'), 'upload_type': plan.get('upload_type'),
+        'author': author.get('username', ''), 'date_posted': plan.get('date_posted'),
+        'archive_path': archive_path if not error else '', 'error': error or '',
+    }
+
+
+def stream_plans_zip(rows):
+    """Generator of ZIP bytes: one entry per plan, then manifest.csv."""
+    app = current_app._get_current_object()
+    sink = _ZipSink()
+    manifest = io.StringIO()
+    writer = csv.DictWriter(manifest, fieldnames=MANIFEST_FIELDS)
+    writer.writeheader()
+
+    # A non-seekable target makes ZipFile write data descriptors, so nothing is rewound
+    with zipfile.ZipFile(sink, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for plan, data, error in _fetched_in_order(app, rows):
+            path = _archive_path(plan)
+            if data is not None:
+                extension = path.rsplit('.', 1)[-1]
+                archive.writestr(path, data, compress_type=zipfile.ZIP_STORED if extension in STORED_EXTENSIONS else None)
+            else:
+                current_app.logger.warning(f"Export skipped CLP {plan['id']}: {error}")
+            writer.writerow(_manifest_row(plan, path, error))
+            yield sink.drain()
+        archive.writestr('manifest.csv', manifest.getvalue())
+    yield sink.drain()
+
+
+def export_response(rows, download_name):
+    return Response(stream_with_context(stream_plans_zip(rows)), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{download_name}"'})
+
+
+def export_filename(filters):
+    from datetime import date
+    scope = secure_filename(filters.get('department') or '') or 'all_departments'
+    return f"clps_{filters.get('status', 'all')}_{scope}_{date.today().isoformat()}.zip"
@@ -13,9 +13,9 @@ from wtforms.validators import DataRequired, Email, Length, Optional, NumberRang
 
 # ... existing imports ...
 from wtforms import (StringField, PasswordField, SubmitField, SelectField,
-                     TextAreaField, HiddenField, EmailField)
+                     TextAreaField, HiddenField, EmailField, BooleanField)
 from wtforms.validators import DataRequired, Length, EqualTo, Regexp, Email, Optional
-from app import supabase
+from app.refdata import department_choices, get_departments
 DEPARTMENT_CHOICES = [
     ('Department of Information Technology', 'Department of Information Technology'),
     ('Department of Engineering', 'Department of Engineering'),
@@ -40,8 +40,8 @@ class GenerateAIForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(GenerateAIForm, self).__init__(*args, **kwargs)
         try:
-            res = supabase.table('departments').select('name').order('name').execute()
-            self.department.choices = [(d['name'], d['name']) for d in res.data]
+            # Cached per process (app/refdata.py); no query per form
+            self.department.choices = department_choices()
         except:
             self.department.choices = []
 
@@ -72,8 +72,8 @@ class SignupForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(SignupForm, self).__init__(*args, **kwargs)
         try:
-            res = supabase.table('departments').select('name').order('name').execute()
-            self.department.choices = [(d['name'], d['name']) for d in res.data]
+            # Cached per process (app/refdata.py); no query per form
+            self.department.choices = department_choices()
         except:
             self.department.choices = []
 
@@ -93,14 +93,26 @@ class CLPUploadForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(CLPUploadForm, self).__init__(*args, **kwargs)
         try:
-            res = supabase.table('departments').select('name').order('name').execute()
-            self.department.choices = [(d['name'], d['name']) for d in res.data]
+            # Cached per process (app/refdata.py); no query per form
+            self.department.choices = department_choices()
         except:
             self.department.choices = []
 
 class CLPUpdateForm(CLPUploadForm):
     submit = SubmitField('Update Plan')
 
+class CLPCloneForm(FlaskForm):
+    department = SelectField('Department', choices=[], validators=[DataRequired()])
+    subject = StringField('Subject Name', validators=[DataRequired(), Length(min=3, max=100)])
+    rerender = BooleanField("Re-render into the department's current template (AI-generated plans)")
+    submit = SubmitField('Clone Plan')
+    def __init__(self, *args, **kwargs):
+        super(CLPCloneForm, self).__init__(*args, **kwargs)
+        try:
+            self.department.choices = department_choices()
+        except:
+            self.department.choices = []
+
 class CLPGenerateForm(FlaskForm):
     subject_name = StringField('Subject Name', validators=[DataRequired(), Length(min=5, max=100)], render_kw={"placeholder": "e.g., Introduction to HCI"})
     department = SelectField('Department', choices=DEPARTMENT_CHOICES, validators=[DataRequired()])
@@ -120,8 +132,7 @@ class ApproveUserForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(ApproveUserForm, self).__init__(*args, **kwargs)
         try:
-            res = supabase.table('departments').select('name').order('name').execute()
-            choices = [(d['name'], d['name']) for d in res.data]
+            choices = department_choices()
             # Add the "No Department" option at the start
             self.assigned_department.choices = [('', 'No Department (e.g., Dean)')] + choices
         except:
@@ -143,8 +154,7 @@ class EditUserForm(FlaskForm):
     def __init__(self, *args, **kwargs):
         super(EditUserForm, self).__init__(*args, **kwargs)
         try:
-            res = supabase.table('departments').select('name').order('name').execute()
-            choices = [(d['name'], d['name']) for d in res.data]
+            choices = department_choices()
             self.department.choices = choices + [('', 'None')]
         except:
             self.department.choices = [('', 'None')]
@@ -164,9 +174,8 @@ class TemplateUploadForm(FlaskForm):
         super(TemplateUploadForm, self).__init__(*args, **kwargs)
         try:
             # Load departments for assignment
-            res = supabase.table('departments').select('id, name').order('name').execute()
             # Choices format: (id, name)
-            self.department.choices = [('', 'None (General Use)')] + [(str(d['id']), d['name']) for d in res.data]
+            self.department.choices = [('', 'None (General Use)')] + [(str(d['id']), d['name']) for d in get_departments()]
         except:
             self.department.choices = [('', 'None')]
 class SystemSettingsForm(FlaskForm):
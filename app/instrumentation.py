@@ -0,0 +1,177 @@
+# app/instrumentation.py
+
+import inspect
+import time
+from collections import Counter
+
+from flask import current_app, g, has_app_context, has_request_context, request
+
+# Filters/modifiers whose first argument is a column name. Recording the column (but never
+# the value) makes "the same query with a different id" collapse into one shape.
+_COLUMN_METHODS = {
+    'eq', 'neq', 'gt', 'gte', 'lt', 'lte', 'like', 'ilike', 'is_', 'in_', 'contains',
+    'contained_by', 'text_search', 'order', 'filter',
+}
+_STORAGE_METHODS = {'upload', 'update', 'download', 'remove', 'list', 'move', 'copy', 'create_signed_url'}
+
+
+class QueryStats:
+    """Per-request (per app context) tally of PostgREST and storage calls."""
+
+    def __init__(self, where):
+        self.where = where
+        self.db_count = 0
+        self.db_ms = 0.0
+        self.storage_count = 0
+        self.storage_ms = 0.0
+        self.shapes = Counter()
+        self.tables = Counter()
+
+    def record(self, kind, table, shape, elapsed_ms):
+        if kind == 'storage':
+            self.storage_count += 1
+            self.storage_ms += elapsed_ms
+        else:
+            self.db_count += 1
+            self.db_ms += elapsed_ms
+        self.tables[table] += 1
+        self.shapes[shape] += 1
+
+    def server_timing(self):
+        return (f'db;dur={self.db_ms:.1f};desc="{self.db_count} queries", '
+                f'storage;dur={self.storage_ms:.1f};desc="{self.storage_count} calls"')
+
+
+def current_stats():
+    if not has_app_context():
+        return None
+    if '_query_stats' not in g:
+        g._query_stats = QueryStats(request.path if has_request_context() else 'background task')
+    return g._query_stats
+
+
+def _record(kind, table, shape, started):
+    stats = current_stats()
+    if stats is not None:
+        stats.record(kind, table, shape, (time.perf_counter() - started) * 1000)
+
+
+class _InstrumentedBuilder:
+    """Proxies a postgrest request builder, tracking the call chain and timing execute()."""
+
+    def __init__(self, builder, table, chain):
+        self._builder = builder
+        self._table = table
+        self._chain = chain
+
+    def __getattr__(self, name):
+        attr = getattr(self._builder, name)
+        if not callable(attr):
+            return attr
+
+        def call(*args, **kwargs):
+            if name == 'select':
+                step = f"select({','.join(map(str, args))})"
+            elif name in _COLUMN_METHODS and args:
+                step = f"{name}({args[0]})"
+            else:
+                step = name
+            result = attr(*args, **kwargs)
+            if hasattr(result, 'execute'):
+                return _InstrumentedBuilder(result, self._table, self._chain + (step,))
+            return result
+        return call
+
+    def execute(self):
+        if inspect.iscoroutinefunction(self._builder.execute):
+            return self._execute_async()
+        started = time.perf_counter()
+        try:
+            return self._builder.execute()
+        finally:
+            _record('db', self._table, f"{self._table}:{'.'.join(self._chain)}", started)
+
+    async def _execute_async(self):
+        # Builders from the async client (ASYNC_MODE); concurrent calls overlap, so
+        # db;dur in Server-Timing is summed query time, not wall time
+        started = time.perf_counter()
+        try:
+            return await self._builder.execute()
+        finally:
+            _record('db', self._table, f"{self._table}:{'.'.join(self._chain)}", started)
+
+
+class _InstrumentedBucket:
+    def __init__(self, bucket, name):
+        self._bucket = bucket
+        self._name = name
+
+    def __getattr__(self, name):
+        attr = getattr(self._bucket, name)
+        if name not in _STORAGE_METHODS:
+            return attr
+
+        def call(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                _record('storage', f"storage:{self._name}", f"storage:{self._name}.{name}", started)
+        return call
+
+
+class _InstrumentedStorage:
+    def __init__(self, storage):
+        self._storage = storage
+
+    def from_(self, bucket):
+        return _InstrumentedBucket(self._storage.from_(bucket), bucket)
+
+    def __getattr__(self, name):
+        return getattr(self._storage, name)
+
+
+class InstrumentedClient:
+    """Thin wrapper around a supabase Client or AsyncClient; anything not wrapped passes straight through."""
+
+    def __init__(self, client):
+        self._client = client
+        self._storage = None
+
+    def table(self, name):
+        return _InstrumentedBuilder(self._client.table(name), name, ())
+
+    from_ = table
+
+    def rpc(self, fn, params=None, *args, **kwargs):
+        return _InstrumentedBuilder(self._client.rpc(fn, params or {}, *args, **kwargs), f"rpc:{fn}", ())
+
+    @property
+    def storage(self):
+        if self._storage is None:
+            self._storage = _InstrumentedStorage(self._client.storage)
+        return self._storage
+
+    def __getattr__(self, name):
+        return getattr(self._client, name)
+
+
+def init_instrumentation(app):
+    """Adds the Server-Timing header and the repeated-query (N+1) warning."""
+
+    @app.after_request
+    def add_server_timing(response):
+        stats = g.get('_query_stats')
+        if stats is not None:
+            response.headers['Server-Timing'] = stats.server_timing()
+        return response
+
+    @app.teardown_appcontext
+    def warn_on_repeated_queries(exc):
+        stats = g.get('_query_stats')
+        if stats is None:
+            return
+        threshold = app.config['QUERY_REPEAT_WARN_THRESHOLD']
+        for shape, count in stats.shapes.items():
+            if count > threshold:
+                current_app.logger.warning(f"Possible N+1 in {stats.where}: '{shape}' ran {count} times.")
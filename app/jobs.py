@@ -0,0 +1,102 @@
+# app/jobs.py
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# plan_id -> (thread, user_id, subject) for every AI generation running in this process
+_generation_jobs = {}
+_lock = threading.Lock()
+
+
+def track_generation_job(plan_id, user_id, subject, thread):
+    with _lock:
+        _generation_jobs[plan_id] = (thread, user_id, subject)
+
+
+def finish_generation_job(plan_id):
+    with _lock:
+        _generation_jobs.pop(plan_id, None)
+
+
+def running_generation_jobs():
+    with _lock:
+        return dict(_generation_jobs)
+
+
+def drain_generation_jobs(app, timeout):
+    """
+    Called when a worker shuts down. Waits up to `timeout` seconds for running
+    generations to finish. Any still running after that are marked 'failed' and
+    their owners told to retry, so no plan is left stuck in 'generating'.
+    Returns the number of jobs that had to be abandoned.
+    """
+    deadline = time.monotonic() + timeout
+    for plan_id, (thread, _, _) in running_generation_jobs().items():
+        thread.join(max(0, deadline - time.monotonic()))
+
+    abandoned = {plan_id: job for plan_id, job in running_generation_jobs().items() if job[0].is_alive()}
+    if abandoned:
+        with app.app_context():
+            from app import supabase
+            from app.notifier import dispatcher, notify_many
+            from app.dean_summary import invalidate_dean_summary
+            for plan_id, (_, user_id, subject) in abandoned.items():
+                logger.warning(f"Shutdown interrupted generation of CLP {plan_id}; marking it failed.")
+                try:
+                    supabase.table('course_learning_plans').update({'status': 'failed'}).eq('id', plan_id).eq('status', 'generating').execute()
+                except Exception as e:
+                    logger.error(f"Could not mark CLP {plan_id} as failed: {e}")
+                notify_many([user_id], f'CLP generation for "{subject}" was interrupted by a server restart. Please generate it again.')
+            invalidate_dean_summary()
+            dispatcher.flush(5)
+    return len(abandoned)
+
+
+# job_id -> thread for every template re-render job (app/rerender.py) running in this process
+_rerender_jobs = {}
+
+
+def track_rerender_job(job_id, thread):
+    with _lock:
+        _rerender_jobs[job_id] = thread
+
+
+def finish_rerender_job(job_id):
+    with _lock:
+        _rerender_jobs.pop(job_id, None)
+
+
+def running_rerender_jobs():
+    with _lock:
+        return dict(_rerender_jobs)
+
+
+def drain_rerender_jobs(app, timeout):
+    """
+    Like drain_generation_jobs() for re-render jobs: waits up to `timeout` seconds, then
+    marks the jobs still running as failed so their rows don't stay 'running' forever.
+    Plans already re-rendered keep their new file. Returns the number abandoned.
+    """
+    deadline = time.monotonic() + timeout
+    for thread in running_rerender_jobs().values():
+        thread.join(max(0, deadline - time.monotonic()))
+
+    abandoned = [job_id for job_id, thread in running_rerender_jobs().items() if thread.is_alive()]
+    if abandoned:
+        with app.app_context():
+            from datetime import datetime, timezone
+            from app.utils import supabase_service
+            for job_id in abandoned:
+                logger.warning(f"Shutdown interrupted template re-render job {job_id}; marking it failed.")
+                try:
+                    supabase_service.table('template_rerender_jobs').update({
+                        'status': 'failed',
+                        'errors': [{'id': None, 'error': 'Interrupted by a server restart. Start the re-render again.'}],
+                        'finished_at': datetime.now(timezone.utc).isoformat(),
+                    }).eq('id', job_id).eq('status', 'running').execute()
+                except Exception as e:
+                    logger.error(f"Could not mark re-render job {job_id} as failed: {e}")
+    return len(abandoned)
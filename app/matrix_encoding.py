@@ -0,0 +1,78 @@
+# app/matrix_encoding.py
+
+# Response formats for the two outcome-matrix generation steps (PO-IO and CO-PO),
+# chosen with AI_MATRIX_ENCODING. "verbose" asks for one JSON property per cell
+# ("IT01_T": "✔"), so property names are most of the output. "compact" asks for one
+# string per row with a character per column ("IT01": "1000100") and expands it here
+# into the same per-cell keys flatten_json() and the templates expect.
+
+ENCODINGS = ('verbose', 'compact')
+BLANK = " "
+
+# Code character in the compact format -> cell value. The values are the verbose enum.
+PO_IO_SYMBOLS = {'1': "✔", '0': BLANK}
+CO_PO_SYMBOLS = {'E': "E", 'I': "I", '-': BLANK}
+
+
+def cell_key(row, column):
+    return f"{row}_{column}"
+
+
+def compact_instructions(columns, symbols):
+    """Appended to the step's prompt in compact mode; the stored prompts describe the verbose keys."""
+    legend = ", ".join(f"'{code}' = {value.strip() or 'blank'}" for code, value in symbols.items())
+    return (f"\n\nAnswer with one string per row instead of one field per cell. Each string has exactly "
+            f"{len(columns)} characters, one per column in this order: {', '.join(columns)}. "
+            f"Use only these characters: {legend}.")
+
+
+def expand_rows(data, rows, columns, symbols, keys=None):
+    """
+    Per-cell values from a compact response, limited to `keys` when given. Cells that are
+    missing or not one of `symbols` come out blank. Returns (cells, invalid_count).
+    """
+    cells, invalid = {}, 0
+    for row in rows:
+        encoded = "".join(str(data.get(row, "")).split())
+        if len(encoded) != len(columns):
+            invalid += abs(len(columns) - len(encoded))
+        for i, column in enumerate(columns):
+            key = cell_key(row, column)
+            if keys is not None and key not in keys:
+                continue
+            value = symbols.get(encoded[i].upper()) if i < len(encoded) else None
+            if value is None:
+                if i < len(encoded):
+                    invalid += 1
+                value = BLANK
+            cells[key] = value
+    return cells, invalid
+
+
+def matrix_step(encoding, rows, columns, symbols, keys=None):
+    """
+    (prompt_suffix, generation_config, decode) for one matrix step. Only cells in `keys`
+    (the template's placeholder manifest; None = all) are requested. The config has no
+    schema properties when the template uses none of the cells. decode(parsed_json)
+    returns (per-cell dict, invalid_count).
+    """
+    used = [(row, column) for row in rows for column in columns
+            if keys is None or cell_key(row, column) in keys]
+    if encoding == 'compact':
+        used_rows = list(dict.fromkeys(row for row, _ in used))
+        description = f"{len(columns)} characters, one per column: {', '.join(columns)}"
+        properties = {row: {"type": "STRING", "description": description} for row in used_rows}
+        suffix = compact_instructions(columns, symbols) if used_rows else ""
+
+        def decode(data):
+            return expand_rows(data, used_rows, columns, symbols, keys)
+    else:
+        enum = list(symbols.values())
+        properties = {cell_key(row, column): {"type": "STRING", "enum": enum} for row, column in used}
+        suffix = ""
+
+        def decode(data):
+            return data, 0
+    config = {"response_mime_type": "application/json",
+              "response_schema": {"type": "OBJECT", "properties": properties, "required": list(properties.keys())}}
+    return suffix, config, decode
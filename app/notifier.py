@@ -0,0 +1,158 @@
+# app/notifier.py
+
+import atexit
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+
+from postgrest.exceptions import APIError as PostgrestAPIError
+
+logger = logging.getLogger(__name__)
+
+# How long the dispatcher keeps collecting rows after the first one arrives,
+# and the most rows it will send in a single insert.
+DEFAULT_BATCH_WINDOW = 0.25
+DEFAULT_MAX_BATCH = 500
+
+
+class NotificationDispatcher:
+    """
+    Collects notification rows on a queue and writes them with one bulk insert
+    per batching window, so request handlers never wait on the notifications table.
+    """
+
+    def __init__(self, batch_window=DEFAULT_BATCH_WINDOW, max_batch=DEFAULT_MAX_BATCH):
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enqueue(self, rows):
+        if not rows:
+            return
+        self._ensure_started()
+        for row in rows:
+            self._queue.put(row)
+
+    def flush(self, timeout=None):
+        """Blocks until everything queued so far has been written (or timeout)."""
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='notification-dispatcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            try:
+                self._write(batch)
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write(self, rows):
+        from app import supabase
+        try:
+            supabase.table('notifications').insert(rows).execute()
+        except PostgrestAPIError as e:
+            logger.error(f"Failed to insert {len(rows)} notifications: {e.message}")
+        except Exception as e:
+            logger.error(f"Failed to insert {len(rows)} notifications: {e}")
+
+
+dispatcher = NotificationDispatcher()
+atexit.register(dispatcher.flush, 5)
+
+
+def notify_many(user_ids, message):
+    """Queues the same message for every user in user_ids (duplicates are dropped)."""
+    seen = set()
+    rows = []
+    for user_id in user_ids:
+        if user_id and user_id not in seen:
+            seen.add(user_id)
+            rows.append({'user_id': user_id, 'message': message})
+    dispatcher.enqueue(rows)
+
+
+# --- RETENTION ---
+
+def collapse_read_notifications(older_than_days=30, batch_size=1000, archive=False, dry_run=False):
+    """
+    Folds read notifications older than the cutoff into one digest row per user per day
+    and removes the originals, keeping the hot notifications table small.
+    With archive=True the originals are copied to notifications_archive before deletion.
+    Returns (rows_collapsed, digests_written).
+    """
+    from app import supabase
+    cutoff = (datetime.now(timezone.utc) - timedelta(days=older_than_days)).isoformat()
+    collapsed = digests = 0
+    offset = 0  # only advances in dry-run mode, where nothing gets deleted
+
+    while True:
+        res = (supabase.table('notifications')
+               .select('id, user_id, message, timestamp')
+               .eq('is_read', True).eq('is_digest', False).lt('timestamp', cutoff)
+               .order('user_id').order('timestamp').order('id')
+               .range(offset, offset + batch_size - 1).execute())
+        rows = res.data
+        if not rows:
+            break
+
+        groups = OrderedDict()
+        for row in rows:
+            groups.setdefault((row['user_id'], row['timestamp'][:10]), []).append(row)
+        # The last group may continue into the next batch; leave it for the next pass
+        # unless it is the only group we have (a single day bigger than batch_size).
+        if len(rows) == batch_size and len(groups) > 1:
+            groups.popitem()
+
+        digest_rows, ids = [], []
+        for (user_id, day), items in groups.items():
+            preview = "; ".join(item['message'][:80] for item in items[-3:])
+            digest_rows.append({
+                'user_id': user_id,
+                'message': f"Digest for {day}: {len(items)} older notification(s). Latest: {preview}",
+                'is_read': True,
+                'is_digest': True,
+                'timestamp': items[-1]['timestamp'],
+            })
+            ids.extend(item['id'] for item in items)
+
+        collapsed += len(ids)
+        digests += len(digest_rows)
+        if dry_run:
+            offset += len(ids)
+            continue
+
+        if archive:
+            archived = [row for items in groups.values() for row in items]
+            supabase.table('notifications_archive').insert(archived).execute()
+        supabase.table('notifications').insert(digest_rows).execute()
+        supabase.table('notifications').delete().in_('id', ids).execute()
+        logger.info(f"Collapsed {len(ids)} notifications into {len(digest_rows)} digests.")
+
+    return collapsed, digests
@@ -0,0 +1,196 @@
+# app/pagination.py
+
+import asyncio
+import base64
+import binascii
+from datetime import datetime, timedelta
+
+from flask import current_app, request
+
+# Hard cap so a crafted ?per_page= can't pull a whole table in one request
+MAX_PAGE_SIZE = 100
+
+
+def encode_cursor(sort_value, row_id):
+    """Packs the (sort value, id) of the last row on a page into an opaque URL-safe token."""
+    raw = f"{sort_value}|{row_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Returns (sort_value, row_id) or None if the token is missing or malformed."""
+    if not token:
+        return None
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        sort_value, row_id = base64.urlsafe_b64decode(padded.encode()).decode().rsplit('|', 1)
+        return sort_value, int(row_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        return None
+
+
+def clamp_page_size(value, default):
+    try:
+        size = int(value)
+    except (TypeError, ValueError):
+        return default
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def apply_keyset(query, cursor, sort_column, id_column='id'):
+    """
+    Adds the "rows after this cursor" filter for a descending (sort_column, id) order.
+    Values are double-quoted so timestamps with ':' and '+' survive PostgREST's or() syntax.
+    """
+    if not cursor:
+        return query
+    sort_value, row_id = cursor
+    return query.or_(
+        f'{sort_column}.lt."{sort_value}",'
+        f'and({sort_column}.eq."{sort_value}",{id_column}.lt.{row_id})'
+    )
+
+
+def split_page(rows, page_size, sort_column, id_column='id'):
+    """
+    Expects page_size + 1 rows (the extra one only signals that a next page exists).
+    Returns (rows_for_this_page, next_cursor_or_None). Call this before any
+    post-processing that rewrites the sort column (e.g. parse_supabase_timestamp).
+    """
+    if len(rows) <= page_size:
+        return rows, None
+    rows = rows[:page_size]
+    last = rows[-1]
+    return rows, encode_cursor(last[sort_column], last[id_column])
+
+
+# --- CLP LISTINGS ---
+
+PLAN_FILTER_ARGS = ('status', 'department', 'author', 'date_from', 'date_to')
+
+
+class Page:
+    """One page of a keyset-paginated listing, as handed to the templates."""
+
+    def __init__(self, items, next_cursor, total, is_first_page, cursor_param):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.total = total
+        self.is_first_page = is_first_page
+        self.cursor_param = cursor_param
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        return None
+
+
+def plan_filters_from_request(args=None, **fixed):
+    """
+    Reads the supported list filters from the query string. Keyword arguments pin a
+    filter regardless of what the user sent (e.g. status='approved' on the public list).
+    """
+    args = request.args if args is None else args
+    filters = {}
+    for key in PLAN_FILTER_ARGS:
+        value = (args.get(key) or '').strip()
+        if value:
+            filters[key] = value
+    filters.update({k: v for k, v in fixed.items() if v is not None})
+    return filters
+
+
+# Matches no users row, so an unknown author yields an empty list rather than every plan
+NO_AUTHOR_ID = '00000000-0000-0000-0000-000000000000'
+
+
+def author_lookup_query(client, filters):
+    """The users query that resolves the author (username) filter, or None if there is nothing to resolve."""
+    if filters.get('user_id') or not filters.get('author'):
+        return None
+    return client.table('users').select('id').eq('username', filters['author']).limit(1)
+
+
+def with_author_id(filters, rows):
+    filters = dict(filters)
+    filters['user_id'] = rows[0]['id'] if rows else NO_AUTHOR_ID
+    return filters
+
+
+def apply_plan_filters(query, filters):
+    """Pushes the list filters down to PostgREST instead of filtering rows in Python."""
+    from app import supabase
+    lookup = author_lookup_query(supabase, filters)
+    if lookup is not None:
+        # The author filter is a username; resolve it once rather than joining on every row
+        filters = with_author_id(filters, lookup.execute().data)
+    if filters.get('status'):
+        query = query.eq('status', filters['status'])
+    if filters.get('department'):
+        query = query.eq('department', filters['department'])
+    if filters.get('user_id'):
+        query = query.eq('user_id', filters['user_id'])
+    date_from = _parse_date(filters.get('date_from'))
+    if date_from:
+        query = query.gte('date_posted', date_from.isoformat())
+    date_to = _parse_date(filters.get('date_to'))
+    if date_to:
+        query = query.lt('date_posted', (date_to + timedelta(days=1)).isoformat())
+    return query
+
+
+def plan_page_queries(client, columns, filters, cursor_param='cursor'):
+    """
+    Builds (without running) the page query and, when ?count=1 asked for it, the count
+    query. Returns (query, count_query_or_None, page_size, cursor). Shared by the sync
+    and async listings; resolve the author filter first (see author_lookup_query).
+    """
+    page_size = clamp_page_size(request.args.get('per_page'), current_app.config['CLP_PAGE_SIZE'])
+    cursor = decode_cursor(request.args.get(cursor_param))
+
+    query = apply_plan_filters(client.table('course_learning_plans').select(columns), filters)
+    query = apply_keyset(query, cursor, 'date_posted')
+    query = query.order('date_posted', desc=True).order('id', desc=True).limit(page_size + 1)
+
+    count_query = None
+    if request.args.get('count') in ('1', 'true', 'yes'):
+        count_query = apply_plan_filters(client.table('course_learning_plans').select('id', count='exact'), filters).limit(1)
+    return query, count_query, page_size, cursor
+
+
+def build_plan_page(rows, total, page_size, cursor, cursor_param):
+    from app.utils import parse_supabase_timestamp
+    rows, next_cursor = split_page(rows, page_size, 'date_posted')
+    return Page(parse_supabase_timestamp(rows, 'date_posted'), next_cursor, total, cursor is None, cursor_param)
+
+
+def paginate_plans(columns, filters, cursor_param='cursor'):
+    """
+    Shared listing for every CLP list page: filters pushed to PostgREST, keyset
+    pagination on (date_posted, id), page size from CLP_PAGE_SIZE or ?per_page=.
+    The exact total is only computed when the request asks for it with ?count=1.
+    """
+    from app import supabase
+    lookup = author_lookup_query(supabase, filters)
+    if lookup is not None:
+        filters = with_author_id(filters, lookup.execute().data)
+    query, count_query, page_size, cursor = plan_page_queries(supabase, columns, filters, cursor_param)
+    res = query.execute()
+    total = count_query.execute().count if count_query is not None else None
+    return build_plan_page(res.data, total, page_size, cursor, cursor_param)
+
+
+async def paginate_plans_async(client, columns, filters, cursor_param='cursor'):
+    """paginate_plans() on an async client (ASYNC_MODE); the page and count queries run concurrently."""
+    lookup = author_lookup_query(client, filters)
+    if lookup is not None:
+        filters = with_author_id(filters, (await lookup.execute()).data)
+    query, count_query, page_size, cursor = plan_page_queries(client, columns, filters, cursor_param)
+    if count_query is not None:
+        res, count_res = await asyncio.gather(query.execute(), count_query.execute())
+        total = count_res.count
+    else:
+        res, total = await query.execute(), None
+    return build_plan_page(res.data, total, page_size, cursor, cursor_param)
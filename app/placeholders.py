@@ -0,0 +1,117 @@
+# app/placeholders.py
+
+import io
+import re
+
+from flask import current_app
+
+# Placeholder manifest of a DOCX template: which of the keys the AI pipeline can fill
+# actually appear in it. Templates use bare keys ("IT01_T", "W1_LO", "course_number")
+# that render_clp_docx replaces as substrings, so a key counts as used when it occurs in
+# any paragraph or table cell the renderer visits. Generation only asks the model for
+# used keys; a template without a manifest gets every key.
+
+MANIFEST_VERSION = 1
+
+# Filled from the "Generate with AI" form (teacher.create_clp_ai) and the user profile
+COURSE_FIELDS = (
+    'subject', 'course_number', 'course_title', 'descriptive_title', 'type_of_course', 'units',
+    'pre_requisite', 'co_requisite', 'credit', 'Contact_hours_per_week', 'class_schedule',
+    'room_assignment', 'department',
+)
+PROFILE_FIELDS = ('NAME', 'TITLE')
+
+WEEK_PREFIXES = [f"W{i}" for i in range(1, 19) if i not in [10, 11, 14, 15, 16, 17]] + ["W1011", "W1415", "W1617"]
+WEEK_SUFFIXES = ["_LO", "_TO", "_Method", "_Assesment", "_LR"]
+
+# Looks like a placeholder: an identifier with an underscore in it ("W1_LO", "L012_IT01")
+_PLACEHOLDER_RE = re.compile(r'\b[A-Za-z][A-Za-z0-9]*_\w*[A-Za-z0-9]\b')
+
+
+def po_io_keys():
+    from app import INSTITUTIONAL_OUTCOMES_HEADERS, PROGRAM_OUTCOMES_HEADERS
+    return [f"{po_code}_{io_header}" for po_code in PROGRAM_OUTCOMES_HEADERS for io_header in INSTITUTIONAL_OUTCOMES_HEADERS]
+
+
+def co_po_keys():
+    from app import COURSE_OUTCOMES, PROGRAM_OUTCOMES_HEADERS
+    return [f"{co['code']}_{po_code}" for co in COURSE_OUTCOMES for po_code in PROGRAM_OUTCOMES_HEADERS]
+
+
+def weekly_keys():
+    return [f"{week_prefix}{suffix}" for week_prefix in WEEK_PREFIXES for suffix in WEEK_SUFFIXES] + ['references']
+
+
+def fillable_keys():
+    """Every key the generation pipeline can put into a template."""
+    return set(po_io_keys()) | set(co_po_keys()) | set(weekly_keys()) | set(COURSE_FIELDS) | set(PROFILE_FIELDS)
+
+
+def template_text(docx_bytes):
+    """Text of the paragraphs and table cells replace_placeholders() visits, one per line."""
+    from docx import Document
+    doc = Document(io.BytesIO(docx_bytes))
+    texts = [para.text for para in doc.paragraphs]
+    for table in doc.tables:
+        for row in table.rows:
+            for cell in row.cells:
+                texts.extend(para.text for para in cell.paragraphs)
+    return "\n".join(texts)
+
+
+def build_manifest(docx_bytes):
+    """
+    {'version', 'keys': fillable keys the template uses, 'unfillable': placeholder-looking
+    tokens nothing fills}. The second list is a heuristic for the admin report only.
+    """
+    text = template_text(docx_bytes)
+    fillable = fillable_keys()
+    keys = sorted(key for key in fillable if key in text)
+    unfillable = sorted({token for token in _PLACEHOLDER_RE.findall(text) if token not in fillable})
+    return {'version': MANIFEST_VERSION, 'keys': keys, 'unfillable': unfillable}
+
+
+def manifest_or_none(docx_bytes, label=''):
+    """build_manifest() that logs and returns None on a file python-docx can't read."""
+    try:
+        return build_manifest(docx_bytes)
+    except Exception as e:
+        current_app.logger.warning(f"Could not scan template {label} for placeholders: {e}")
+        return None
+
+
+def filter_schema(properties, keys):
+    """The schema properties the template uses; all of them when it has no manifest."""
+    if keys is None:
+        return properties
+    return {key: value for key, value in properties.items() if key in keys}
+
+
+def store_template_manifest(template_id, docx_bytes, label=''):
+    """Scans and saves the manifest on the templates row. Returns it (None if unreadable)."""
+    from app import supabase
+    from app.refdata import invalidate_templates
+    manifest = manifest_or_none(docx_bytes, label)
+    supabase.table('templates').update({'placeholder_manifest': manifest}).eq('id', template_id).execute()
+    invalidate_templates()
+    return manifest
+
+
+def rescan_all_templates():
+    """Rebuilds every template's manifest from its stored file. Returns (scanned, failed)."""
+    from app import STORAGE_BUCKET_NAME
+    from app.utils import supabase_service
+    from app.refdata import invalidate_templates
+    bucket = supabase_service.storage.from_(STORAGE_BUCKET_NAME)
+    scanned = failed = 0
+    for row in supabase_service.table('templates').select('id, filename').order('id').execute().data:
+        try:
+            manifest = build_manifest(bucket.download(row['filename']))
+        except Exception as e:
+            current_app.logger.warning(f"Could not scan template {row['filename']}: {e}")
+            failed += 1
+            continue
+        supabase_service.table('templates').update({'placeholder_manifest': manifest}).eq('id', row['id']).execute()
+        scanned += 1
+    invalidate_templates()
+    return scanned, failed
@@ -0,0 +1,75 @@
+# app/plan_content.py
+
+import json
+
+from flask import current_app
+
+# Columns every CLP list view renders. Deliberately excludes `content`, which for
+# AI plans is the full generated JSON and dwarfs the rest of the row.
+CLP_LIST_COLUMNS = 'id, user_id, subject, department, status, upload_type, filename, dean_comments, date_posted'
+
+# Plan types whose detail pages actually display the stored content
+CONTENT_UPLOAD_TYPES = ('manual_text', 'ai_generated')
+
+CONTENT_TABLE = 'course_learning_plan_contents'
+
+_MISSING = object()
+
+
+def _use_side_table():
+    return current_app.config.get('CLP_CONTENT_SIDE_TABLE', False)
+
+
+def load_plan_content(plan_id):
+    """Fetches only the content blob for one plan, from the side table when it is enabled."""
+    from app import supabase
+    if _use_side_table():
+        res = supabase.table(CONTENT_TABLE).select('content').eq('plan_id', plan_id).limit(1).execute()
+        return res.data[0]['content'] if res.data else None
+    res = supabase.table('course_learning_plans').select('content').eq('id', plan_id).limit(1).execute()
+    return res.data[0]['content'] if res.data else None
+
+
+def load_plan_contents(plan_ids, batch_size=100, client=None):
+    """Content blobs for many plans as {plan_id: content}, one `in` query per batch."""
+    from app import supabase
+    client = client or supabase
+    if _use_side_table():
+        table, id_column = CONTENT_TABLE, 'plan_id'
+    else:
+        table, id_column = 'course_learning_plans', 'id'
+    plan_ids = list(plan_ids)
+    contents = {}
+    for i in range(0, len(plan_ids), batch_size):
+        res = (client.table(table).select(f'{id_column}, content')
+               .in_(id_column, plan_ids[i:i + batch_size]).execute())
+        contents.update({row[id_column]: row['content'] for row in res.data})
+    return contents
+
+
+def parse_content_json(content):
+    """The generated JSON of an AI plan as a dict; None for text, failure notes and empty content."""
+    try:
+        data = json.loads(content or '')
+    except (TypeError, ValueError):
+        return None
+    return data if isinstance(data, dict) else None
+
+
+def split_content(fields):
+    """
+    Returns (fields, content). In side-table mode `content` is pulled out of the row
+    so it can be written with save_plan_content(); otherwise the row is left alone
+    and content is a sentinel that makes save_plan_content() a no-op.
+    """
+    if not _use_side_table() or 'content' not in fields:
+        return fields, _MISSING
+    fields = dict(fields)
+    return fields, fields.pop('content')
+
+
+def save_plan_content(plan_id, content):
+    from app import supabase
+    if content is _MISSING:
+        return
+    supabase.table(CONTENT_TABLE).upsert({'plan_id': plan_id, 'content': content}).execute()
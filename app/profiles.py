@@ -0,0 +1,77 @@
+# app/profiles.py
+
+import threading
+import time
+
+from flask import current_app, g, has_app_context
+from postgrest.exceptions import APIError as PostgrestAPIError
+
+# user_id -> (version, expires_at, profile). Entries are dropped by version bump or TTL.
+_profiles = {}
+_versions = {}
+_lock = threading.Lock()
+
+DEFAULT_TTL = 60
+
+
+def _ttl():
+    return current_app.config.get('PROFILE_CACHE_TTL', DEFAULT_TTL) if has_app_context() else DEFAULT_TTL
+
+
+def _request_memo():
+    if not has_app_context():
+        return {}
+    if '_profile_memo' not in g:
+        g._profile_memo = {}
+    return g._profile_memo
+
+
+def cache_user_profile(profile):
+    """Seeds both cache levels with a profile row the caller already fetched."""
+    if not profile or not profile.get('id'):
+        return
+    user_id = profile['id']
+    with _lock:
+        _profiles[user_id] = (_versions.get(user_id, 0), time.monotonic() + _ttl(), profile)
+    _request_memo()[user_id] = profile
+
+
+def get_user_profile(user_id):
+    """
+    Returns the users row for user_id. Memoized on flask.g for the rest of the request
+    and kept in a short-TTL process cache keyed by (user_id, profile version).
+    """
+    if not user_id:
+        return None
+    memo = _request_memo()
+    if user_id in memo:
+        return memo[user_id]
+
+    with _lock:
+        entry = _profiles.get(user_id)
+        version = _versions.get(user_id, 0)
+    if entry and entry[0] == version and entry[1] > time.monotonic():
+        memo[user_id] = entry[2]
+        return entry[2]
+
+    from app import supabase
+    try:
+        res = supabase.table('users').select('*').eq('id', user_id).single().execute()
+    except PostgrestAPIError as e:
+        current_app.logger.error(f"Could not fetch profile for user {user_id}: {e.message}")
+        return None
+    profile = res.data
+    with _lock:
+        # Only store if nobody invalidated the profile while we were fetching it
+        if _versions.get(user_id, 0) == version:
+            _profiles[user_id] = (version, time.monotonic() + _ttl(), profile)
+    memo[user_id] = profile
+    return profile
+
+
+def invalidate_user_profile(user_id):
+    """Call after any write to a users row. Other workers catch up within PROFILE_CACHE_TTL."""
+    with _lock:
+        _versions[user_id] = _versions.get(user_id, 0) + 1
+        _profiles.pop(user_id, None)
+    _request_memo().pop(user_id, None)
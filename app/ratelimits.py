@@ -0,0 +1,55 @@
+# app/ratelimits.py
+
+from flask import current_app, session
+from flask_limiter import Limiter
+from flask_limiter.util import get_remote_address
+
+
+def rate_limit_key():
+    """
+    Logged-in users are limited per account, everyone else per IP. Most of campus
+    sits behind a few NAT addresses, so per-IP limits would pool whole departments.
+    """
+    user_id = session.get('user_id')
+    return f"user:{user_id}" if user_id else f"ip:{get_remote_address()}"
+
+
+# Created here (not in create_app) so blueprints can decorate routes at import time.
+# Storage, defaults and headers come from the RATELIMIT_* config set in create_app.
+limiter = Limiter(key_func=rate_limit_key)
+
+
+def _config_limit(key):
+    # Resolved per request, so limits can be tuned through config/env without code changes
+    return lambda: current_app.config[key]
+
+
+# --- LIMIT CLASSES ---
+# Every route gets RATELIMIT_DEFAULT (cost 1) unless exempted. Routes below add
+# their class on top of it (override_defaults=False keeps the default counting).
+
+# Cheap polling and server-to-server endpoints (ONLYOFFICE fetches and callbacks)
+exempt = limiter.exempt
+
+# Sign-in/sign-up attempts, always per IP since there is no session yet
+auth_limit = limiter.limit(_config_limit('RATELIMIT_AUTH'), key_func=get_remote_address,
+                           methods=['POST'], override_defaults=False)
+
+# Starting an AI generation: a hard cap on top of the expensive budget below
+ai_limit = limiter.limit(_config_limit('RATELIMIT_AI'), methods=['POST'], override_defaults=False)
+
+# Relative weight of one call against the shared RATELIMIT_EXPENSIVE budget (a page view is 1)
+COST_AI_GENERATION = 20
+COST_UPLOAD = 5
+COST_SEARCH = 2
+COST_DOWNLOAD = 2
+COST_EXPORT = 30
+
+
+def expensive(cost, methods=None):
+    """
+    Draws `cost` units from a per-user budget (RATELIMIT_EXPENSIVE) that all costly
+    routes share, so heavy use of one feature also slows down the others.
+    """
+    return limiter.shared_limit(_config_limit('RATELIMIT_EXPENSIVE'), scope='expensive',
+                                methods=methods, cost=cost, override_defaults=False)
@@ -0,0 +1,111 @@
+# app/refdata.py
+
+import threading
+import time
+
+from flask import current_app, has_app_context
+
+# Small, rarely-changing lookup tables shared by every form and the AI generation task.
+# name -> (expires_at, value). Writers call the invalidate_* helpers; other workers
+# catch up within REFDATA_CACHE_TTL.
+_cache = {}
+_lock = threading.Lock()
+
+DEFAULT_TTL = 300
+
+
+def _ttl():
+    return current_app.config.get('REFDATA_CACHE_TTL', DEFAULT_TTL) if has_app_context() else DEFAULT_TTL
+
+
+def _cached(name, loader):
+    with _lock:
+        entry = _cache.get(name)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    # Errors propagate and nothing is cached, so a failed load is retried next time
+    value = loader()
+    with _lock:
+        _cache[name] = (time.monotonic() + _ttl(), value)
+    return value
+
+
+# --- DEPARTMENTS ---
+
+def _load_departments():
+    from app import supabase
+    return supabase.table('departments').select('id, name').order('name').execute().data
+
+
+def get_departments():
+    """All departments as [{'id', 'name'}], ordered by name."""
+    return _cached('departments', _load_departments)
+
+
+def department_names():
+    return [d['name'] for d in get_departments()]
+
+
+def department_choices():
+    """(name, name) pairs for the department SelectFields."""
+    return [(name, name) for name in department_names()]
+
+
+def department_names_for_display():
+    """department_names() for templates: a lookup failure shouldn't break the page."""
+    try:
+        return department_names()
+    except Exception as e:
+        current_app.logger.warning(f"Could not load departments: {e}")
+        return []
+
+
+def invalidate_departments():
+    with _lock:
+        _cache.pop('departments', None)
+        # The template mapping is keyed by department, so it goes too
+        _cache.pop('templates', None)
+
+
+# --- DOCX TEMPLATES BY DEPARTMENT ---
+
+def _load_templates():
+    from app import supabase
+    rows = (supabase.table('templates').select('filename, department_id, is_default, placeholder_manifest')
+            .order('created_at', desc=True).execute().data)
+    by_department = {}
+    default = None
+    manifests = {}
+    for row in rows:
+        if row.get('placeholder_manifest'):
+            manifests[row['filename']] = row['placeholder_manifest']
+        # Newest template wins when a department has several
+        if row.get('department_id') is not None:
+            by_department.setdefault(row['department_id'], row['filename'])
+        if row.get('is_default') and default is None:
+            default = row['filename']
+    return {'by_department': by_department, 'default': default, 'manifests': manifests}
+
+
+def template_key_for_department(department_name):
+    """Storage key of the department's template, else the global default, else None."""
+    templates = _cached('templates', _load_templates)
+    dept_ids = [d['id'] for d in get_departments() if d['name'] == department_name]
+    if dept_ids and dept_ids[0] in templates['by_department']:
+        return templates['by_department'][dept_ids[0]]
+    return templates['default']
+
+
+def default_template_key():
+    return _cached('templates', _load_templates)['default']
+
+
+def template_placeholder_keys(template_key):
+    """Set of pipeline keys the template uses (app/placeholders.py), or None if it hasn't been scanned."""
+    manifest = _cached('templates', _load_templates)['manifests'].get(template_key)
+    return set(manifest['keys']) if manifest else None
+
+
+def invalidate_templates():
+    with _lock:
+        _cache.pop('templates', None)
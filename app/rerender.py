@@ -0,0 +1,172 @@
+# app/rerender.py
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+from flask import current_app
+
+# Re-renders existing AI plans into a changed DOCX template: the stored content JSON is
+# filled into the template again (utils.render_clp_docx) and the plan's file is
+# overwritten in place. No model calls. Only plans teachers can still edit are touched;
+# pending and approved documents stay exactly as reviewed.
+
+EDITABLE_STATUSES = ('draft', 'returned_for_revision')
+DOCX_MIMETYPE = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+PAGE_SIZE = 100
+# Progress is written to template_rerender_jobs (migrations/007) at most this often
+PROGRESS_INTERVAL = 2.0
+MAX_REPORTED_ERRORS = 50
+MAX_REPORTED_KEYS = 10
+
+
+def candidate_plans(client, template_key):
+    """Editable plans with a file whose department currently renders with `template_key` (no content)."""
+    from app.doc_templates import FALLBACK_TEMPLATE_KEY
+    from app.refdata import template_key_for_department
+    plans, last_id = [], 0
+    while True:
+        page = (client.table('course_learning_plans').select('id, subject, department, filename')
+                .in_('status', list(EDITABLE_STATUSES)).not_.is_('filename', 'null')
+                .gt('id', last_id).order('id').limit(PAGE_SIZE).execute().data)
+        plans.extend(plan for plan in page
+                     if (template_key_for_department(plan['department']) or FALLBACK_TEMPLATE_KEY) == template_key)
+        if len(page) < PAGE_SIZE:
+            return plans
+        last_id = page[-1]['id']
+
+
+def _rerender_one(app, client, plan, clp_data):
+    """Runs on the pool: returns None or the error message."""
+    from app import STORAGE_BUCKET_NAME
+    from app.utils import render_clp_docx
+    with app.app_context():
+        try:
+            client.storage.from_(STORAGE_BUCKET_NAME).update(
+                path=plan['filename'], file=render_clp_docx(clp_data, plan['department']),
+                file_options={"content-type": DOCX_MIMETYPE, "upsert": "true"})
+            return None
+        except Exception as e:
+            return str(e)
+
+
+def rerender_plans(template_key, dry_run=False, progress=None, workers=None):
+    """
+    Re-renders every candidate plan that has content JSON, `workers` at a time
+    (RERENDER_CONCURRENCY). `progress(stats)` is called after every page. With `dry_run`
+    nothing is written and stats['plans'] lists what would be re-rendered.
+    stats['incomplete'] lists plans whose content lacks fields the template's placeholder
+    manifest uses (generated for a template with fewer fields); those come out blank.
+    Returns the stats dict: total, done, skipped, failed, plans, errors, incomplete.
+    """
+    from app.plan_content import load_plan_contents, parse_content_json
+    from app.refdata import template_placeholder_keys
+    from app.utils import flatten_json, supabase_service
+    app = current_app._get_current_object()
+    template_keys = template_placeholder_keys(template_key)
+    # Plans of every teacher and their files, so this runs with the service key
+    client = supabase_service
+    plans = candidate_plans(client, template_key)
+    stats = {'total': len(plans), 'done': 0, 'skipped': 0, 'failed': 0, 'plans': [], 'errors': [], 'incomplete': []}
+    if progress:
+        progress(stats)
+
+    workers = workers or current_app.config['RERENDER_CONCURRENCY']
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='clp-rerender') as pool:
+        for start in range(0, len(plans), PAGE_SIZE):
+            page = plans[start:start + PAGE_SIZE]
+            contents = load_plan_contents([plan['id'] for plan in page], client=client)
+            renderable = []
+            for plan in page:
+                clp_data = parse_content_json(contents.get(plan['id']))
+                if clp_data is None:
+                    # Uploaded documents have nothing to re-render from
+                    stats['skipped'] += 1
+                    continue
+                missing = sorted(template_keys - flatten_json(clp_data).keys()) if template_keys else []
+                if missing and len(stats['incomplete']) < MAX_REPORTED_ERRORS:
+                    stats['incomplete'].append({'id': plan['id'], 'subject': plan['subject'],
+                                                'missing': len(missing), 'keys': missing[:MAX_REPORTED_KEYS]})
+                if dry_run:
+                    stats['done'] += 1
+                    stats['plans'].append({'id': plan['id'], 'subject': plan['subject'], 'department': plan['department']})
+                else:
+                    renderable.append((plan, clp_data))
+            futures = [(plan, pool.submit(_rerender_one, app, client, plan, clp_data)) for plan, clp_data in renderable]
+            for plan, future in futures:
+                error = future.result()
+                if error:
+                    stats['failed'] += 1
+                    if len(stats['errors']) < MAX_REPORTED_ERRORS:
+                        stats['errors'].append({'id': plan['id'], 'error': error})
+                    current_app.logger.warning(f"Re-render of CLP {plan['id']} failed: {error}")
+                else:
+                    stats['done'] += 1
+            if progress:
+                progress(stats)
+    return stats
+
+
+# --- BACKGROUND JOBS ---
+
+def _job_fields(stats):
+    return {key: stats[key] for key in ('total', 'done', 'skipped', 'failed', 'plans', 'errors', 'incomplete')}
+
+
+def _run_job(app, job_id, template_key, dry_run):
+    from app.jobs import finish_rerender_job
+    try:
+        _run_job_in_context(app, job_id, template_key, dry_run)
+    finally:
+        finish_rerender_job(job_id)
+
+
+def _run_job_in_context(app, job_id, template_key, dry_run):
+    from app.utils import supabase_service
+    with app.app_context():
+        last_write = [0.0]
+
+        def progress(stats):
+            if time.monotonic() - last_write[0] < PROGRESS_INTERVAL:
+                return
+            last_write[0] = time.monotonic()
+            try:
+                supabase_service.table('template_rerender_jobs').update(_job_fields(stats)).eq('id', job_id).execute()
+            except Exception as e:
+                # A missed progress write must not stop the job
+                current_app.logger.warning(f"Could not record progress of re-render job {job_id}: {e}")
+
+        try:
+            stats = rerender_plans(template_key, dry_run=dry_run, progress=progress)
+            fields = {**_job_fields(stats), 'status': 'finished'}
+        except Exception as e:
+            current_app.logger.error(f"Template re-render job {job_id} failed: {e}")
+            fields = {'status': 'failed', 'errors': [{'id': None, 'error': str(e)}]}
+        fields['finished_at'] = datetime.now(timezone.utc).isoformat()
+        try:
+            supabase_service.table('template_rerender_jobs').update(fields).eq('id', job_id).execute()
+        except Exception as e:
+            current_app.logger.error(f"Could not record the result of re-render job {job_id}: {e}")
+
+
+def start_rerender_job(template_key, dry_run, user_id):
+    """Records the job and starts it on a background thread. Returns the job id."""
+    from app.jobs import track_rerender_job
+    from app.utils import supabase_service
+    res = supabase_service.table('template_rerender_jobs').insert({
+        'template_key': template_key, 'dry_run': dry_run, 'created_by': user_id,
+    }).execute()
+    job_id = res.data[0]['id']
+    thread = threading.Thread(target=_run_job, args=(current_app._get_current_object(), job_id, template_key, dry_run),
+                              name=f'rerender-job-{job_id}', daemon=True)
+    # Tracked so a shutting-down worker waits for it or marks it failed (app/jobs.py, gunicorn.conf.py)
+    track_rerender_job(job_id, thread)
+    thread.start()
+    return job_id
+
+
+def get_rerender_job(job_id):
+    from app.utils import supabase_service
+    res = supabase_service.table('template_rerender_jobs').select('*').eq('id', job_id).limit(1).execute()
+    return res.data[0] if res.data else None
@@ -0,0 +1,105 @@
+# app/search.py
+
+import io
+import json
+
+from flask import current_app
+
+# tsvector values are capped at 1MB; plans never need anywhere near that for search
+MAX_SEARCH_TEXT_CHARS = 200_000
+
+
+def extract_document_text(source, filename):
+    """
+    Pulls plain text out of an uploaded .docx or .pdf (see ALLOWED_EXTENSIONS).
+    `source` is the file's bytes or the path of a spooled copy (app/uploads.py).
+    """
+    if not source or not filename:
+        return ''
+    if isinstance(source, bytes):
+        source = io.BytesIO(source)
+    extension = filename.rsplit('.', 1)[-1].lower()
+    try:
+        if extension == 'docx':
+            from docx import Document
+            doc = Document(source)
+            parts = [p.text for p in doc.paragraphs]
+            for table in doc.tables:
+                for row in table.rows:
+                    parts.extend(cell.text for cell in row.cells)
+            return '\n'.join(part for part in parts if part.strip())
+        if extension == 'pdf':
+            from pypdf import PdfReader
+            reader = PdfReader(source)
+            return '\n'.join(page.extract_text() or '' for page in reader.pages)
+    except Exception as e:
+        current_app.logger.warning(f"Could not extract text from {filename} for search: {e}")
+    return ''
+
+
+def content_search_text(content):
+    """Body text for AI plans (the generated JSON's values) or manual text plans."""
+    if not content:
+        return ''
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except (json.JSONDecodeError, TypeError):
+            return content
+    if isinstance(content, dict):
+        # Matrix cells are just "✔"/"E"/"I"; keep only values that carry words
+        return '\n'.join(str(v) for v in content.values() if isinstance(v, str) and len(v.strip()) > 1)
+    return str(content)
+
+
+def build_search_text(*parts):
+    text = '\n'.join(part for part in parts if part)
+    return text[:MAX_SEARCH_TEXT_CHARS]
+
+
+def index_plan_text(plan_id, text):
+    """Stores the extracted body text; the generated search_vector column updates with it."""
+    from app import supabase
+    try:
+        supabase.table('course_learning_plans').update({'search_text': build_search_text(text)}).eq('id', plan_id).execute()
+    except Exception as e:
+        current_app.logger.error(f"Failed to update search index for CLP {plan_id}: {e}")
+
+
+def search_plans(query, viewer_id, include_all=False, limit=20):
+    """
+    Ranked full-text search over subject, department, author and body text,
+    served by the search_clps RPC (migrations/003) off a GIN index.
+    """
+    from app import supabase
+    res = supabase.rpc('search_clps', {
+        'q': query,
+        'viewer_id': viewer_id,
+        'include_all': include_all,
+        'max_results': limit,
+    }).execute()
+    return res.data or []
+
+
+def reindex_all_plans(batch_size=100):
+    """Backfills search_text for every plan (used after migrations/003). Returns the count."""
+    from app import supabase, STORAGE_BUCKET_NAME
+    from app.plan_content import load_plan_content
+    indexed = 0
+    last_id = 0
+    while True:
+        res = (supabase.table('course_learning_plans').select('id, filename')
+               .gt('id', last_id).order('id').limit(batch_size).execute())
+        if not res.data:
+            return indexed
+        for plan in res.data:
+            last_id = plan['id']
+            text = content_search_text(load_plan_content(plan['id']))
+            if plan.get('filename'):
+                try:
+                    file_bytes = supabase.storage.from_(STORAGE_BUCKET_NAME).download(plan['filename'])
+                    text = build_search_text(text, extract_document_text(file_bytes, plan['filename']))
+                except Exception as e:
+                    current_app.logger.warning(f"Skipping file text for CLP {plan['id']}: {e}")
+            index_plan_text(plan['id'], text)
+            indexed += 1
@@ -0,0 +1,310 @@
+# app/session_tokens.py
+
+import hashlib
+import json
+import logging
+import threading
+import time
+
+from flask import current_app, g, session
+
+logger = logging.getLogger(__name__)
+
+# The Supabase access token saved at login is checked on every request without a round
+# trip: HS256 tokens against SUPABASE_JWT_SECRET, asymmetric ones against the project's
+# JWKS (fetched once, cached). Tokens close to expiry are refreshed during the request,
+# at most once per refresh token across workers (see REFRESH below).
+
+
+class SessionTokenError(Exception):
+    """The session's access token is missing, invalid, expired or not the session's user."""
+
+
+# --- KEYS ---
+
+# The only algorithms accepted for each kind of key; the token header merely picks one
+SECRET_ALGORITHMS = ('HS256',)
+# JWKS algorithm -> the key type (kty) it needs
+JWKS_ALGORITHMS = {'RS256': 'RSA', 'ES256': 'EC'}
+
+_jwks_clients = {}
+_jwks_lock = threading.Lock()
+
+
+def _jwks_client(url):
+    from jwt import PyJWKClient
+    with _jwks_lock:
+        client = _jwks_clients.get(url)
+        if client is None:
+            client = _jwks_clients[url] = PyJWKClient(
+                url, cache_keys=True, lifespan=current_app.config['SUPABASE_JWKS_CACHE_TTL'])
+        return client
+
+
+# Tokens we could only check remotely (HS256 without SUPABASE_JWT_SECRET):
+# sha256(token) -> (expires_at, claims). One auth round trip per token, not per request.
+_remote_verified = {}
+_remote_lock = threading.Lock()
+
+
+def _verify_remotely(token):
+    import jwt
+    digest = hashlib.sha256(token.encode()).hexdigest()
+    now = time.time()
+    with _remote_lock:
+        entry = _remote_verified.get(digest)
+        if entry and entry[0] > now:
+            return entry[1]
+
+    from app.clients import new_auth_client
+    try:
+        user = new_auth_client().auth.get_user(token)
+    except Exception as e:
+        raise SessionTokenError(f"Auth server rejected the token: {e}") from e
+    if not user or not user.user:
+        raise SessionTokenError("Auth server rejected the token")
+
+    claims = jwt.decode(token, options={'verify_signature': False})
+    if claims.get('sub') != user.user.id:
+        raise SessionTokenError("Token subject does not match the auth server's user")
+    with _remote_lock:
+        for key in [k for k, (exp, _) in _remote_verified.items() if exp <= now]:
+            del _remote_verified[key]
+        _remote_verified[digest] = (claims.get('exp', now), claims)
+    return claims
+
+
+def verify_access_token(token):
+    """Returns the token's claims, or raises SessionTokenError."""
+    import jwt
+    config = current_app.config
+    try:
+        alg = jwt.get_unverified_header(token).get('alg')
+        if alg in SECRET_ALGORITHMS:
+            if not config['SUPABASE_JWT_SECRET']:
+                return _verify_remotely(token)
+            key, algorithms = config['SUPABASE_JWT_SECRET'], list(SECRET_ALGORITHMS)
+        elif alg in JWKS_ALGORITHMS:
+            signing_key = _jwks_client(config['SUPABASE_JWKS_URL']).get_signing_key_from_jwt(token)
+            if signing_key.key_type != JWKS_ALGORITHMS[alg]:
+                raise SessionTokenError(f"Token algorithm {alg} does not match its {signing_key.key_type} key")
+            key, algorithms = signing_key.key, [alg]
+        else:
+            raise SessionTokenError(f"Token algorithm {alg!r} is not accepted")
+        return jwt.decode(token, key, algorithms=algorithms, audience=config['SUPABASE_JWT_AUDIENCE'],
+                          leeway=config['SUPABASE_JWT_LEEWAY'], options={'require': ['exp', 'sub']})
+    except SessionTokenError:
+        raise
+    except jwt.PyJWTError as e:
+        raise SessionTokenError(str(e)) from e
+
+
+# --- REFRESH ---
+# Supabase rotates refresh tokens and revokes the session when a spent one is used again,
+# which two tabs or two workers holding the same cookie would otherwise do. A refresh
+# first claims the old token in a shared store (SUPABASE_REFRESH_STORE_URI: Redis, else
+# this process only) and publishes the rotated pair there; every other request carrying
+# the old token takes that pair instead of spending the token a second time.
+
+# How long a rotated pair stays available: an access token's lifetime (Supabase's
+# default), so a request still holding the old cookie later on finds its successor too.
+ROTATION_TTL = 3600
+_POLL_INTERVAL = 0.1
+
+
+class _LocalRotations:
+    """Per-process store: enough for a single worker."""
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def _live(self, name):
+        entry = self._entries.get(name)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        self._entries.pop(name, None)
+        return None
+
+    def claim(self, key, ttl):
+        with self._lock:
+            if self._live('claim:' + key) is not None:
+                return False
+            self._entries['claim:' + key] = (time.monotonic() + ttl, True)
+            return True
+
+    def claimed(self, key):
+        with self._lock:
+            return self._live('claim:' + key) is not None
+
+    def release(self, key):
+        with self._lock:
+            self._entries.pop('claim:' + key, None)
+
+    def publish(self, key, tokens):
+        now = time.monotonic()
+        with self._lock:
+            for name in [name for name, entry in self._entries.items() if entry[0] <= now]:
+                del self._entries[name]
+            self._entries['tokens:' + key] = (now + ROTATION_TTL, tuple(tokens))
+
+    def get(self, key):
+        with self._lock:
+            return self._live('tokens:' + key)
+
+
+class _RedisRotations:
+    """
+    Shared across workers and hosts; keys expire on their own. While Redis is unreachable
+    every operation falls back to a per-process store, like the rate limiter does.
+    """
+
+    def __init__(self, url, prefix):
+        import redis
+        self._redis = redis.Redis.from_url(url, socket_timeout=2)
+        self._errors = redis.RedisError
+        self._prefix = f"{prefix}:session-refresh:"
+        self._fallback = _LocalRotations()
+
+    def _call(self, operation, fallback):
+        try:
+            return operation()
+        except self._errors as e:
+            logger.warning(f"Session refresh store unavailable, coordinating in this process only: {e}")
+            return fallback()
+
+    def claim(self, key, ttl):
+        return self._call(lambda: bool(self._redis.set(self._prefix + 'claim:' + key, 1, nx=True, ex=int(ttl))),
+                          lambda: self._fallback.claim(key, ttl))
+
+    def claimed(self, key):
+        return self._call(lambda: bool(self._redis.exists(self._prefix + 'claim:' + key)),
+                          lambda: self._fallback.claimed(key))
+
+    def release(self, key):
+        self._fallback.release(key)
+        self._call(lambda: self._redis.delete(self._prefix + 'claim:' + key), lambda: None)
+
+    def publish(self, key, tokens):
+        # Also kept locally: this worker's next request finds it even if Redis just went away
+        self._fallback.publish(key, tokens)
+        self._call(lambda: self._redis.set(self._prefix + 'tokens:' + key, json.dumps(list(tokens)), ex=ROTATION_TTL),
+                   lambda: None)
+
+    def get(self, key):
+        def shared():
+            value = self._redis.get(self._prefix + 'tokens:' + key)
+            return tuple(json.loads(value)) if value else self._fallback.get(key)
+        return self._call(shared, lambda: self._fallback.get(key))
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def _rotation_store():
+    global _store
+    with _store_lock:
+        if _store is None:
+            url = current_app.config['SUPABASE_REFRESH_STORE_URI']
+            if url.startswith(('redis://', 'rediss://', 'unix://')):
+                _store = _RedisRotations(url, current_app.config['RATELIMIT_KEY_PREFIX'])
+            else:
+                if not url.startswith('memory://'):
+                    logger.warning(f"Session refresh store {url!r} is not Redis; refreshes are only coordinated per process")
+                _store = _LocalRotations()
+        return _store
+
+
+def _refresh(refresh_token):
+    from app.clients import new_auth_client
+    response = new_auth_client().auth.refresh_session(refresh_token)
+    return response.session.access_token, response.session.refresh_token
+
+
+def _rotated_tokens(refresh_token):
+    """
+    The (access, refresh) pair that replaces `refresh_token`. Refreshes at most once
+    per token across the workers sharing the store; other callers wait for that result.
+    """
+    store = _rotation_store()
+    key = hashlib.sha256(refresh_token.encode()).hexdigest()
+    tokens = store.get(key)
+    if tokens:
+        return tokens
+
+    timeout = current_app.config['SUPABASE_REFRESH_TIMEOUT']
+    if store.claim(key, timeout + 5):
+        try:
+            tokens = _refresh(refresh_token)
+        except Exception as e:
+            store.release(key)
+            raise SessionTokenError(f"Could not refresh the session: {e}") from e
+        try:
+            store.publish(key, tokens)
+        except Exception as e:
+            # The old token is spent either way; this request still gets the new pair
+            logger.warning(f"Could not publish the rotated session tokens: {e}")
+        return tokens
+
+    # Another request is spending this token right now
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(_POLL_INTERVAL)
+        tokens = store.get(key)
+        if tokens:
+            return tokens
+        if not store.claimed(key):
+            raise SessionTokenError("A concurrent session refresh failed")
+    raise SessionTokenError("Timed out waiting for a concurrent session refresh")
+
+
+def _store_tokens(tokens):
+    session['sb_access_token'], session['sb_refresh_token'] = tokens
+
+
+# --- SESSION CHECK ---
+
+def verified_session_claims():
+    """
+    Verifies the access token in the Flask session (once per request) and returns its
+    claims. A token close to expiry, or already expired, is swapped for the rotated pair
+    (_rotated_tokens). Raises SessionTokenError if the session can't be trusted.
+    """
+    if '_session_claims' in g:
+        return g._session_claims
+
+    access_token = session.get('sb_access_token')
+    refresh_token = session.get('sb_refresh_token')
+    if not access_token or not refresh_token:
+        raise SessionTokenError("No Supabase session")
+
+    try:
+        claims = verify_access_token(access_token)
+    except SessionTokenError:
+        import jwt
+        try:
+            expired = jwt.decode(access_token, options={'verify_signature': False}).get('exp', 0) <= time.time()
+        except jwt.PyJWTError:
+            expired = False
+        if not expired:
+            raise
+        tokens = _rotated_tokens(refresh_token)
+        _store_tokens(tokens)
+        claims = verify_access_token(tokens[0])
+    else:
+        if claims['exp'] - time.time() < current_app.config['SUPABASE_REFRESH_MARGIN']:
+            try:
+                tokens = _rotated_tokens(refresh_token)
+                claims = verify_access_token(tokens[0])
+                _store_tokens(tokens)
+            except SessionTokenError as e:
+                # The current token is still good; retry on a later request
+                logger.warning(f"Session refresh ahead of expiry failed: {e}")
+
+    if claims['sub'] != session.get('user_id'):
+        raise SessionTokenError("Token belongs to a different user")
+
+    g._session_claims = claims
+    return claims
+
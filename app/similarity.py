@@ -0,0 +1,173 @@
+# app/similarity.py
+
+import hashlib
+import json
+import re
+from functools import lru_cache
+
+from flask import current_app
+
+# Near-duplicate CLPs via MinHash + LSH (migrations/006). A plan's text is cut into word
+# shingles, each shingle hashed under NUM_PERM random permutations and the minimum kept:
+# the share of equal slots between two signatures estimates the Jaccard similarity of
+# their shingle sets. The signature is split into BANDS bands; plans sharing a band
+# bucket become candidates, so a lookup never compares against the whole corpus.
+# With 32 bands of 4 rows, pairs at ~0.45 similarity are found half the time and pairs
+# at 0.7+ almost always.
+
+NUM_PERM = 128
+BANDS = 32
+SHINGLE_SIZE = 5
+# Texts shorter than this many shingles are too small to compare meaningfully
+MIN_SHINGLES = 20
+# Signatures are stored, so every process must draw the same permutations. Changing
+# any of these constants means running `flask reindex-similarity`.
+PERMUTATION_SEED = 46
+_PRIME = (1 << 31) - 1
+_HASH_BLOCK = 4096
+
+_OUTLINE_FIELD = re.compile(r'^W\d+_(LO|TO)$')
+_WORD = re.compile(r'\w+')
+
+
+def outline_text(content):
+    """The weekly outline (W*_LO / W*_TO values) of an AI plan's content JSON, else ''."""
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except (json.JSONDecodeError, TypeError):
+            return ''
+    if not isinstance(content, dict):
+        return ''
+    return '\n'.join(str(value) for key, value in content.items() if _OUTLINE_FIELD.match(key) and value)
+
+
+def similarity_text(content=None, document_text=''):
+    """
+    What a plan is compared on: the weekly outline when its content JSON has one,
+    otherwise the text extracted from its document, otherwise manual text content.
+    """
+    outline = outline_text(content)
+    if outline:
+        return outline
+    if document_text:
+        return document_text
+    if isinstance(content, str) and not content.lstrip().startswith('{'):
+        return content
+    return ''
+
+
+def _shingle_hashes(text):
+    import numpy as np
+    words = _WORD.findall((text or '').lower())
+    shingles = {' '.join(words[i:i + SHINGLE_SIZE]) for i in range(max(len(words) - SHINGLE_SIZE + 1, 0))}
+    return np.fromiter((int.from_bytes(hashlib.blake2b(s.encode('utf-8'), digest_size=4).digest(), 'little')
+                        for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+@lru_cache(maxsize=1)
+def _permutations():
+    import numpy as np
+    rng = np.random.default_rng(PERMUTATION_SEED)
+    return (rng.integers(1, _PRIME, NUM_PERM, dtype=np.uint64),
+            rng.integers(0, _PRIME, NUM_PERM, dtype=np.uint64))
+
+
+def minhash_signature(text):
+    """NUM_PERM-slot MinHash of `text`'s word shingles as a list of ints, or None if too short."""
+    import numpy as np
+    hashes = _shingle_hashes(text)
+    if len(hashes) < MIN_SHINGLES:
+        return None
+    a, b = _permutations()
+    hashes %= np.uint64(_PRIME)
+    signature = np.full(NUM_PERM, _PRIME, dtype=np.uint64)
+    # (a * h + b) mod p for all permutations at once, a block of shingles at a time;
+    # operands stay below 2**31, so the products fit in uint64
+    for start in range(0, len(hashes), _HASH_BLOCK):
+        block = hashes[start:start + _HASH_BLOCK, None]
+        np.minimum(signature, ((block * a + b) % np.uint64(_PRIME)).min(axis=0), out=signature)
+    return signature.astype(np.int64).tolist()
+
+
+def lsh_buckets(signature):
+    """One signed 64-bit bucket key per band."""
+    rows = NUM_PERM // BANDS
+    return [int.from_bytes(hashlib.blake2b(repr(signature[band * rows:(band + 1) * rows]).encode(), digest_size=8).digest(),
+                           'little', signed=True)
+            for band in range(BANDS)]
+
+
+def index_plan_similarity(plan_id, text):
+    """Stores (or clears) the plan's signature and LSH buckets; failures are logged, not raised."""
+    from app import supabase
+    signature = minhash_signature(text)
+    try:
+        supabase.rpc('store_clp_signature', {
+            'target_id': plan_id,
+            'new_signature': signature,
+            'new_buckets': lsh_buckets(signature) if signature else None,
+        }).execute()
+    except Exception as e:
+        current_app.logger.error(f"Failed to update similarity index for CLP {plan_id}: {e}")
+
+
+def copy_plan_similarity(source_id, plan_id):
+    """Gives a cloned plan its source's signature, without fetching and re-reading the document."""
+    from app import supabase
+    try:
+        res = supabase.table('clp_signatures').select('signature').eq('plan_id', source_id).limit(1).execute()
+        if res.data:
+            signature = res.data[0]['signature']
+            supabase.rpc('store_clp_signature', {
+                'target_id': plan_id, 'new_signature': signature, 'new_buckets': lsh_buckets(signature),
+            }).execute()
+    except Exception as e:
+        current_app.logger.error(f"Failed to copy similarity index from CLP {source_id} to {plan_id}: {e}")
+
+
+def refresh_plan_similarity(plan_id, document_text):
+    """After the plan's document was edited in place (ONLYOFFICE callbacks)."""
+    from app.plan_content import load_plan_content
+    index_plan_similarity(plan_id, similarity_text(load_plan_content(plan_id), document_text))
+
+
+def similar_plans(plan_id):
+    """Other authors' plans most similar to `plan_id`, via the similar_clps RPC; [] if unavailable."""
+    from app import supabase
+    try:
+        return supabase.rpc('similar_clps', {
+            'target_id': plan_id,
+            'min_similarity': current_app.config['SIMILARITY_THRESHOLD'],
+            'max_results': current_app.config['SIMILAR_PLANS_LIMIT'],
+        }).execute().data or []
+    except Exception as e:
+        current_app.logger.warning(f"Similar-plan lookup failed for CLP {plan_id}: {e}")
+        return []
+
+
+def reindex_all_similarity(batch_size=100):
+    """Backfills signatures for every plan (after migrations/006 or a constant change). Returns the count."""
+    from app import supabase, STORAGE_BUCKET_NAME
+    from app.plan_content import load_plan_contents
+    from app.search import extract_document_text
+    indexed = 0
+    last_id = 0
+    while True:
+        res = (supabase.table('course_learning_plans').select('id, filename')
+               .gt('id', last_id).order('id').limit(batch_size).execute())
+        if not res.data:
+            return indexed
+        last_id = res.data[-1]['id']
+        contents = load_plan_contents([plan['id'] for plan in res.data], batch_size=batch_size)
+        for plan in res.data:
+            content = contents.get(plan['id'])
+            document_text = ''
+            if not outline_text(content) and plan.get('filename'):
+                try:
+                    file_bytes = supabase.storage.from_(STORAGE_BUCKET_NAME).download(plan['filename'])
+                    document_text = extract_document_text(file_bytes, plan['filename'])
+                except Exception as e:
+                    current_app.logger.warning(f"Skipping file text for CLP {plan['id']}: {e}")
+            index_plan_similarity(plan['id'], similarity_text(content, document_text))
+            indexed += 1
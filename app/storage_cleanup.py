@@ -0,0 +1,139 @@
+# app/storage_cleanup.py
+
+import logging
+from datetime import datetime, timedelta, timezone
+
+from app.dean_summary import invalidate_dean_summary
+
+logger = logging.getLogger(__name__)
+
+# Paths per storage remove() call and ids per `in` filter; both stay well under the
+# storage API's 1000-prefix limit and PostgREST's URL length.
+REMOVE_BATCH_SIZE = 100
+ID_BATCH_SIZE = 200
+# Page size when walking the bucket and the filename columns
+LIST_PAGE_SIZE = 1000
+
+
+def _chunks(items, size):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def remove_storage_objects(client, paths):
+    """Removes objects in batches. Returns the paths whose batch failed."""
+    from app import STORAGE_BUCKET_NAME
+    failed = []
+    for batch in _chunks(list(paths), REMOVE_BATCH_SIZE):
+        try:
+            client.storage.from_(STORAGE_BUCKET_NAME).remove(batch)
+        except Exception as e:
+            # Left for the storage GC to pick up later
+            logger.warning(f"Could not remove {len(batch)} storage objects: {e}")
+            failed.extend(batch)
+    return failed
+
+
+# --- BULK DELETE ---
+
+def bulk_delete_plans(plan_ids, status=None):
+    """
+    Deletes plans and their files with one storage call and one DB delete per batch,
+    instead of a round trip pair per plan. `status` restricts the delete to plans in
+    that status (deans may only delete approved plans). Returns (deleted, failed_paths).
+    """
+    from app import supabase
+    deleted = 0
+    failed_paths = []
+    for batch in _chunks(sorted(set(plan_ids)), ID_BATCH_SIZE):
+        query = supabase.table('course_learning_plans').select('id, filename').in_('id', batch)
+        if status:
+            query = query.eq('status', status)
+        rows = query.execute().data
+        if not rows:
+            continue
+        # Rows go first: a file without a row is garbage the GC collects, while a
+        # row without its file is a broken plan.
+        ids = [row['id'] for row in rows]
+        delete = supabase.table('course_learning_plans').delete().in_('id', ids)
+        if status:
+            delete = delete.eq('status', status)
+        delete.execute()
+        deleted += len(ids)
+        failed_paths += remove_storage_objects(supabase, [row['filename'] for row in rows if row.get('filename')])
+    if deleted:
+        invalidate_dean_summary()
+    return deleted, failed_paths
+
+
+# --- STORAGE GC ---
+
+def _list_bucket(client, prefix=''):
+    """Yields every object under `prefix` as (path, info), walking folders page by page."""
+    from app import STORAGE_BUCKET_NAME
+    bucket = client.storage.from_(STORAGE_BUCKET_NAME)
+    offset = 0
+    while True:
+        entries = bucket.list(prefix, {'limit': LIST_PAGE_SIZE, 'offset': offset,
+                                       'sortBy': {'column': 'name', 'order': 'asc'}})
+        for entry in entries:
+            path = f"{prefix}/{entry['name']}" if prefix else entry['name']
+            if entry.get('id') is None:
+                # Folders have no id
+                yield from _list_bucket(client, path)
+            else:
+                yield path, entry
+        if len(entries) < LIST_PAGE_SIZE:
+            return
+        offset += LIST_PAGE_SIZE
+
+
+def _referenced_filenames(client, table):
+    names = set()
+    last_id = None
+    while True:
+        query = client.table(table).select('id, filename').not_.is_('filename', 'null')
+        if last_id is not None:
+            query = query.gt('id', last_id)
+        rows = query.order('id').limit(LIST_PAGE_SIZE).execute().data
+        names.update(row['filename'] for row in rows)
+        if len(rows) < LIST_PAGE_SIZE:
+            return names
+        last_id = rows[-1]['id']
+
+
+def _last_modified(info):
+    stamp = info.get('updated_at') or info.get('created_at')
+    if not stamp:
+        return None
+    return datetime.fromisoformat(stamp.replace('Z', '+00:00'))
+
+
+def collect_orphaned_files(grace_hours=24, dry_run=False):
+    """
+    Removes bucket objects that no plan or template row points at. Objects modified in
+    the last `grace_hours` are kept, so uploads whose row is still being written survive.
+    Returns (orphaned_paths, failed_paths).
+    """
+    from app.utils import supabase_service
+    from app.doc_templates import FALLBACK_TEMPLATE_KEY
+    # Listing needs to see every user's folder, so this runs with the service key
+    client = supabase_service
+    referenced = _referenced_filenames(client, 'course_learning_plans')
+    referenced |= _referenced_filenames(client, 'templates')
+    referenced.add(FALLBACK_TEMPLATE_KEY)
+
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=grace_hours)
+    orphaned = []
+    for path, info in _list_bucket(client):
+        if path in referenced:
+            continue
+        modified = _last_modified(info)
+        if modified is None or modified > cutoff:
+            continue
+        orphaned.append(path)
+
+    if dry_run or not orphaned:
+        return orphaned, []
+    logger.info(f"Removing {len(orphaned)} orphaned storage objects.")
+    return orphaned, remove_storage_objects(client, orphaned)
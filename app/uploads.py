@@ -0,0 +1,193 @@
+# app/uploads.py
+
+import fcntl
+import json
+import os
+import re
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+
+from flask import current_app
+
+# Uploads never sit in worker memory whole: form uploads are spooled to
+# UPLOAD_SPOOL_DIR and streamed to storage from there, and the resumable protocol
+# (a subset of TUS 1.0: create, HEAD for the offset, PATCH to append, DELETE)
+# writes chunks straight into a part file in the same directory.
+
+TUS_VERSION = '1.0.0'
+COPY_BUFFER_SIZE = 1024 * 1024
+
+_UPLOAD_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class UploadError(Exception):
+    """A resumable upload request that can't be honoured; `status` is the HTTP status to return."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def spool_dir():
+    path = current_app.config['UPLOAD_SPOOL_DIR']
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+# --- FORM UPLOADS ---
+
+@contextmanager
+def spooled(file_storage):
+    """Copies a form upload to a temp file in chunks; yields its path and removes it afterwards."""
+    fd, path = tempfile.mkstemp(dir=spool_dir(), suffix='.upload')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            file_storage.save(out, buffer_size=COPY_BUFFER_SIZE)
+        yield path
+    finally:
+        _remove(path)
+
+
+def upload_to_storage(client, bucket_path, local_path, content_type):
+    """Streams a local file to storage instead of handing it over as one bytes object."""
+    from app import STORAGE_BUCKET_NAME
+    with open(local_path, 'rb') as fh:
+        return client.storage.from_(STORAGE_BUCKET_NAME).upload(
+            path=bucket_path, file=fh, file_options={"content-type": content_type})
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# --- RESUMABLE UPLOADS ---
+
+def _paths(upload_id):
+    if not _UPLOAD_ID.match(upload_id or ''):
+        raise UploadError("Unknown upload.", 404)
+    base = os.path.join(spool_dir(), upload_id)
+    return base + '.part', base + '.json'
+
+
+def _read_info(upload_id, owner_id):
+    part_path, info_path = _paths(upload_id)
+    try:
+        with open(info_path) as fh:
+            info = json.load(fh)
+    except FileNotFoundError:
+        raise UploadError("Unknown upload.", 404)
+    # Another user's upload id is as good as unknown
+    if info['owner_id'] != owner_id:
+        raise UploadError("Unknown upload.", 404)
+    info['offset'] = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    return info
+
+
+def create_upload(owner_id, length, filename, content_type):
+    purge_stale_uploads()
+    if length <= 0 or length > current_app.config['MAX_CONTENT_LENGTH']:
+        raise UploadError("File is empty or larger than the upload limit.", 413)
+    upload_id = uuid.uuid4().hex
+    part_path, info_path = _paths(upload_id)
+    open(part_path, 'wb').close()
+    with open(info_path, 'w') as fh:
+        json.dump({'owner_id': owner_id, 'length': length, 'filename': filename,
+                   'content_type': content_type, 'created': time.time()}, fh)
+    return upload_id
+
+
+def upload_offset(upload_id, owner_id):
+    """(offset, length) of a resumable upload."""
+    info = _read_info(upload_id, owner_id)
+    return info['offset'], info['length']
+
+
+def append_chunk(upload_id, owner_id, offset, stream):
+    """
+    Appends a PATCH body at `offset`, which must be where the upload stands. Returns the
+    new offset. The part file is locked from the offset check to the last write, so a
+    retried PATCH arriving while the first is still running gets 423 instead of
+    appending the same bytes twice.
+    """
+    info = _read_info(upload_id, owner_id)
+    part_path, _ = _paths(upload_id)
+    with open(part_path, 'ab') as out:
+        try:
+            # Released when the file is closed, also if the worker dies
+            fcntl.flock(out.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            raise UploadError("Another request is still writing to this upload.", 423)
+        if offset != os.fstat(out.fileno()).st_size:
+            raise UploadError("Upload-Offset does not match the upload.", 409)
+        remaining = info['length'] - offset
+        while True:
+            chunk = stream.read(min(COPY_BUFFER_SIZE, remaining + 1))
+            if not chunk:
+                break
+            if len(chunk) > remaining:
+                # Keep what fits; the client sees the offset and stops
+                out.write(chunk[:remaining])
+                raise UploadError("Chunk runs past the declared Upload-Length.", 413)
+            out.write(chunk)
+            remaining -= len(chunk)
+    return info['length'] - remaining
+
+
+def delete_upload(upload_id, owner_id):
+    _read_info(upload_id, owner_id)
+    for path in _paths(upload_id):
+        _remove(path)
+
+
+@contextmanager
+def completed_upload(upload_id, owner_id):
+    """Yields (local_path, filename, content_type) of a finished upload; removes it afterwards."""
+    info = _read_info(upload_id, owner_id)
+    if info['offset'] != info['length']:
+        raise UploadError("Upload is not complete yet.", 409)
+    part_path, info_path = _paths(upload_id)
+    try:
+        yield part_path, info['filename'], info['content_type']
+    finally:
+        _remove(part_path)
+        _remove(info_path)
+
+
+def purge_stale_uploads():
+    """Drops uploads nobody touched for RESUMABLE_UPLOAD_TTL hours, and spool files left by crashed workers."""
+    cutoff = time.time() - current_app.config['RESUMABLE_UPLOAD_TTL'] * 3600
+    directory = spool_dir()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        try:
+            if name.endswith('.json'):
+                # A resumable upload is as fresh as its last appended chunk
+                part_path = path[:-len('.json')] + '.part'
+                touched = os.path.getmtime(part_path) if os.path.exists(part_path) else os.path.getmtime(path)
+                if touched < cutoff:
+                    _remove(part_path)
+                    _remove(path)
+            elif name.endswith('.upload') and os.path.getmtime(path) < cutoff:
+                _remove(path)
+        except OSError:
+            pass
+
+
+@contextmanager
+def incoming_file(file_storage, upload_id, owner_id):
+    """
+    The file a form submitted: either its own file field (spooled to disk) or, when the
+    browser sent it with the resumable uploader, the finished upload named by `upload_id`.
+    Yields (local_path, original_filename, content_type).
+    """
+    if file_storage:
+        with spooled(file_storage) as path:
+            yield path, file_storage.filename, file_storage.mimetype
+    else:
+        with completed_upload(upload_id, owner_id) as upload:
+            yield upload
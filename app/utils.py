@@ -3,14 +3,11 @@
 import os
 import io
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from threading import Thread
-import google.generativeai as genai
-from google.generativeai import GenerativeModel
-from docx import Document
 from flask import current_app, session, flash, url_for, redirect, jsonify, Response
 import logging
-import jwt
 import time
 from flask import current_app
 import logging # Make sure logging is imported if not already
@@ -25,7 +22,17 @@ from postgrest.exceptions import APIError as PostgrestAPIError
 # Re-import static data from the app factory
 from app import PROGRAM_OUTCOMES, COURSE_OUTCOMES, INSTITUTIONAL_OUTCOMES_HEADERS, PROGRAM_OUTCOMES_HEADERS
 
-from supabase import create_client
+from app.notifier import notify_many
+from app.plan_content import save_plan_content, split_content
+from app.search import build_search_text, content_search_text
+from app.similarity import index_plan_similarity, similarity_text
+from app.profiles import get_user_profile
+from app.jobs import finish_generation_job, track_generation_job
+from app.doc_templates import FALLBACK_TEMPLATE_KEY, get_template_bytes
+from app.refdata import template_key_for_department, template_placeholder_keys
+from app.placeholders import fillable_keys, filter_schema, weekly_keys
+from app.matrix_encoding import CO_PO_SYMBOLS, PO_IO_SYMBOLS, matrix_step
+from app.dean_summary import invalidate_dean_summary
 
 # Normal client (anon/public key) - for user-facing queries
 from app import supabase  
@@ -39,11 +46,9 @@ if current_app:
         handler.setFormatter(formatter)
         current_app.logger.addHandler(handler)
 
-# Create a separate service client (bypasses RLS)
-SUPABASE_URL = os.getenv("SUPABASE_URL")
-SUPABASE_SERVICE_KEY = os.getenv("SUPABASE_SERVICE_KEY")  # store this in .env, NEVER frontend
-
-supabase_service = create_client(SUPABASE_URL, SUPABASE_SERVICE_KEY)
+# Service client (bypasses RLS), pooled like `supabase`. SUPABASE_SERVICE_KEY lives in .env, NEVER frontend
+from app.clients import BoundClient
+supabase_service = BoundClient('service')
 
 
 # app/utils.py
@@ -93,6 +98,7 @@ def get_template_content():
     Reads DOCX and returns full HTML with headers, footers, text formatting, tables, and images.
     Works on all python-docx versions (no xpath).
     """
+    from docx import Document
     try:
         doc_path = get_template_filepath()
         document = Document(doc_path)
@@ -156,6 +162,7 @@ def generate_jwt_token(payload):
         logger.warning("ONLYOFFICE_JWT_SECRET not set in app config - cannot generate token.")
         return None
 
+    import jwt
     try:
         # Add expiration time (e.g., 1 hour)
         payload['exp'] = int(time.time()) + 3600
@@ -218,6 +225,7 @@ def overwrite_template_content(new_content):
         doc_path = get_template_filepath()
         
         # 1. Create a brand new, empty document
+        from docx import Document
         new_document = Document()
         
         # 2. Split the content by double-newline to represent new paragraphs
@@ -297,34 +305,86 @@ def flatten_json(data):
     flatten(data)
     return out
 
-def create_notification(user_id, message):
+def render_clp_docx(clp_data, department):
+    """
+    Fills the department's DOCX template (else the global default, else the bundled
+    fallback; mapping cached in app/refdata.py) with a plan's content JSON. Returns bytes.
+    """
     try:
-        supabase.table('notifications').insert({
-            'user_id': user_id,
-            'message': message
-        }).execute()
-    except PostgrestAPIError as e:
-        current_app.logger.error(f"Failed to create notification for user {user_id}: {e.message}")
+        template_key = template_key_for_department(department) or FALLBACK_TEMPLATE_KEY
+        template_bytes = get_template_bytes(template_key)
+    except Exception as e:
+        # Fallback
+        template_key = FALLBACK_TEMPLATE_KEY
+        template_bytes = get_template_bytes(template_key)
+
+    from docx import Document
+    doc = Document(io.BytesIO(template_bytes))
+    # Content generated for a template that used fewer fields lacks some keys; blank them
+    # rather than leave "IT01_T" or "W3_LO" in the document
+    replacements = dict.fromkeys(fillable_keys(), '')
+    replacements.update(flatten_json(clp_data))
+    doc = replace_placeholders(doc, replacements)
+    file_stream = io.BytesIO()
+    doc.save(file_stream)
+    return file_stream.getvalue()
+
+def create_notification(user_id, message):
+    # Goes through the batching dispatcher; see app/notifier.py
+    notify_many([user_id], message)
 
 def get_current_user_profile():
-    user_id = session.get('user_id')
-    if not user_id: return None
-    try:
-        res = supabase.table('users').select('*').eq('id', user_id).single().execute()
-        return res.data
-    except PostgrestAPIError as e:
-        current_app.logger.error(f"Could not fetch profile for user {user_id}: {e.message}")
-        return None
+    # Cached per request and for a short TTL per process; see app/profiles.py
+    return get_user_profile(session.get('user_id'))
+
+_genai_configured = False
+
+def get_generative_model(model_name):
+    """
+    Imports and configures the Gemini SDK on first use. It is the slowest import in the
+    app, and most requests and CLI commands never need it.
+    """
+    global _genai_configured
+    import google.generativeai as genai
+    if not _genai_configured:
+        genai.configure(api_key=current_app.config['GEMINI_API_KEY'])
+        _genai_configured = True
+    return genai.GenerativeModel(model_name)
+
+def run_generation_steps(model_instance, steps):
+    """
+    Runs independent (prompt, generation_config) Gemini calls and returns their parsed
+    JSON in step order. In ASYNC_MODE they are sent concurrently, so the wait is the
+    slowest step instead of the sum of all of them.
+    """
+    if current_app.config.get('ASYNC_MODE') and len(steps) > 1:
+        # Sync calls on threads: the SDK caches its async gRPC client per process, bound to
+        # the first event loop, so asyncio.run() per generation breaks the next one
+        with ThreadPoolExecutor(max_workers=len(steps), thread_name_prefix='clp-gen-step') as pool:
+            responses = list(pool.map(
+                lambda step: model_instance.generate_content(contents=[step[0]], generation_config=step[1]), steps))
+    else:
+        responses = [model_instance.generate_content(contents=[prompt], generation_config=config)
+                     for prompt, config in steps]
+    return [json.loads(resp.text) for resp in responses]
 
 # --- AI GENERATION BACKGROUND TASK (REFACTORED AND IMPROVED) ---
 # Update this function to accept plan_id
 def start_clp_generation(plan_id, user_id, course_data):
     """A public function to start the background thread."""
     # Pass plan_id to the background task
-    thread = Thread(target=generate_clp_background_task, args=(current_app.app_context(), plan_id, user_id, course_data))
+    thread = Thread(target=_run_generation_job, args=(current_app.app_context(), plan_id, user_id, course_data))
     thread.daemon = True
+    # Tracked so a shutting-down worker can wait for it (see app/jobs.py, gunicorn.conf.py)
+    track_generation_job(plan_id, user_id, course_data['subject'], thread)
     thread.start()
 
+def _run_generation_job(app_context, plan_id, user_id, course_data):
+    try:
+        generate_clp_background_task(app_context, plan_id, user_id, course_data)
+    finally:
+        finish_generation_job(plan_id)
+
 def generate_clp_background_task(app_context, plan_id, user_id, course_data):
     subject_name = course_data['subject']
     department = course_data['department']
@@ -333,41 +393,51 @@ def generate_clp_background_task(app_context, plan_id, user_id, course_data):
         try:
             current_app.logger.info(f"--- [AI DEBUG] BG Task started for CLP {plan_id}, user {user_id}. ---")
             
-            model_instance = GenerativeModel('gemini-2.5-flash')
+            model_instance = get_generative_model('gemini-2.5-flash')
             clp_data = {}
+
+            # Only ask for the fields the department's template has placeholders for
+            try:
+                template_keys = template_placeholder_keys(template_key_for_department(department) or FALLBACK_TEMPLATE_KEY)
+            except Exception as e:
+                current_app.logger.warning(f"Could not load the placeholder manifest, requesting every field: {e}")
+                template_keys = None
             
             # --- Step 1: Generate Basic Info and References (Text Generation) ---
 
             # --- Step 2: Generate Program to Institutional Outcomes Mapping ---
             current_app.logger.info("--- [AI DEBUG] Step 2: Generating Program to Institutional Outcomes Mapping... ---")
             po_io_prompt_raw = get_system_prompt('prompt_po_io', default_text="You are an expert academic planner...") 
-            po_io_schema_properties = {f"{po_code}_{io_header}": {"type": "STRING", "enum": ["✔", " "]} for po_code in PROGRAM_OUTCOMES_HEADERS for io_header in INSTITUTIONAL_OUTCOMES_HEADERS}
-            step2_config = {"response_mime_type": "application/json", "response_schema": {"type": "OBJECT", "properties": po_io_schema_properties, "required": list(po_io_schema_properties.keys())}}
-            resp_2 = model_instance.generate_content(contents=[po_io_prompt_raw], generation_config=step2_config)
-            clp_data.update(json.loads(resp_2.text))
+            # One property per cell, or one string per PO row with AI_MATRIX_ENCODING=compact (app/matrix_encoding.py)
+            encoding = current_app.config['AI_MATRIX_ENCODING']
+            po_io_suffix, step2_config, decode_po_io = matrix_step(
+                encoding, PROGRAM_OUTCOMES_HEADERS, INSTITUTIONAL_OUTCOMES_HEADERS, PO_IO_SYMBOLS, template_keys)
 
             # [STEP 3: CO-PO]
             course_outcomes_string = ", ".join([f"{co['code']}: {co['description']}" for co in COURSE_OUTCOMES])
             program_outcomes_string = ", ".join([f"{po['code']}: {po['description']}" for po in PROGRAM_OUTCOMES])
             co_po_prompt_raw = get_system_prompt('prompt_co_po', default_text="Given the Course Outcomes...")
             co_po_prompt = co_po_prompt_raw.replace('{course_outcomes}', course_outcomes_string).replace('{program_outcomes}', program_outcomes_string)
-            co_po_schema_properties = {f"{co_code_obj['code']}_{po_code}": {"type": "STRING", "enum": ["E", "I", " "]} for co_code_obj in COURSE_OUTCOMES for po_code in PROGRAM_OUTCOMES_HEADERS}
-            step3_config = {"response_mime_type": "application/json", "response_schema": {"type": "OBJECT", "properties": co_po_schema_properties, "required": list(co_po_schema_properties.keys())}}
-            resp_3 = model_instance.generate_content(contents=[co_po_prompt], generation_config=step3_config)
-            clp_data.update(json.loads(resp_3.text))
+            co_po_suffix, step3_config, decode_co_po = matrix_step(
+                encoding, [co['code'] for co in COURSE_OUTCOMES], PROGRAM_OUTCOMES_HEADERS, CO_PO_SYMBOLS, template_keys)
 
             # [STEP 4: Weekly]
             weekly_prompt_raw = get_system_prompt('prompt_weekly', default_text="Generate the complete 18-week Course Outline...")
             weekly_breakdown_prompt = weekly_prompt_raw.replace('{subject_name}', subject_name)
-            weekly_schema_properties = {}
-            week_prefixes = [f"W{i}" for i in range(1, 19) if i not in [10, 11, 14, 15, 16, 17]] + ["W1011", "W1415", "W1617"]
-            for week_prefix in week_prefixes:
-                for suffix in ["_LO", "_TO", "_Method", "_Assesment", "_LR"]:
-                    weekly_schema_properties[f"{week_prefix}{suffix}"] = {"type": "STRING"}
-            weekly_schema_properties['references'] = {"type": "STRING"}
+            weekly_schema_properties = filter_schema({key: {"type": "STRING"} for key in weekly_keys()}, template_keys)
             step4_config = {"response_mime_type": "application/json", "response_schema": {"type": "OBJECT", "properties": weekly_schema_properties, "required": list(weekly_schema_properties.keys())}}
-            resp_4 = model_instance.generate_content(contents=[weekly_breakdown_prompt], generation_config=step4_config)
-            clp_data.update(json.loads(resp_4.text))
+
+            # Steps 2-4 don't depend on each other; a step the template has no fields for is skipped
+            steps = [step for step in [
+                (po_io_prompt_raw + po_io_suffix, step2_config, decode_po_io),
+                (co_po_prompt + co_po_suffix, step3_config, decode_co_po),
+                (weekly_breakdown_prompt, step4_config, lambda data: (data, 0))] if step[1]['response_schema']['properties']]
+            results = run_generation_steps(model_instance, [(prompt, config) for prompt, config, _ in steps])
+            for (_, _, decode), step_data in zip(steps, results):
+                cells, invalid = decode(step_data)
+                if invalid:
+                    current_app.logger.warning(f"CLP {plan_id}: {invalid} matrix cells in the AI response were invalid and left blank.")
+                clp_data.update(cells)
 
             # Inject User Data
             clp_data.update(course_data)
@@ -375,42 +445,12 @@ def generate_clp_background_task(app_context, plan_id, user_id, course_data):
             # --- SUPABASE PROCESSING ---
             
             # 1. Fetch user profile for template filling
-            user_res = supabase.table('users').select('first_name, last_name, title').eq('id', user_id).single().execute()
-            current_user = user_res.data
+            current_user = get_user_profile(user_id) or {}
             clp_data['NAME'] = f"{current_user.get('first_name', '')} {current_user.get('last_name', '')}".strip()
             clp_data['TITLE'] = current_user.get('title', '')
             
-            # 2. Select Template (Dynamic Logic)
-            template_key = None
-            try:
-                dept_res = supabase.table('departments').select('id').eq('name', department).execute()
-                if dept_res.data:
-                    dept_id = dept_res.data[0]['id']
-                    tmpl_res = supabase.table('templates').select('filename').eq('department_id', dept_id).limit(1).execute()
-                    if tmpl_res.data:
-                        template_key = tmpl_res.data[0]['filename']
-                
-                if not template_key:
-                    def_res = supabase.table('templates').select('filename').eq('is_default', True).limit(1).execute()
-                    if def_res.data:
-                        template_key = def_res.data[0]['filename']
-                
-                if not template_key:
-                    template_key = "PBSIT/PBSIT-001-LP-20242.docx" # Fallback
-
-                template_bytes = supabase.storage.from_(STORAGE_BUCKET_NAME).download(template_key)
-            except Exception as e:
-                # Fallback
-                template_key = "PBSIT/PBSIT-001-LP-20242.docx"
-                template_bytes = supabase.storage.from_(STORAGE_BUCKET_NAME).download(template_key)
-
-            # 3. Generate DOCX
-            doc = Document(io.BytesIO(template_bytes))
-            flat_replacements = flatten_json(clp_data)
-            doc = replace_placeholders(doc, flat_replacements)
-            file_stream = io.BytesIO()
-            doc.save(file_stream)
-            file_stream.seek(0)
+            # 2-3. Fill the department's template
+            docx_bytes = render_clp_docx(clp_data, department)
             
             # 4. Upload File
             # Use plan_id in filename to ensure uniqueness
@@ -419,7 +459,7 @@ def generate_clp_background_task(app_context, plan_id, user_id, course_data):
             
             supabase.storage.from_(STORAGE_BUCKET_NAME).upload(
                 path=file_path_in_bucket,
-                file=file_stream.read(),
+                file=docx_bytes,
                 file_options={"content-type": "application/vnd.openxmlformats-officedocument.wordprocessingml.document"}
             )
             
@@ -428,13 +468,19 @@ def generate_clp_background_task(app_context, plan_id, user_id, course_data):
             
             final_subject = clp_data.get('descriptive_title', subject_name)
             
-            supabase.table('course_learning_plans').update({
+            plan_fields, plan_content = split_content({
                 'subject': final_subject, # Update subject if AI refined it
                 'filename': file_path_in_bucket,
                 'upload_type': 'file_upload', # Switch to file type so it opens in ONLYOFFICE
                 'content': json.dumps(clp_data), # Keep JSON for backup/viewing
+                'search_text': build_search_text(content_search_text(clp_data)),
                 'status': 'draft' # Mark as done (Draft allows editing)
-            }).eq('id', plan_id).execute()
+            })
+            # Content first, so the plan never shows up as 'draft' without it
+            save_plan_content(plan_id, plan_content)
+            supabase.table('course_learning_plans').update(plan_fields).eq('id', plan_id).execute()
+            index_plan_similarity(plan_id, similarity_text(clp_data))
+            invalidate_dean_summary()
             
             # 6. Notify
             create_notification(user_id, f'Your AI-generated CLP for "{final_subject}" is ready!')
@@ -446,10 +492,13 @@ def generate_clp_background_task(app_context, plan_id, user_id, course_data):
             
             # Mark as failed in DB so UI stops loading
             try:
-                supabase.table('course_learning_plans').update({
+                failed_fields, failed_content = split_content({
                     'status': 'failed', # You might need to ensure UI handles 'failed' or just 'draft' with error note
                     'content': f"Generation failed: {str(e)}"
-                }).eq('id', plan_id).execute()
+                })
+                supabase.table('course_learning_plans').update(failed_fields).eq('id', plan_id).execute()
+                save_plan_content(plan_id, failed_content)
+                invalidate_dean_summary()
             except:
                 pass
                 
@@ -462,10 +511,13 @@ def generate_clp_background_task(app_context, plan_id, user_id, course_data):
             
             # Mark as failed in DB so UI stops loading
             try:
-                supabase.table('course_learning_plans').update({
+                failed_fields, failed_content = split_content({
                     'status': 'failed', # You might need to ensure UI handles 'failed' or just 'draft' with error note
                     'content': f"Generation failed: {str(e)}"
-                }).eq('id', plan_id).execute()
+                })
+                supabase.table('course_learning_plans').update(failed_fields).eq('id', plan_id).execute()
+                save_plan_content(plan_id, failed_content)
+                invalidate_dean_summary()
             except:
                 pass
                 
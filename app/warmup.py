@@ -0,0 +1,49 @@
+# app/warmup.py
+
+import time
+
+from flask import current_app
+
+
+def _open_connection(client):
+    # Straight to the wrapped client: these probes aren't a request's queries,
+    # so they shouldn't show up in Server-Timing or the N+1 warning
+    client._client.table('departments').select('id').limit(1).execute()
+
+
+def warm_up(app, templates=True, connections=True, docx_templates=True):
+    """
+    Optional start-up work that would otherwise land on the first requests: compiles
+    every Jinja template, opens the pooled Supabase connections and caches the
+    default DOCX templates. Returns {step: seconds} for logging. Run it once per
+    worker after fork, because open connections must not be shared across processes.
+    """
+    timings = {}
+    if connections:
+        from app.clients import pools
+        started = time.perf_counter()
+        for name, pool in pools.items():
+            try:
+                pool.prefill(probe=_open_connection)
+            except Exception as e:
+                app.logger.warning(f"Warm-up could not open {name} Supabase connections: {e}")
+        timings['connections'] = time.perf_counter() - started
+
+    with app.app_context():
+        if templates:
+            started = time.perf_counter()
+            for name in app.jinja_env.list_templates(extensions=['html']):
+                app.jinja_env.get_template(name)
+            timings['templates'] = time.perf_counter() - started
+
+        if docx_templates:
+            # Also loads the cached template-per-department mapping
+            from app.doc_templates import default_template_keys, get_template_bytes
+            started = time.perf_counter()
+            try:
+                for key in default_template_keys():
+                    get_template_bytes(key)
+            except Exception as e:
+                current_app.logger.warning(f"Warm-up could not cache the default DOCX templates: {e}")
+            timings['docx_templates'] = time.perf_counter() - started
+    return timings
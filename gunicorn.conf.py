@@ -0,0 +1,55 @@
+# gunicorn -c gunicorn.conf.py wsgi:app
+import multiprocessing
+import os
+import time
+
+bind = os.environ.get('BIND', f"0.0.0.0:{os.environ.get('PORT', '8000')}")
+
+# Threaded workers: most request time is spent waiting on Supabase/Gemini
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Build the app (config, templates, blueprints) once in the master and fork it
+preload_app = True
+
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+keepalive = 5
+# On SIGTERM a worker stops accepting requests, finishes in-flight ones and then
+# waits for running AI generations (see worker_exit) within this budget
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 120))
+
+# Recycle workers now and then so slow leaks can't build up
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = 100
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def post_worker_init(worker):
+    # WARMUP=1: compile templates, open connections and cache DOCX templates
+    # before this worker takes its first request
+    if os.environ.get('WARMUP', '').lower() in ('1', 'true', 'yes'):
+        from app.warmup import warm_up
+        timings = warm_up(worker.wsgi)
+        worker.log.info(f"Worker {worker.pid} warmed up: " + ', '.join(f"{k} {v * 1000:.0f}ms" for k, v in timings.items()))
+
+
+def worker_exit(server, worker):
+    from app.jobs import drain_generation_jobs, drain_rerender_jobs, running_generation_jobs, running_rerender_jobs
+    from app.notifier import dispatcher
+    # Leave a few seconds of the graceful budget to mark leftovers as failed
+    deadline = time.monotonic() + max(graceful_timeout - 10, 0)
+    if running_generation_jobs():
+        server.log.info(f"Worker {worker.pid}: waiting for {len(running_generation_jobs())} AI generation(s) to finish.")
+        abandoned = drain_generation_jobs(worker.wsgi, max(deadline - time.monotonic(), 0))
+        if abandoned:
+            server.log.warning(f"Worker {worker.pid}: marked {abandoned} unfinished generation(s) as failed.")
+    if running_rerender_jobs():
+        server.log.info(f"Worker {worker.pid}: waiting for {len(running_rerender_jobs())} template re-render job(s) to finish.")
+        abandoned = drain_rerender_jobs(worker.wsgi, max(deadline - time.monotonic(), 0))
+        if abandoned:
+            server.log.warning(f"Worker {worker.pid}: marked {abandoned} unfinished re-render job(s) as failed.")
+    dispatcher.flush(5)
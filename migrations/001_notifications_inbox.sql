@@ -0,0 +1,19 @@
+-- Keyset pagination and retention for the notifications inbox.
+
+-- Serves "WHERE user_id = ? ORDER BY timestamp DESC, id DESC LIMIT n" and the keyset
+-- predicate (timestamp, id) < (?, ?) as a single index range scan.
+create index if not exists notifications_user_timestamp_id_idx
+    on public.notifications (user_id, "timestamp" desc, id desc);
+
+-- Daily digests written by `flask notifications-retention` are flagged so later runs skip them.
+alter table public.notifications
+    add column if not exists is_digest boolean not null default false;
+
+-- Optional cold storage for collapsed rows (`flask notifications-retention --archive`).
+create table if not exists public.notifications_archive (
+    id bigint primary key,
+    user_id uuid not null,
+    message text not null,
+    "timestamp" timestamptz not null,
+    archived_at timestamptz not null default now()
+);
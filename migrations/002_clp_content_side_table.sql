@@ -0,0 +1,14 @@
+-- Moves the CLP content blob (the full AI-generated JSON) out of course_learning_plans
+-- so list scans only touch narrow rows. Enable with CLP_CONTENT_SIDE_TABLE=1 after running.
+
+create table if not exists public.course_learning_plan_contents (
+    plan_id bigint primary key references public.course_learning_plans (id) on delete cascade,
+    content text
+);
+
+insert into public.course_learning_plan_contents (plan_id, content)
+select id, content from public.course_learning_plans where content is not null
+on conflict (plan_id) do update set content = excluded.content;
+
+-- Once the app runs with CLP_CONTENT_SIDE_TABLE=1 everywhere, the old column can be cleared:
+-- update public.course_learning_plans set content = null where content is not null;
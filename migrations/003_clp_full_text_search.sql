@@ -0,0 +1,71 @@
+-- Full-text search over CLPs: subject, department, author and extracted body text.
+-- search_text is filled by the app (app/search.py) at upload, generation and editor-callback time.
+
+alter table public.course_learning_plans
+    add column if not exists search_text text;
+
+alter table public.course_learning_plans
+    add column if not exists search_vector tsvector generated always as (
+        setweight(to_tsvector('english', coalesce(subject, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(department, '')), 'B') ||
+        setweight(to_tsvector('english', coalesce(search_text, '')), 'C')
+    ) stored;
+
+create index if not exists course_learning_plans_search_idx
+    on public.course_learning_plans using gin (search_vector);
+
+-- Ranked search. Author matches come from the (small) users table and are unioned in,
+-- so the plan side always stays on the GIN index. Snippets are built only for the final page.
+create or replace function public.search_clps(
+    q text,
+    viewer_id uuid default null,
+    include_all boolean default false,
+    max_results integer default 20
+)
+returns table (
+    id bigint,
+    subject text,
+    department text,
+    status text,
+    upload_type text,
+    filename text,
+    date_posted timestamptz,
+    user_id uuid,
+    author_username text,
+    rank real,
+    snippet text
+)
+language sql stable
+as $$
+    with tsq as (
+        select websearch_to_tsquery('english', q) as query
+    ),
+    authors as (
+        select u.id
+        from public.users u, tsq
+        where to_tsvector('simple', concat_ws(' ', u.username, u.first_name, u.last_name)) @@ tsq.query
+    ),
+    hits as (
+        select p.id from public.course_learning_plans p, tsq where p.search_vector @@ tsq.query
+        union
+        select p.id from public.course_learning_plans p join authors a on a.id = p.user_id
+    ),
+    ranked as (
+        select p.id, p.subject, p.department, p.status, p.upload_type, p.filename, p.date_posted,
+               p.user_id, u.username as author_username, p.search_text,
+               ts_rank(p.search_vector, tsq.query)
+                 + case when p.user_id in (select a.id from authors a) then 0.5 else 0 end as rank
+        from hits
+        join public.course_learning_plans p on p.id = hits.id
+        join public.users u on u.id = p.user_id,
+        tsq
+        where include_all or p.status = 'approved' or p.user_id = viewer_id
+        order by rank desc, p.date_posted desc
+        limit max_results
+    )
+    select r.id, r.subject, r.department, r.status, r.upload_type, r.filename, r.date_posted,
+           r.user_id, r.author_username, r.rank::real,
+           ts_headline('english', coalesce(r.search_text, r.subject), tsq.query, 'MaxWords=30, MinWords=10')
+    from ranked r, tsq
+    order by r.rank desc, r.date_posted desc;
+$$;
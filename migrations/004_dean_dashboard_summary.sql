@@ -0,0 +1,55 @@
+-- Everything the dean landing page shows, in one round trip (app/dean_summary.py):
+-- plan counts by status, counts per department, the newest pending plans and the
+-- viewer's unread notification count.
+
+-- Serves the "newest pending" list and the per-status counts
+create index if not exists course_learning_plans_status_date_idx
+    on public.course_learning_plans (status, date_posted desc, id desc);
+
+create or replace function public.dean_dashboard_summary(
+    viewer_id uuid default null,
+    pending_limit integer default 10
+)
+returns jsonb
+language sql stable
+as $$
+    select jsonb_build_object(
+        'status_counts', coalesce((
+            select jsonb_object_agg(s.status, s.n)
+            from (
+                select status, count(*) as n
+                from public.course_learning_plans
+                group by status
+            ) s
+        ), '{}'::jsonb),
+        'department_counts', coalesce((
+            select jsonb_agg(d order by d.department)
+            from (
+                select coalesce(department, '') as department,
+                       count(*) filter (where status = 'pending') as pending,
+                       count(*) filter (where status = 'approved') as approved,
+                       count(*) filter (where status = 'returned_for_revision') as returned,
+                       count(*) as total
+                from public.course_learning_plans
+                group by 1
+            ) d
+        ), '[]'::jsonb),
+        'pending', coalesce((
+            select jsonb_agg(p order by p.date_posted desc, p.id desc)
+            from (
+                select c.id, c.subject, c.department, c.upload_type, c.date_posted,
+                       c.user_id, u.username as author_username
+                from public.course_learning_plans c
+                left join public.users u on u.id = c.user_id
+                where c.status = 'pending'
+                order by c.date_posted desc, c.id desc
+                limit pending_limit
+            ) p
+        ), '[]'::jsonb),
+        'unread_notifications', (
+            select count(*)
+            from public.notifications n
+            where n.user_id = viewer_id and n.is_read = false
+        )
+    );
+$$;
@@ -0,0 +1,202 @@
+-- Per-department curriculum aggregates, maintained incrementally by a trigger on
+-- course_learning_plans so dashboards read one row per department instead of scanning
+-- every plan: counts by status, outcome coverage sums over approved plans and dean
+-- review turnaround. `flask rebuild-aggregates` reconciles the table from scratch.
+
+-- Review turnaround endpoints, stamped by the trigger below
+alter table public.course_learning_plans
+    add column if not exists submitted_at timestamptz,
+    add column if not exists reviewed_at timestamptz;
+
+-- Outcome coverage of an approved plan, written by the app on approval (app/analytics.py
+-- outcome_summary): {"po_enabled": {"IT01": 1, ...}, "po_introduced": {...}, "io": {"T": 1, ...}}
+alter table public.course_learning_plans
+    add column if not exists outcome_summary jsonb;
+
+create table if not exists public.curriculum_aggregates (
+    department text primary key,             -- '' for plans without a department
+    status_counts jsonb not null default '{}'::jsonb,
+    approved_analysed integer not null default 0,   -- approved plans with an outcome_summary
+    po_enabled jsonb not null default '{}'::jsonb,
+    po_introduced jsonb not null default '{}'::jsonb,
+    io_ticked jsonb not null default '{}'::jsonb,
+    reviews integer not null default 0,
+    review_seconds double precision not null default 0,
+    updated_at timestamptz not null default now()
+);
+
+-- {"a": 1} + factor * {"a": 2, "b": 1}; keys that reach zero are dropped
+create or replace function public.jsonb_add_counts(a jsonb, b jsonb, factor integer default 1)
+returns jsonb
+language sql immutable
+as $$
+    select coalesce(jsonb_object_agg(key, n) filter (where n <> 0), '{}'::jsonb)
+    from (
+        select key, sum(n) as n
+        from (
+            select key, value::numeric as n from jsonb_each_text(coalesce(a, '{}'::jsonb))
+            union all
+            select key, value::numeric * factor from jsonb_each_text(coalesce(b, '{}'::jsonb))
+        ) t
+        group by key
+    ) s;
+$$;
+
+-- Adds (factor 1) or removes (factor -1) one plan's contribution
+create or replace function public.curriculum_aggregates_apply(
+    plan public.course_learning_plans,
+    factor integer
+)
+returns void
+language sql
+as $$
+    insert into public.curriculum_aggregates (department)
+    values (coalesce(plan.department, ''))
+    on conflict (department) do nothing;
+
+    update public.curriculum_aggregates as agg set
+        status_counts = public.jsonb_add_counts(agg.status_counts, jsonb_build_object(plan.status, 1), factor),
+        approved_analysed = agg.approved_analysed
+            + case when plan.status = 'approved' and plan.outcome_summary is not null then factor else 0 end,
+        po_enabled = case when plan.status = 'approved'
+            then public.jsonb_add_counts(agg.po_enabled, plan.outcome_summary -> 'po_enabled', factor) else agg.po_enabled end,
+        po_introduced = case when plan.status = 'approved'
+            then public.jsonb_add_counts(agg.po_introduced, plan.outcome_summary -> 'po_introduced', factor) else agg.po_introduced end,
+        io_ticked = case when plan.status = 'approved'
+            then public.jsonb_add_counts(agg.io_ticked, plan.outcome_summary -> 'io', factor) else agg.io_ticked end,
+        updated_at = now()
+    where agg.department = coalesce(plan.department, '');
+$$;
+
+create or replace function public.curriculum_aggregates_stamp()
+returns trigger
+language plpgsql
+as $$
+begin
+    if new.status = 'pending' and old.status is distinct from 'pending' then
+        new.submitted_at := now();
+    elsif old.status = 'pending' and new.status in ('approved', 'returned_for_revision') then
+        new.reviewed_at := now();
+    end if;
+    return new;
+end;
+$$;
+
+create or replace function public.curriculum_aggregates_track()
+returns trigger
+language plpgsql
+security definer
+set search_path = public
+as $$
+begin
+    if tg_op in ('UPDATE', 'DELETE') then
+        perform public.curriculum_aggregates_apply(old, -1);
+    end if;
+    if tg_op in ('INSERT', 'UPDATE') then
+        perform public.curriculum_aggregates_apply(new, 1);
+    end if;
+    if tg_op = 'UPDATE' and old.status = 'pending' and new.status in ('approved', 'returned_for_revision') then
+        update public.curriculum_aggregates set
+            reviews = reviews + 1,
+            review_seconds = review_seconds
+                + extract(epoch from new.reviewed_at - coalesce(old.submitted_at, old.date_posted))
+        where department = coalesce(new.department, '');
+    end if;
+    return null;
+end;
+$$;
+
+drop trigger if exists course_learning_plans_stamp_review on public.course_learning_plans;
+create trigger course_learning_plans_stamp_review
+    before update of status on public.course_learning_plans
+    for each row execute function public.curriculum_aggregates_stamp();
+
+-- Only the columns the aggregates depend on; content and search_text writes don't fire it
+drop trigger if exists course_learning_plans_track_aggregates on public.course_learning_plans;
+create trigger course_learning_plans_track_aggregates
+    after insert or delete or update of status, department, outcome_summary on public.course_learning_plans
+    for each row execute function public.curriculum_aggregates_track();
+
+-- Full recomputation, through the same per-plan function the trigger uses. Turnaround can
+-- only be rebuilt from each plan's latest review; incremental tracking resumes from there.
+create or replace function public.rebuild_curriculum_aggregates()
+returns integer
+language plpgsql
+security definer
+set search_path = public
+as $$
+declare
+    departments integer;
+begin
+    lock table public.curriculum_aggregates in exclusive mode;
+    delete from public.curriculum_aggregates;
+
+    perform public.curriculum_aggregates_apply(p, 1) from public.course_learning_plans p;
+
+    update public.curriculum_aggregates agg set reviews = r.reviews, review_seconds = r.review_seconds
+    from (
+        select coalesce(department, '') as department, count(*) as reviews,
+               sum(extract(epoch from reviewed_at - coalesce(submitted_at, date_posted))) as review_seconds
+        from public.course_learning_plans
+        where reviewed_at is not null and status in ('approved', 'returned_for_revision')
+        group by 1
+    ) r
+    where agg.department = r.department;
+
+    select count(*) into departments from public.curriculum_aggregates;
+    return departments;
+end;
+$$;
+
+-- The dean landing page now takes its counts from the aggregates (004 scanned the plans)
+create or replace function public.dean_dashboard_summary(
+    viewer_id uuid default null,
+    pending_limit integer default 10
+)
+returns jsonb
+language sql stable
+as $$
+    select jsonb_build_object(
+        'status_counts', coalesce((
+            select jsonb_object_agg(s.key, s.n)
+            from (
+                select e.key, sum(e.value::numeric) as n
+                from public.curriculum_aggregates a, jsonb_each_text(a.status_counts) e
+                group by e.key
+            ) s
+        ), '{}'::jsonb),
+        'department_counts', coalesce((
+            select jsonb_agg(d order by d.department)
+            from (
+                select department,
+                       coalesce((status_counts ->> 'pending')::integer, 0) as pending,
+                       coalesce((status_counts ->> 'approved')::integer, 0) as approved,
+                       coalesce((status_counts ->> 'returned_for_revision')::integer, 0) as returned,
+                       (select coalesce(sum(value::numeric), 0) from jsonb_each_text(status_counts))::integer as total,
+                       reviews,
+                       case when reviews > 0 then round((review_seconds / reviews / 3600)::numeric, 1) end as avg_review_hours
+                from public.curriculum_aggregates
+            ) d
+            where d.total > 0
+        ), '[]'::jsonb),
+        'pending', coalesce((
+            select jsonb_agg(p order by p.date_posted desc, p.id desc)
+            from (
+                select c.id, c.subject, c.department, c.upload_type, c.date_posted,
+                       c.user_id, u.username as author_username
+                from public.course_learning_plans c
+                left join public.users u on u.id = c.user_id
+                where c.status = 'pending'
+                order by c.date_posted desc, c.id desc
+                limit pending_limit
+            ) p
+        ), '[]'::jsonb),
+        'unread_notifications', (
+            select count(*)
+            from public.notifications n
+            where n.user_id = viewer_id and n.is_read = false
+        )
+    );
+$$;
+
+select public.rebuild_curriculum_aggregates();
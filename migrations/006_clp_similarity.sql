@@ -0,0 +1,97 @@
+-- Near-duplicate detection for CLPs. app/similarity.py computes a MinHash signature of
+-- each plan's weekly outline (or document text) at save time and splits it into LSH
+-- bands; plans that share any band bucket are candidates, and only those are scored.
+
+create table if not exists public.clp_signatures (
+    plan_id bigint primary key references public.course_learning_plans (id) on delete cascade,
+    signature integer[] not null,
+    updated_at timestamptz not null default now()
+);
+
+create table if not exists public.clp_lsh_buckets (
+    band smallint not null,
+    bucket bigint not null,
+    plan_id bigint not null references public.course_learning_plans (id) on delete cascade,
+    primary key (band, bucket, plan_id)
+);
+
+-- Replacing a plan's buckets and the cascade on delete go through plan_id
+create index if not exists clp_lsh_buckets_plan_idx on public.clp_lsh_buckets (plan_id);
+
+-- Replaces a plan's signature and buckets in one call; a null signature removes them
+-- (the plan no longer has enough text to compare).
+create or replace function public.store_clp_signature(
+    target_id bigint,
+    new_signature integer[] default null,
+    new_buckets bigint[] default null
+)
+returns void
+language sql
+as $$
+    delete from public.clp_lsh_buckets where plan_id = target_id;
+    delete from public.clp_signatures where plan_id = target_id and new_signature is null;
+
+    insert into public.clp_signatures (plan_id, signature, updated_at)
+    select target_id, new_signature, now()
+    where new_signature is not null
+    on conflict (plan_id) do update set signature = excluded.signature, updated_at = excluded.updated_at;
+
+    insert into public.clp_lsh_buckets (band, bucket, plan_id)
+    select b.band - 1, b.bucket, target_id
+    from unnest(new_buckets) with ordinality as b(bucket, band)
+    where new_signature is not null
+    on conflict do nothing;
+$$;
+
+-- Other authors' plans whose estimated Jaccard similarity (share of equal signature
+-- slots) with target_id reaches min_similarity, most similar first.
+create or replace function public.similar_clps(
+    target_id bigint,
+    min_similarity real default 0.5,
+    max_results integer default 5
+)
+returns table (
+    id bigint,
+    subject text,
+    department text,
+    status text,
+    date_posted timestamptz,
+    user_id uuid,
+    author_username text,
+    similarity real
+)
+language sql stable
+as $$
+    with target as (
+        select s.signature, p.user_id
+        from public.clp_signatures s
+        join public.course_learning_plans p on p.id = s.plan_id
+        where s.plan_id = target_id
+    ),
+    candidates as (
+        select distinct other.plan_id
+        from public.clp_lsh_buckets own
+        join public.clp_lsh_buckets other
+          on other.band = own.band and other.bucket = own.bucket and other.plan_id <> own.plan_id
+        where own.plan_id = target_id
+    ),
+    scored as (
+        select s.plan_id,
+               (select count(*) from unnest(s.signature, t.signature) as slots(a, b) where slots.a = slots.b)::real
+                 / cardinality(t.signature) as similarity
+        from candidates c
+        join public.clp_signatures s on s.plan_id = c.plan_id,
+        target t
+        where cardinality(s.signature) = cardinality(t.signature)
+    )
+    select p.id, p.subject, p.department, p.status, p.date_posted, p.user_id,
+           u.username as author_username, sc.similarity
+    from scored sc
+    join public.course_learning_plans p on p.id = sc.plan_id
+    left join public.users u on u.id = p.user_id,
+    target t
+    where sc.similarity >= min_similarity
+      and p.user_id is distinct from t.user_id
+    order by sc.similarity desc, p.id desc
+    limit max_results;
+$$;
@@ -0,0 +1,18 @@
+-- Progress of template re-render jobs (app/rerender.py). The job runs in one worker's
+-- background thread; keeping its state here lets any worker answer the progress poll.
+
+create table if not exists public.template_rerender_jobs (
+    id bigserial primary key,
+    template_key text not null,
+    dry_run boolean not null default false,
+    status text not null default 'running',    -- running | finished | failed
+    total integer not null default 0,          -- candidate plans (editable, with a file, on this template)
+    done integer not null default 0,           -- re-rendered (dry run: would be re-rendered)
+    skipped integer not null default 0,        -- candidates without content JSON to render from
+    failed integer not null default 0,
+    plans jsonb not null default '[]'::jsonb,  -- dry run: [{id, subject, department}]
+    errors jsonb not null default '[]'::jsonb, -- [{id, error}]
+    created_by uuid references public.users (id) on delete set null,
+    created_at timestamptz not null default now(),
+    finished_at timestamptz
+);
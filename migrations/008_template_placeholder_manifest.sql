@@ -0,0 +1,7 @@
+-- Placeholder manifest of each DOCX template (app/placeholders.py), written when the
+-- template is uploaded or saved from the editor: {"version", "keys", "unfillable"}.
+-- AI generation only requests `keys`; null (not scanned yet) means every field.
+-- Backfill existing rows with `flask scan-templates`.
+
+alter table public.templates
+    add column if not exists placeholder_manifest jsonb;
@@ -0,0 +1,6 @@
+-- Plans a template re-render job (app/rerender.py) filled only partly: their content JSON
+-- was generated for a template with fewer placeholders (migrations/008), so the fields
+-- the new template uses are missing and render blank. [{id, subject, missing, keys}]
+
+alter table public.template_rerender_jobs
+    add column if not exists incomplete jsonb not null default '[]'::jsonb;
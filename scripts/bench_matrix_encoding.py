@@ -0,0 +1,99 @@
+"""
+Compares the two AI_MATRIX_ENCODING response formats of the PO-IO and CO-PO
+generation steps: output tokens, total tokens and latency per Gemini call (median of
+--runs), plus how many cells of the compact answers failed validation.
+
+    python scripts/bench_matrix_encoding.py --runs 5
+    python scripts/bench_matrix_encoding.py --offline    # response sizes only, no API calls
+
+Uses the prompts stored in system_settings, so it needs the usual .env. --offline
+encodes a random matrix both ways and compares response lengths in characters.
+"""
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODEL = 'gemini-2.5-flash'
+
+
+def matrix_steps():
+    from app import COURSE_OUTCOMES, INSTITUTIONAL_OUTCOMES_HEADERS, PROGRAM_OUTCOMES_HEADERS
+    from app.matrix_encoding import CO_PO_SYMBOLS, PO_IO_SYMBOLS
+    return {
+        'po_io': (PROGRAM_OUTCOMES_HEADERS, INSTITUTIONAL_OUTCOMES_HEADERS, PO_IO_SYMBOLS),
+        'co_po': ([co['code'] for co in COURSE_OUTCOMES], PROGRAM_OUTCOMES_HEADERS, CO_PO_SYMBOLS),
+    }
+
+
+def step_prompts():
+    from app import COURSE_OUTCOMES, PROGRAM_OUTCOMES
+    from app.utils import get_system_prompt
+    course_outcomes = ", ".join(f"{co['code']}: {co['description']}" for co in COURSE_OUTCOMES)
+    program_outcomes = ", ".join(f"{po['code']}: {po['description']}" for po in PROGRAM_OUTCOMES)
+    return {
+        'po_io': get_system_prompt('prompt_po_io', default_text="You are an expert academic planner..."),
+        'co_po': get_system_prompt('prompt_co_po', default_text="Given the Course Outcomes...")
+        .replace('{course_outcomes}', course_outcomes).replace('{program_outcomes}', program_outcomes),
+    }
+
+
+def offline():
+    from app.matrix_encoding import cell_key, expand_rows
+    for step, (rows, columns, symbols) in matrix_steps().items():
+        codes = list(symbols)
+        compact = {row: "".join(random.choice(codes) for _ in columns) for row in rows}
+        verbose = {cell_key(row, column): symbols[compact[row][i]] for row in rows for i, column in enumerate(columns)}
+        cells, invalid = expand_rows(compact, rows, columns, symbols)
+        assert cells == verbose and not invalid
+        verbose_len = len(json.dumps(verbose, ensure_ascii=False))
+        compact_len = len(json.dumps(compact, ensure_ascii=False))
+        print(f"{step:>6}: verbose {verbose_len:5d} chars   compact {compact_len:5d} chars   "
+              f"({compact_len / verbose_len:.0%})")
+
+
+def online(runs):
+    from app.matrix_encoding import ENCODINGS, matrix_step
+    from app.utils import get_generative_model
+    model = get_generative_model(MODEL)
+    prompts = step_prompts()
+    for step, (rows, columns, symbols) in matrix_steps().items():
+        for encoding in ENCODINGS:
+            suffix, config, decode = matrix_step(encoding, rows, columns, symbols)
+            latencies, output_tokens, total_tokens, invalid = [], [], [], 0
+            for _ in range(runs):
+                t0 = time.perf_counter()
+                resp = model.generate_content(contents=[prompts[step] + suffix], generation_config=config)
+                latencies.append(time.perf_counter() - t0)
+                output_tokens.append(resp.usage_metadata.candidates_token_count)
+                total_tokens.append(resp.usage_metadata.total_token_count)
+                invalid += decode(json.loads(resp.text))[1]
+            print(f"{step:>6} {encoding:>8}: median {statistics.median(latencies) * 1000:7.0f} ms   "
+                  f"output {statistics.median(output_tokens):6.0f} tok   total {statistics.median(total_tokens):6.0f} tok   "
+                  f"invalid cells {invalid}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--offline', action='store_true')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ROOT, '.env'))
+    import app
+
+    with app.create_app().app_context():
+        if args.offline:
+            offline()
+        else:
+            online(args.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Measures cold start: importing the app package, create_app(), and the first
+request to a page, each in a fresh interpreter (median of --runs).
+
+    python scripts/bench_startup.py --runs 7
+    python scripts/bench_startup.py --warmup      # run warm_up() before the first request
+
+Needs the usual .env (or dummy values; no request leaves the process before the
+first page render, which is served from an empty session).
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PROBE = r"""
+import json, sys, time
+t0 = time.perf_counter()
+import app
+t1 = time.perf_counter()
+flask_app = app.create_app()
+t2 = time.perf_counter()
+if WARMUP:
+    from app.warmup import warm_up
+    warm_up(flask_app, connections=False, docx_templates=False)
+t3 = time.perf_counter()
+flask_app.test_client().get('/login')
+t4 = time.perf_counter()
+heavy = [m for m in ('google.generativeai', 'docx', 'jwt', 'requests', 'pypdf') if m in sys.modules]
+print(json.dumps({'import': t1 - t0, 'create_app': t2 - t1, 'warmup': t3 - t2,
+                  'first_request': t4 - t3, 'heavy_modules_loaded': heavy}))
+"""
+
+
+def run_once(warmup):
+    code = f"WARMUP = {warmup!r}\n" + PROBE
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--warmup', action='store_true')
+    args = parser.parse_args()
+
+    sys.path.insert(0, ROOT)
+    from dotenv import load_dotenv
+    load_dotenv(os.path.join(ROOT, '.env'))
+
+    results = [run_once(args.warmup) for _ in range(args.runs)]
+    for step in ('import', 'create_app', 'warmup', 'first_request'):
+        values = [r[step] * 1000 for r in results]
+        print(f"{step:>14}: median {statistics.median(values):7.1f} ms   min {min(values):7.1f} ms")
+    print(f"heavy modules loaded at start-up: {', '.join(results[-1]['heavy_modules_loaded']) or 'none'}")
+
+
+if __name__ == '__main__':
+    main()